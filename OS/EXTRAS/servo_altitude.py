@@ -2,6 +2,10 @@
 import tkinter as tk
 import RPi.GPIO as GPIO
 import time
+import json, os, sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autofocus
 
 # Configuración de servo
 SERVO_GPIO = 5
@@ -10,15 +14,23 @@ GPIO.setup(SERVO_GPIO, GPIO.OUT)
 servo = GPIO.PWM(SERVO_GPIO, 50)
 servo.start(0)
 
-def mover_servo(angle):
+# Cámara del servo en la tabla de calibración (por defecto la última calibrada)
+SERVO_CAMERA = None
+if os.path.exists("config.json"):
+    try:
+        SERVO_CAMERA = json.load(open("config.json")).get("Autofocus", {}).get("ServoCamera")
+    except Exception as e:
+        print("config.json invalido; usando valores por defecto:", e)
+
+def mover_servo(angle, origen=""):
     angle = max(0, min(180, angle))
     duty = 2.5 + (angle / 18)
     servo.ChangeDutyCycle(duty)
     time.sleep(0.3)
     servo.ChangeDutyCycle(0)
-    label_status.config(text=f"Servo ajustado a {angle}°")
+    label_status.config(text=f"Servo ajustado a {angle}° {origen}")
 
-# Alturas y ángulos arbitrarios
+# Ángulos arbitrarios, usados solo si no hay tabla de calibración
 alturas = {
     "50 m": 30,
     "80 m": 20,
@@ -27,8 +39,12 @@ alturas = {
 }
 
 def seleccionar_altura(altura):
-    angulo = alturas[altura]
-    mover_servo(angulo)
+    # Interpolar desde la tabla de autofocus (Focus_test_auto.py)
+    angulo = autofocus.angulo_calibrado(float(altura.split()[0]), SERVO_CAMERA)
+    if angulo is not None:
+        mover_servo(angulo, "(calibrado)")
+    else:
+        mover_servo(alturas[altura], "(sin calibrar)")
 
 def salir():
     try:
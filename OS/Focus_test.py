@@ -4,11 +4,15 @@ the focus quality of connected Basler cameras using Pypylon.
 
 Features:
 - Loads exposure and gain settings from config.json.
-- Live preview from selected camera.
+- Live preview from selected camera, or from both cameras side by side
+  (each grabbed on its own thread).
 - Real-time focus metric visualization with colored borders:
     - Green if focus is sharp
     - Red if blurry
 - Pressing anywhere on the screen or 'q' exits preview mode.
+- The camera reads only the central focus window at native resolution
+  ("focus" mode) or a binned full frame ("overview" mode, key 'm' toggles),
+  so the preview does not move full frames over USB.
 """
 
 # --- Imports ---
@@ -18,6 +22,7 @@ from functools import partial
 import cv2, json, os
 from pypylon import pylon
 import numpy as np
+import live_view
 
 # --- Load camera parameters from config.json ---
 EXPOSURE, GAIN = 5000, 0.0
@@ -28,6 +33,12 @@ if os.path.exists("config.json"):
         GAIN     = float(cfg.get("Gain", GAIN))
     except Exception as e:
         print("config.json invalido; usando valores por defecto:", e)
+LIVE_MODE = "focus"  # "focus" (sensor ROI) or "overview" (binned full frame)
+if os.path.exists("config.json"):
+    try:
+        LIVE_MODE = json.load(open("config.json")).get("LiveView", {}).get("Mode", LIVE_MODE)
+    except Exception as e:
+        print("config.json invalido; usando valores por defecto:", e)
 
 # --- GUI style constants ---
 BG_MAIN, FG_MAIN         = "black", "white"
@@ -50,7 +61,8 @@ def preview(idx, root):
     # --- Camera setup ---
     cam = pylon.InstantCamera(tl.CreateDevice(devs[idx]))
     cam.Open()
-    cam.Width.Value, cam.Height.Value = 1440, 960
+    modo = LIVE_MODE
+    info = live_view.configurar_preview(cam, modo)
     cam.PixelFormat.Value  = "Mono8"
     cam.ExposureTime.Value = EXPOSURE
     cam.Gain.Value         = GAIN
@@ -75,11 +87,15 @@ def preview(idx, root):
         while not quit_flag:
             res = cam.RetrieveResult(500, pylon.TimeoutHandling_Return)
             if res and res.GrabSucceeded():
-                gray = res.Array
+                gray = live_view.decimar(res.Array, info)
                 h, w = gray.shape
 
                 # --- Compute focus metric using Sobel ---
-                roi = gray[h//3 : 2*h//3, w//3 : 2*w//3]
+                # In focus mode the whole frame is already the focus window
+                if info["mode"] == "focus":
+                    roi = gray
+                else:
+                    roi = gray[h//3 : 2*h//3, w//3 : 2*w//3]
                 gx  = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=3)
                 gy  = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=3)
                 focus = (gx**2 + gy**2).mean()
@@ -87,37 +103,94 @@ def preview(idx, root):
                 enfocado = focus > 1000  # Threshold for sharpness
                 col_bgr = (0, 255, 0) if enfocado else (0, 0, 255)
 
-                # --- Overlay border and text ---
-                frame_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-                cv2.rectangle(frame_bgr, (5, 5), (w-6, h-6), col_bgr, thickness=40)
+                # --- Fit to the 480x320 screen, then overlay border and text ---
+                frame_bgr = cv2.cvtColor(live_view.ajustar_pantalla(gray), cv2.COLOR_GRAY2BGR)
+                sh, sw = frame_bgr.shape[:2]
+                cv2.rectangle(frame_bgr, (2, 2), (sw-3, sh-3), col_bgr, thickness=10)
                 cv2.putText(frame_bgr, f"Foco: {focus:.0f}",
-                            (40, 70), cv2.FONT_HERSHEY_SIMPLEX,
-                            1.2, col_bgr, 3, cv2.LINE_AA)
-
-                # --- Centering for 480x320 screen ---
-                screen_h, screen_w = 320, 480
-                fh, fw = frame_bgr.shape[:2]
-                top = max(0, (screen_h - fh) // 2)
-                bottom = max(0, screen_h - fh - top)
-                left = max(0, (screen_w - fw) // 2)
-                right = max(0, screen_w - fw - left)
-                frame_centered = cv2.copyMakeBorder(frame_bgr, top, bottom, left, right,
-                                                    borderType=cv2.BORDER_CONSTANT, value=(0,0,0))
+                            (20, 40), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.8, col_bgr, 2, cv2.LINE_AA)
 
                 # --- Show frame ---
-                cv2.imshow(win, frame_centered)
+                cv2.imshow(win, frame_bgr)
                 res.Release()
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
                 break
+            if key == ord('m'):
+                # Geometry can only change while not grabbing
+                cam.StopGrabbing()
+                modo = "overview" if info["mode"] == "focus" else "focus"
+                info = live_view.configurar_preview(cam, modo)
+                cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
 
     finally:
-        # --- Cleanup ---
+        # --- Cleanup: leave the full sensor for the capture script ---
         if cam.IsGrabbing(): cam.StopGrabbing()
+        live_view.restaurar_sensor(cam)
         cam.Close()
         cv2.destroyWindow(win)
         root.deiconify()
 
+# --- Dual-camera preview ---
+def preview_dual(root):
+    """Live view of both cameras at once, side by side with their focus scores."""
+    tl   = pylon.TlFactory.GetInstance()
+    devs = tl.EnumerateDevices()
+    if len(devs) < 2:
+        messagebox.showerror("Error", "Connect 2 cameras.")
+        return
+
+    root.withdraw()
+
+    camaras, abiertas = [], []
+    win = "CAM 1 + CAM 2 - Enfoque (toque para salir)"
+    quit_flag = False
+
+    def on_mouse(event, x, y, flags, param):
+        nonlocal quit_flag
+        if event == cv2.EVENT_LBUTTONDOWN:
+            quit_flag = True
+
+    try:
+        # --- Camera setup: one grabbing thread per camera ---
+        for d in devs[:2]:
+            cam = pylon.InstantCamera(tl.CreateDevice(d))
+            cam.Open()
+            abiertas.append(cam)
+            info = live_view.configurar_preview(cam, LIVE_MODE)
+            cam.PixelFormat.Value  = "Mono8"
+            cam.ExposureTime.Value = EXPOSURE
+            cam.Gain.Value         = GAIN
+            cam.TriggerMode.Value  = "Off"
+            camaras.append(live_view.CamaraEnVivo(cam, info))
+
+        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+        cv2.setWindowProperty(win, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        cv2.setMouseCallback(win, on_mouse)
+
+        for c in camaras:
+            c.start()
+        while not quit_flag:
+            cv2.imshow(win, live_view.componer(camaras))
+            if cv2.waitKey(30) & 0xFF == ord('q'):
+                break
+
+    finally:
+        # --- Cleanup: every camera that was opened, even if setup failed ---
+        for c in camaras:
+            c.stop()
+        for cam in abiertas:
+            if cam.IsGrabbing(): cam.StopGrabbing()
+            live_view.restaurar_sensor(cam)
+            cam.Close()
+        try:
+            cv2.destroyWindow(win)
+        except cv2.error:
+            pass            # setup failed before the window was created
+        root.deiconify()
+
 # --- GUI main window ---
 def main():
     root = tk.Tk()
@@ -143,6 +216,11 @@ def main():
                   activebackground=BTN_ACTIVE_BG,
                   command=partial(preview, i, root)).grid(row=0, column=i,
                                                           padx=30, pady=5)
+    tk.Button(cont, text="CAM 1 + 2", width=2*BTN_W, height=2,
+              font=FONT_BUTTON, bg=BTN_BG, fg=BTN_FG,
+              activebackground=BTN_ACTIVE_BG,
+              command=partial(preview_dual, root)).grid(row=1, column=0, columnspan=2,
+                                                        padx=30, pady=15)
 
     root.mainloop()
 
@@ -5,7 +5,14 @@ of camera lenses using a servo motor.
 Features:
 - Detects connected Basler cameras using Pypylon.
 - Displays a live preview from the selected camera.
-- Performs coarse and fine autofocus sweep using a focus metric.
+- Performs autofocus with a golden-section search of the servo angle,
+  starting from the last good angle stored in `autofocus.json`, and reports
+  the number of servo moves and the time taken.
+- Reads only the central focus window of the sensor (sensor ROI).
+- Optional focus distance selector: results are added to the per-camera
+  calibration table used by `EXTRAS/servo_altitude.py`.
+- After each servo move, waits for frames exposed after the move and for the
+  focus score to settle, then averages several frames per position.
 - Allows manual focus adjustment via servo buttons.
 - Reads and applies exposure and gain from `config.json`.
 
@@ -20,6 +27,8 @@ from pypylon import pylon
 import numpy as np
 import RPi.GPIO as GPIO
 import time
+import autofocus
+import live_view
 
 # --- Load camera parameters from config file ---
 EXPOSURE, GAIN = 5000, 0.0  # Defaults
@@ -39,8 +48,25 @@ servo = GPIO.PWM(SERVO_GPIO, 50)  # 50 Hz PWM for servo
 servo.start(0)
 current_angle = 90  # Initial position (arbitrary)
 servo_step = 5      # Degrees to move per step
-AUTOFOCUS_MARGIN = 0.93
-AUTOFOCUS_STEP = 4
+AUTOFOCUS_SPAN = 30  # Half-width of the first search bracket (deg)
+AUTOFOCUS_TOL = 2    # Stop when the bracket is narrower than this (deg)
+AUTOFOCUS_FRAMES = 3     # Settled frames averaged per servo position
+AUTOFOCUS_SETTLE = 0.05  # Max relative change between scores to call it settled
+AUTOFOCUS_TIMEOUT = 2.0  # Max wait per servo position (s)
+LENSES = {}                # Lens name per camera serial (calibration table key)
+FOCUS_DISTANCES = ("50 m", "80 m", "120 m", "150 m", "Inf")
+distancia_enfoque = None   # Focus target distance (m) chosen in the GUI, None = not set
+if os.path.exists("config.json"):
+    try:
+        af = json.load(open("config.json")).get("Autofocus", {})
+        AUTOFOCUS_SPAN = int(af.get("Span", AUTOFOCUS_SPAN))
+        AUTOFOCUS_TOL  = float(af.get("Tolerance", AUTOFOCUS_TOL))
+        AUTOFOCUS_FRAMES  = int(af.get("Frames", AUTOFOCUS_FRAMES))
+        AUTOFOCUS_SETTLE  = float(af.get("Settle", AUTOFOCUS_SETTLE))
+        AUTOFOCUS_TIMEOUT = float(af.get("Timeout", AUTOFOCUS_TIMEOUT))
+        LENSES = af.get("Lenses", LENSES)
+    except Exception as e:
+        print("config.json invalido; usando valores por defecto:", e)
 mejor_focus = 0
 focus_map = []  # Stores (angle, focus_metric)
 
@@ -85,7 +111,7 @@ def preview(idx, root):
 
     cam = pylon.InstantCamera(tl.CreateDevice(devs[idx]))
     cam.Open()
-    cam.Width.Value, cam.Height.Value = 1440, 960
+    live_view.configurar_preview(cam, "focus")  # Read only the focus window
     cam.PixelFormat.Value  = "Mono8"
     cam.ExposureTime.Value = EXPOSURE
     cam.Gain.Value         = GAIN
@@ -105,73 +131,78 @@ def preview(idx, root):
 
     cv2.setMouseCallback(win, on_mouse)
 
+    serial = devs[idx].GetSerialNumber()
+
+    def grab_posterior(marca):
+        """Next frame exposed after the servo move in `marca` (or None)."""
+        res = cam.RetrieveResult(500, pylon.TimeoutHandling_Return)
+        if not (res and res.GrabSucceeded()):
+            return None
+        try:
+            if autofocus.frame_posterior(res, marca):
+                return res.GetArray()  # copy; the buffer goes back to pylon
+            return None
+        finally:
+            res.Release()
+
+    def evaluar(angulo):
+        """Move the servo, wait for it to settle and return the focus metric."""
+        global current_angle
+        current_angle = angulo
+        move_servo_to(current_angle)
+        marca = autofocus.marca_movimiento(cam)
+        focus, gray, n, espera = autofocus.medir_foco(
+            partial(grab_posterior, marca), n_frames=AUTOFOCUS_FRAMES,
+            settle_rel=AUTOFOCUS_SETTLE, timeout=AUTOFOCUS_TIMEOUT, centro=False)
+        if gray is None:
+            return 0.0
+        focus_map.append((angulo, focus))
+
+        # Display current focus measure
+        frame_bgr = cv2.cvtColor(live_view.ajustar_pantalla(gray), cv2.COLOR_GRAY2BGR)
+        cv2.putText(frame_bgr, f"AF: {angulo} deg  Foco: {focus:.0f}",
+                    (15, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7, (255, 255, 0), 2, cv2.LINE_AA)
+        cv2.putText(frame_bgr, f"{n} frames  {espera:.2f} s",
+                    (15, 60), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7, (255, 255, 0), 2, cv2.LINE_AA)
+
+        cv2.imshow(win, frame_bgr)
+        cv2.waitKey(1)
+        return focus
+
     try:
         global mejor_focus, current_angle
         mejor_focus = 0
-        focus_map = []
-
-        # --- Coarse scan: test from 0° to 180° every 15° ---
-        for angulo in range(0, 181, 15):
-            current_angle = angulo
+        focus_map.clear()
+
+        # --- Golden-section search from the calibrated or last good angle ---
+        t0 = time.time()
+        lente = LENSES.get(serial, "default")
+        temperatura = autofocus.leer_temperatura(cam)
+        inicio = None
+        if distancia_enfoque is not None:
+            inicio = autofocus.angulo_calibrado(distancia_enfoque, serial, lente, temperatura)
+        if inicio is None:
+            inicio = autofocus.ultimo_angulo(serial, default=current_angle)
+        resultado = autofocus.golden_section_search(
+            evaluar, inicio, span=AUTOFOCUS_SPAN, tol=AUTOFOCUS_TOL)
+
+        # Park the servo on the best angle
+        mejor_focus = resultado["focus"]
+        if current_angle != resultado["angle"]:
+            current_angle = resultado["angle"]
             move_servo_to(current_angle)
-            time.sleep(0.5)
-            res = cam.RetrieveResult(500, pylon.TimeoutHandling_Return)
-            if res and res.GrabSucceeded():
-                gray = res.Array
-                h, w = gray.shape
-                roi = gray[h//3 : 2*h//3, w//3 : 2*w//3]
-                gx = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=3)
-                gy = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=3)
-                focus = (gx**2 + gy**2).mean()
-                focus_map.append((angulo, focus))
-
-                # Display current focus measure
-                frame_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-                cv2.putText(frame_bgr, f"Scan: {angulo} deg  Foco: {focus:.0f}",
-                            (30, 60), cv2.FONT_HERSHEY_SIMPLEX,
-                            1.0, (255, 255, 0), 2, cv2.LINE_AA)
-
-                frame_resized = cv2.resize(frame_bgr, (480, 320))
-                cv2.imshow(win, frame_resized)
-                cv2.waitKey(1)
-                res.Release()
-
-        # --- Fine scan around the best coarse angle ---
-        if focus_map:
-            best_angle_coarse, mejor_focus = max(focus_map, key=lambda x: x[1])
-            fine_start = max(0, best_angle_coarse - 15)
-            fine_end = min(180, best_angle_coarse + 15)
-            focus_map_fine = []
-
-            for angulo in range(fine_start, fine_end + 1, 5):
-                current_angle = angulo
-                move_servo_to(current_angle)
-                time.sleep(0.5)
-                res = cam.RetrieveResult(500, pylon.TimeoutHandling_Return)
-                if res and res.GrabSucceeded():
-                    gray = res.Array
-                    h, w = gray.shape
-                    roi = gray[h//3 : 2*h//3, w//3 : 2*w//3]
-                    gx = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=3)
-                    gy = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=3)
-                    focus = (gx**2 + gy**2).mean()
-                    focus_map_fine.append((angulo, focus))
-
-                    frame_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-                    cv2.putText(frame_bgr, f"Fine: {angulo} deg  Foco: {focus:.0f}",
-                                (30, 60), cv2.FONT_HERSHEY_SIMPLEX,
-                                1.0, (0, 255, 255), 2, cv2.LINE_AA)
-
-                    frame_resized = cv2.resize(frame_bgr, (480, 320))
-                    cv2.imshow(win, frame_resized)
-                    cv2.waitKey(1)
-                    res.Release()
-
-            # Set best fine angle
-            if focus_map_fine:
-                best_angle, mejor_focus = max(focus_map_fine, key=lambda x: x[1])
-                current_angle = best_angle
-                move_servo_to(current_angle)
+            resultado["moves"] += 1
+        resultado["elapsed_s"] = time.time() - t0
+        if mejor_focus > 0:
+            autofocus.guardar_ultimo(serial, resultado)
+            if distancia_enfoque is not None:
+                autofocus.guardar_calibracion(serial, lente, distancia_enfoque,
+                                              resultado, temperatura)
+
+        print(f"Autofocus CAM {idx+1}: {current_angle} deg, foco {mejor_focus:.0f}, "
+              f"{resultado['moves']} movimientos, {resultado['elapsed_s']:.1f} s")
 
         # Cleanup
         cam.Close()
@@ -182,6 +213,7 @@ def preview(idx, root):
 
     finally:
         if cam.IsGrabbing(): cam.StopGrabbing()
+        live_view.restaurar_sensor(cam)   # the capture script expects the full sensor
         cam.Close()
         if cv2.getWindowProperty(win, cv2.WND_PROP_VISIBLE) >= 1:
             cv2.destroyWindow(win)
@@ -212,6 +244,25 @@ def main():
                   activebackground="gray40",
                   command=partial(preview, i, root)).grid(row=0, column=i, padx=30, pady=5)
 
+    # Focus target distance (stored in the calibration table)
+    dist_frame = tk.Frame(root, bg="black"); dist_frame.pack(pady=5)
+    tk.Label(dist_frame, text="Focus distance", font=("Helvetica", 20),
+             fg="white", bg="black").grid(row=0, column=0, columnspan=len(FOCUS_DISTANCES))
+    dist_btns = {}
+
+    def elegir_distancia(texto):
+        global distancia_enfoque
+        distancia_enfoque = 0.0 if texto == "Inf" else float(texto.split()[0])
+        for t, b in dist_btns.items():
+            b.configure(bg="green" if t == texto else "gray25")
+
+    for j, texto in enumerate(FOCUS_DISTANCES):
+        dist_btns[texto] = tk.Button(dist_frame, text=texto, width=5,
+                                     font=("Helvetica", 14, "bold"), bg="gray25", fg="white",
+                                     activebackground="gray40",
+                                     command=partial(elegir_distancia, texto))
+        dist_btns[texto].grid(row=1, column=j, padx=5, pady=5)
+
     # Manual focus control buttons
     foco_frame = tk.Frame(root, bg="black")
     foco_frame.pack(pady=30)
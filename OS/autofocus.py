@@ -0,0 +1,298 @@
+"""
+This module contains the autofocus logic shared by the focus tools.
+
+Features:
+- Focus metric (Sobel gradient energy on the central third of the frame).
+- Golden-section search of the servo angle, starting from the last known
+  good angle, with a final parabolic fit around the peak.
+- Settle detection after a servo move: frames exposed before the move ended
+  are discarded by grab timestamp (or, without one, by skipping the frames
+  that can still be queued), and the focus of a position is the
+  outlier-rejected mean of several frames once the scores stabilise.
+- Stores the last good angle of each camera in `autofocus.json`, plus a
+  calibration table of best angles keyed by lens, focus distance and
+  camera temperature that can be interpolated for a given flight altitude.
+
+"""
+
+# --- Imports ---
+import json, os, time, datetime
+import cv2
+import numpy as np
+
+AUTOFOCUS_FILE = "autofocus.json"
+SERVO_MIN, SERVO_MAX = 0, 180
+TEMP_BUCKET_C = 5   # Calibrations closer than this in temperature replace each other
+INV_PHI = (5 ** 0.5 - 1) / 2   # 1/phi ~ 0.618
+STALE_FRAMES = 2               # LatestImageOnly: the queued frame + the one being exposed
+
+# --- Focus metric ---
+def focus_score(gray, centro=True):
+    """
+    Mean squared Sobel gradient over the central third of the frame, or over
+    the whole frame when it is already the focus window (`centro=False`).
+    """
+    h, w = gray.shape[:2]
+    roi = gray[h//3 : 2*h//3, w//3 : 2*w//3] if centro else gray
+    gx = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=3)
+    gy = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=3)
+    return float((gx**2 + gy**2).mean())
+
+def media_robusta(valores, k=3.0):
+    """Mean of `valores` after dropping points more than k*MAD from the median."""
+    v = np.asarray(valores, dtype=float)
+    med = np.median(v)
+    mad = 1.4826 * np.median(np.abs(v - med))
+    if mad > 0:
+        v = v[np.abs(v - med) <= k * mad]
+    return float(v.mean())
+
+# --- Servo settle detection ---
+def marca_movimiento(cam, descartar=STALE_FRAMES):
+    """
+    Mark the end of a servo move.
+
+    Latches the camera timestamp when the model supports it, so frames can
+    be compared against `GrabResult.TimeStamp`. Otherwise the next
+    `descartar` frames are dropped: with `GrabStrategy_LatestImageOnly` only
+    the queued frame and the one being exposed can predate the move, however
+    late they are retrieved (pass `MaxNumBuffer` for `OneByOne`).
+    """
+    marca = {"host": time.time(), "ticks": None, "descartar": 0}
+    try:
+        cam.TimestampLatch.Execute()
+        marca["ticks"] = cam.TimestampLatchValue.Value
+    except Exception:
+        marca["descartar"] = descartar
+    return marca
+
+def frame_posterior(res, marca):
+    """
+    True if the frame in `res` was exposed after the move in `marca`.
+
+    Without a camera clock each call consumes one of the frames to discard,
+    so it must be called once per retrieved frame.
+    """
+    if marca["ticks"] is not None:
+        return res.TimeStamp >= marca["ticks"]
+    if marca["descartar"] > 0:
+        marca["descartar"] -= 1
+        return False
+    return True
+
+def medir_foco(grab, n_frames=3, settle_rel=0.05, timeout=2.0, centro=True):
+    """
+    Focus metric of the current servo position.
+
+    `grab()` returns the next frame exposed after the move (or None). Frames
+    are scored until two successive scores differ by less than `settle_rel`
+    (relative); from then on `n_frames` settled scores are averaged with
+    outlier rejection. If `timeout` seconds pass first, whatever was scored
+    is used. `centro` is passed to `focus_score`.
+
+    Returns (focus, last_frame, frames_scored, wait_s).
+    """
+    t0 = time.time()
+    scores, estables, gray = [], [], None
+    while len(estables) < n_frames and time.time() - t0 < timeout:
+        frame = grab()
+        if frame is None:
+            continue
+        gray = frame
+        scores.append(focus_score(gray, centro))
+        if estables:
+            estables.append(scores[-1])
+        elif len(scores) >= 2:
+            prev, cur = scores[-2], scores[-1]
+            if abs(cur - prev) <= settle_rel * max(abs(prev), 1e-9):
+                estables.extend((prev, cur))
+
+    usados = estables or scores[-n_frames:]
+    focus = media_robusta(usados) if usados else 0.0
+    return focus, gray, len(scores), time.time() - t0
+
+# --- Persisted state ---
+def cargar_estado(path=AUTOFOCUS_FILE):
+    """Load the autofocus state file ({} if missing or invalid)."""
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            print("autofocus.json invalido; se ignora:", e)
+    return {}
+
+def guardar_estado(estado, path=AUTOFOCUS_FILE):
+    """Write the autofocus state file."""
+    with open(path, "w") as f:
+        json.dump(estado, f, indent=2)
+
+def ultimo_angulo(serial, default=90, path=AUTOFOCUS_FILE):
+    """Last good focus angle stored for a camera serial number."""
+    return cargar_estado(path).get(serial, {}).get("last", {}).get("angle", default)
+
+def guardar_ultimo(serial, resultado, path=AUTOFOCUS_FILE):
+    """Store the result of an autofocus run as the camera's last good angle."""
+    estado = cargar_estado(path)
+    estado.setdefault(serial, {})["last"] = {
+        "angle": resultado["angle"],
+        "focus": resultado["focus"],
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    guardar_estado(estado, path)
+
+# --- Calibration table ---
+def leer_temperatura(cam):
+    """Camera device temperature in deg C, or None if the model has no sensor."""
+    try:
+        return round(float(cam.DeviceTemperature.Value), 1)
+    except Exception:
+        return None
+
+def guardar_calibracion(serial, lente, distancia_m, resultado, temperatura=None,
+                        path=AUTOFOCUS_FILE):
+    """
+    Add an autofocus result to the camera's calibration table.
+
+    `distancia_m` is the focus distance (flight altitude AGL for a nadir
+    camera); None or 0 means infinity. An older entry with the same lens,
+    distance and temperature bucket is replaced.
+    """
+    estado = cargar_estado(path)
+    tabla = estado.setdefault(serial, {}).setdefault("table", [])
+    distancia_m = float(distancia_m) if distancia_m else None
+    bucket = None if temperatura is None else round(temperatura / TEMP_BUCKET_C)
+    tabla[:] = [e for e in tabla
+                if not (e["lens"] == lente and e["distance_m"] == distancia_m and
+                        (None if e["temp_c"] is None else
+                         round(e["temp_c"] / TEMP_BUCKET_C)) == bucket)]
+    tabla.append({
+        "lens": lente,
+        "distance_m": distancia_m,
+        "temp_c": temperatura,
+        "angle": resultado["angle"],
+        "focus": resultado["focus"],
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+    })
+    guardar_estado(estado, path)
+
+def angulo_calibrado(distancia_m, serial=None, lente=None, temperatura=None,
+                     path=AUTOFOCUS_FILE):
+    """
+    Servo angle for a focus distance, interpolated from the calibration table.
+
+    Interpolation is linear in 1/distance (infinity is 0), which follows the
+    thin-lens focus travel; outside the calibrated range the nearest entry is
+    used. For each calibrated distance the entry closest to `temperatura`
+    (or the most recent one) is taken. Without `serial`, the camera that was
+    calibrated last is used, and without `lente` the lens of its most recent
+    calibration. Returns None if there is nothing to interpolate.
+    """
+    estado = cargar_estado(path)
+    if serial is None:
+        recientes = [(e["time"], sn) for sn, d in estado.items()
+                     for e in d.get("table", [])]
+        if not recientes:
+            return None
+        serial = max(recientes)[1]
+
+    tabla = estado.get(serial, {}).get("table", [])
+    if lente is None and tabla:
+        lente = max(tabla, key=lambda e: e["time"])["lens"]
+    tabla = [e for e in tabla if e["lens"] == lente]
+    if not tabla:
+        return None
+
+    # Nearest temperature first, then the most recent calibration
+    tabla.sort(key=lambda e: e["time"], reverse=True)
+    if temperatura is not None:
+        tabla.sort(key=lambda e: abs(e["temp_c"] - temperatura)
+                   if e["temp_c"] is not None else float("inf"))
+    por_distancia = {}
+    for e in tabla:
+        por_distancia.setdefault(e["distance_m"], e)
+
+    inv = np.array([1.0 / d if d else 0.0 for d in por_distancia])
+    ang = np.array([e["angle"] for e in por_distancia.values()], dtype=float)
+    orden = np.argsort(inv)
+    objetivo = 1.0 / distancia_m if distancia_m else 0.0
+    return int(round(np.interp(objetivo, inv[orden], ang[orden])))
+
+# --- Search ---
+def _vertice_parabola(puntos):
+    """Angle of the vertex of the parabola through three (angle, focus) points."""
+    (x0, y0), (x1, y1), (x2, y2) = puntos
+    den = (x0 - x1) * (x0 - x2) * (x1 - x2)
+    if den == 0:
+        return None
+    a = (x2 * (y1 - y0) + x1 * (y0 - y2) + x0 * (y2 - y1)) / den
+    b = (x2**2 * (y0 - y1) + x1**2 * (y2 - y0) + x0**2 * (y1 - y2)) / den
+    if a >= 0:          # not a maximum
+        return None
+    return -b / (2 * a)
+
+def golden_section_search(evaluate, start, span=30, tol=2, max_expand=6):
+    """
+    Find the servo angle that maximises `evaluate(angle)`.
+
+    The search brackets [start - span, start + span], narrows it with a
+    golden-section search until it is narrower than `tol` degrees and then
+    tries the vertex of a parabola through the best sample and its
+    neighbours. If the peak lands on an inner edge of the bracket, the
+    bracket is shifted (up to `max_expand` times). Every angle is evaluated
+    at most once.
+
+    Returns a dict with the best angle and focus, the number of servo moves,
+    the elapsed time and the (angle, focus) samples in visiting order.
+    """
+    t0 = time.time()
+    samples = {}
+    orden = []
+
+    def f(angulo):
+        angulo = int(round(max(SERVO_MIN, min(SERVO_MAX, angulo))))
+        if angulo not in samples:
+            samples[angulo] = evaluate(angulo)
+            orden.append((angulo, samples[angulo]))
+        return samples[angulo]
+
+    lo = max(SERVO_MIN, start - span)
+    hi = min(SERVO_MAX, start + span)
+    for _ in range(max_expand + 1):
+        a, b = lo, hi
+        c = b - INV_PHI * (b - a)
+        d = a + INV_PHI * (b - a)
+        while b - a > tol:
+            if f(c) >= f(d):
+                b = d
+            else:
+                a = c
+            c = b - INV_PHI * (b - a)
+            d = a + INV_PHI * (b - a)
+
+        best = max(samples, key=samples.get)
+        if best - lo <= tol and lo > SERVO_MIN:
+            lo, hi = max(SERVO_MIN, lo - span), lo + tol
+        elif hi - best <= tol and hi < SERVO_MAX:
+            lo, hi = hi - tol, min(SERVO_MAX, hi + span)
+        else:
+            break
+
+    # --- Parabolic refinement around the peak ---
+    angulos = sorted(samples)
+    best = max(samples, key=samples.get)
+    i = angulos.index(best)
+    if 0 < i < len(angulos) - 1:
+        vecinos = [(x, samples[x]) for x in angulos[i-1 : i+2]]
+        vertice = _vertice_parabola(vecinos)
+        if vertice is not None and angulos[i-1] < vertice < angulos[i+1]:
+            f(vertice)
+            best = max(samples, key=samples.get)
+
+    return {
+        "angle": best,
+        "focus": samples[best],
+        "moves": len(orden),
+        "elapsed_s": time.time() - t0,
+        "samples": orden,
+    }
@@ -2,12 +2,16 @@
 This script captures synchronized images from two cameras using a master-slave trigger scheme.
 It records GPS and attitude data from a MAVLink connection, saves the images as TIFF files,
 and logs metadata to a CSV file. It also uses GPIO LEDs to indicate system status.
+Optionally (`"Capture": {"Overviews": N}` in config.json) each TIFF also stores N
+reduced-resolution levels (1/2, 1/4, ...) as SubIFDs, computed by block mean and
+written by a background thread.
 
 """
 
 from pypylon import pylon
 import tifffile as tiff
-import json, time, datetime, csv, pathlib, sys, signal, threading
+import json, time, datetime, csv, pathlib, sys, signal, threading, queue
+import numpy as np
 import RPi.GPIO as GPIO
 from pymavlink import mavutil
 
@@ -50,6 +54,7 @@ EXP  = int(params.get("ExposureTime", 500))
 GAIN = float(params.get("Gain", 0))
 PERIOD = 1 / FPS
 DELAY = 0.01  # Delay between master and slave trigger
+OVERVIEWS = int(json.load(open("config.json")).get("Capture", {}).get("Overviews", 0))
 
 # ───────── GPS / Attitude State ─────────
 gps_ok = False
@@ -92,6 +97,42 @@ def gps_reader():
         elif msg.get_type() == "VFR_HUD":
             last_att.update(gs=msg.groundspeed, climb=msg.climb)
 
+# ───────── TIFF Writer with Overviews ─────────
+def block_mean_2x2(img):
+    """Halve a uint16 image with a 2x2 block mean (integer arithmetic)."""
+    h, w = img.shape[0] // 2 * 2, img.shape[1] // 2 * 2
+    s = (img[0:h:2, 0:w:2].astype(np.uint32) + img[1:h:2, 0:w:2] +
+         img[0:h:2, 1:w:2] + img[1:h:2, 1:w:2])
+    return (s >> 2).astype(np.uint16)
+
+def write_tiff(path, img, levels=0):
+    """Write a frame, with `levels` block-mean overviews as SubIFDs."""
+    if not levels:
+        tiff.imwrite(path, img, photometric="minisblack")
+        return
+    with tiff.TiffWriter(path) as tw:
+        tw.write(img, photometric="minisblack", subifds=levels)
+        for _ in range(levels):
+            img = block_mean_2x2(img)
+            tw.write(img, photometric="minisblack", subfiletype=1)
+
+write_queue = queue.Queue(maxsize=8)   # Bounded: stalls capture rather than filling RAM
+
+def tiff_writer():
+    while True:
+        item = write_queue.get()
+        try:
+            if item is None:
+                return
+            write_tiff(*item, levels=OVERVIEWS)
+        except Exception as e:
+            print("TIFF write error:", e)
+        finally:
+            write_queue.task_done()
+
+writer_thread = threading.Thread(target=tiff_writer, daemon=True)
+writer_thread.start()
+
 # ───────── Initialize MAVLink ─────────
 try:
     mav = mavutil.mavlink_connection('/dev/serial0', baud=57600)
@@ -121,6 +162,8 @@ metadata = {
     "ExposureTime_us": EXP,
     "Gain": GAIN,
     "PixelFormat": "Mono12",
+    "Overview_levels": OVERVIEWS,
+    "Log_schema": 2,
     "GPS_detected": gps_ok
 }
 json.dump(metadata, open(root / "Parameters.json", "w"), indent=2)
@@ -136,6 +179,14 @@ cam1, cam2 = [pylon.InstantCamera(tl.CreateDevice(d)) for d in devices[:2]]
 
 def configure_camera(cam):
     cam.Open()
+    # A focus tool may have left an ROI or binning (kept until power-cycled)
+    for node, value in (("OffsetX", 0), ("OffsetY", 0),
+                        ("BinningHorizontal", 1), ("BinningVertical", 1),
+                        ("DecimationHorizontal", 1), ("DecimationVertical", 1)):
+        try:
+            getattr(cam, node).Value = value
+        except Exception:
+            pass                    # feature not available on this model
     cam.Width.Value = 3840
     cam.Height.Value = 2160
     cam.PixelFormat.Value = "Mono12"
@@ -189,8 +240,12 @@ with csv_path.open("w", newline="") as fcsv:
                 f1 = cam1_dir / f"cam1_{timestamp}.tiff"
                 f2 = cam2_dir / f"cam2_{timestamp}.tiff"
 
-                tiff.imwrite(f1, r1.GetArray(), photometric="minisblack")
-                tiff.imwrite(f2, r2.GetArray(), photometric="minisblack")
+                if OVERVIEWS:
+                    write_queue.put((f1, r1.GetArray()))
+                    write_queue.put((f2, r2.GetArray()))
+                else:
+                    tiff.imwrite(f1, r1.GetArray(), photometric="minisblack")
+                    tiff.imwrite(f2, r2.GetArray(), photometric="minisblack")
 
                 writer.writerow([rtc, gps_time, f1.name, f2.name,
                                  lat, lon, alt, yaw, pitch, roll, gs, climb])
@@ -205,6 +260,8 @@ with csv_path.open("w", newline="") as fcsv:
             time.sleep(max(0, PERIOD - (time.time() - start_time)))
 
     finally:
+        write_queue.put(None)           # Flush pending TIFFs
+        writer_thread.join()
         for cam in (cam1, cam2):
             if cam.IsGrabbing():
                 cam.StopGrabbing()
@@ -25,12 +25,11 @@ def cargar_configuracion():
 
 # Save current configuration to file
 def guardar_configuracion():
-    nueva_config = {
-        "Cameras": {
-            "ExposureTime": int(entry_exposure1.get()),
-            "Gain": float(entry_gain1.get()),
-            "FPS": float(entry_fps1.get())
-        }
+    nueva_config = cargar_configuracion()  # Keep other sections (e.g. Autofocus)
+    nueva_config["Cameras"] = {
+        "ExposureTime": int(entry_exposure1.get()),
+        "Gain": float(entry_gain1.get()),
+        "FPS": float(entry_fps1.get())
     }
 
     with open(CONFIG_FILE, "w") as file:
@@ -0,0 +1,204 @@
+"""
+This module configures Basler cameras for the live view of the focus tools.
+
+Features:
+- "focus" mode: sensor ROI on the centre third of the sensor at native
+  resolution, so only the focus window travels over USB.
+- "overview" mode: camera-side binning (or decimation) of the full sensor
+  down to about the screen size; software decimation when the model
+  supports neither.
+- Restoring the full sensor geometry when a tool closes the camera.
+- Fitting of preview frames to the 480x320 screen.
+- Grabbing threads for live view of both cameras at once, and a
+  side-by-side composite of both streams with their focus scores.
+
+"""
+
+# --- Imports ---
+import math, threading, time
+import cv2
+import numpy as np
+from pypylon import pylon
+import autofocus
+
+SCREEN_W, SCREEN_H = 480, 320
+
+# --- GenICam helpers ---
+def _nodo(cam, nombre):
+    """Camera feature node, or None if the model doesn't have it."""
+    try:
+        nodo = getattr(cam, nombre)
+        nodo.GetAccessMode()
+        return nodo
+    except Exception:
+        return None
+
+def _set(cam, nombre, valor):
+    """Set a feature if it exists and is writable. Returns True on success."""
+    nodo = _nodo(cam, nombre)
+    if nodo is None:
+        return False
+    try:
+        nodo.Value = valor
+        return True
+    except Exception:
+        return False
+
+def _max(cam, nombre, default=1):
+    nodo = _nodo(cam, nombre)
+    try:
+        return int(nodo.Max)
+    except Exception:
+        return default
+
+def _inc(cam, nombre):
+    nodo = _nodo(cam, nombre)
+    try:
+        return max(1, int(nodo.Inc))
+    except Exception:
+        return 1
+
+def _reducir(cam, factor):
+    """Apply up to `factor` of binning (or decimation) on the camera. Returns the factor applied."""
+    for h, v, modo in (("BinningHorizontal", "BinningVertical", "BinningHorizontalMode"),
+                       ("DecimationHorizontal", "DecimationVertical", None)):
+        f = min(factor, _max(cam, h), _max(cam, v))
+        if f > 1 and _set(cam, h, f) and _set(cam, v, f):
+            if modo:
+                _set(cam, modo, "Average")
+                _set(cam, "BinningVerticalMode", "Average")
+            return f
+    return 1
+
+# --- Live view configuration ---
+def restaurar_sensor(cam):
+    """
+    Full sensor without ROI, binning or decimation.
+
+    Basler cameras keep the geometry until power-cycled, so every tool that
+    calls `configurar_preview` must call this before closing the camera.
+    """
+    _set(cam, "OffsetX", 0); _set(cam, "OffsetY", 0)
+    for nombre in ("BinningHorizontal", "BinningVertical",
+                   "DecimationHorizontal", "DecimationVertical"):
+        _set(cam, nombre, 1)
+    _set(cam, "Width", _max(cam, "Width", 0))
+    _set(cam, "Height", _max(cam, "Height", 0))
+
+def configurar_preview(cam, modo="focus", screen=(SCREEN_W, SCREEN_H)):
+    """
+    Configure the camera geometry for live view.
+
+    Returns a dict with the mode, the camera-side reduction factor
+    ("hw_factor"), the software decimation still to apply ("sw_factor") and
+    the sensor region being read ("roi" = x, y, w, h in sensor pixels).
+    """
+    restaurar_sensor(cam)
+    sensor_w, sensor_h = _max(cam, "Width", 1440), _max(cam, "Height", 960)
+
+    if modo == "focus":
+        w = sensor_w // 3 - (sensor_w // 3) % _inc(cam, "Width")
+        h = sensor_h // 3 - (sensor_h // 3) % _inc(cam, "Height")
+        x = (sensor_w - w) // 2; x -= x % _inc(cam, "OffsetX")
+        y = (sensor_h - h) // 2; y -= y % _inc(cam, "OffsetY")
+        _set(cam, "Width", w); _set(cam, "Height", h)
+        _set(cam, "OffsetX", x); _set(cam, "OffsetY", y)
+        return {"mode": modo, "hw_factor": 1, "sw_factor": 1, "roi": (x, y, w, h)}
+
+    factor = max(1, math.floor(min(sensor_w / screen[0], sensor_h / screen[1])))
+    hw = _reducir(cam, factor)
+    _set(cam, "Width", _max(cam, "Width", sensor_w))
+    _set(cam, "Height", _max(cam, "Height", sensor_h))
+    return {"mode": modo, "hw_factor": hw, "sw_factor": max(1, factor // hw),
+            "roi": (0, 0, sensor_w, sensor_h)}
+
+def decimar(gray, info):
+    """Apply the software decimation left over by `configurar_preview`."""
+    s = info["sw_factor"]
+    return gray[::s, ::s] if s > 1 else gray
+
+def ajustar_pantalla(frame, screen=(SCREEN_W, SCREEN_H)):
+    """Resize a frame to fit the screen keeping its aspect ratio, centred on black."""
+    sw, sh = screen
+    fh, fw = frame.shape[:2]
+    k = min(sw / fw, sh / fh)
+    frame = cv2.resize(frame, (max(1, int(fw * k)), max(1, int(fh * k))),
+                       interpolation=cv2.INTER_AREA)
+    fh, fw = frame.shape[:2]
+    top, left = (sh - fh) // 2, (sw - fw) // 2
+    return cv2.copyMakeBorder(frame, top, sh - fh - top, left, sw - fw - left,
+                              borderType=cv2.BORDER_CONSTANT, value=(0, 0, 0))
+
+# --- Dual-camera live view ---
+class CamaraEnVivo:
+    """
+    Grabs from one camera on its own thread with `LatestImageOnly`.
+
+    The thread keeps the latest frame already decimated to preview size and
+    its focus score, so the display loop only has to composite.
+    """
+    def __init__(self, cam, info, screen=(SCREEN_W // 2, SCREEN_H)):
+        self.cam, self.info, self.screen = cam, info, screen
+        self.lock = threading.Lock()
+        self.frame, self.focus, self.fps = None, 0.0, 0.0
+        self.activo = False
+        self.hilo = None
+
+    def start(self):
+        self.activo = True
+        self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+        self.hilo = threading.Thread(target=self._run, daemon=True)
+        self.hilo.start()
+
+    def stop(self):
+        self.activo = False
+        if self.hilo:
+            self.hilo.join(timeout=2)
+        if self.cam.IsGrabbing():
+            self.cam.StopGrabbing()
+
+    def _run(self):
+        t_prev = time.time()
+        while self.activo:
+            res = self.cam.RetrieveResult(500, pylon.TimeoutHandling_Return)
+            try:
+                if not (res and res.GrabSucceeded()):
+                    continue
+                gray = decimar(res.Array, self.info)
+            finally:
+                res.Release()       # every buffer goes back to the pool
+            focus = autofocus.focus_score(gray, centro=self.info["mode"] != "focus")
+            small = ajustar_pantalla(gray, self.screen)
+            t = time.time()
+            with self.lock:
+                self.frame, self.focus = small, focus
+                self.fps = 0.8 * self.fps + 0.2 / max(t - t_prev, 1e-3)
+            t_prev = t
+
+    def ultimo(self):
+        """Latest (frame, focus, fps); frame is None until the first grab."""
+        with self.lock:
+            return self.frame, self.focus, self.fps
+
+def componer(camaras, umbral=1000, screen=(SCREEN_W, SCREEN_H)):
+    """Side-by-side BGR composite of the cameras' latest frames and focus scores."""
+    sw, sh = screen
+    celda_w = sw // len(camaras)
+    paneles = []
+    for i, c in enumerate(camaras):
+        frame, focus, fps = c.ultimo()
+        if frame is None:
+            panel = np.zeros((sh, celda_w, 3), np.uint8)
+            col = (128, 128, 128)
+        else:
+            panel = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            col = (0, 255, 0) if focus > umbral else (0, 0, 255)
+        cv2.rectangle(panel, (1, 1), (celda_w-2, sh-2), col, thickness=4)
+        cv2.putText(panel, f"CAM {i+1}", (10, 25), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6, col, 2, cv2.LINE_AA)
+        cv2.putText(panel, f"Foco: {focus:.0f}", (10, sh - 35), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6, col, 2, cv2.LINE_AA)
+        cv2.putText(panel, f"{fps:.1f} fps", (10, sh - 12), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, col, 1, cv2.LINE_AA)
+        paneles.append(panel)
+    return cv2.hconcat(paneles)
@@ -0,0 +1,39 @@
+import os, sys, types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autofocus
+
+
+def test_frame_posterior_sin_reloj_descarta_encolados(monkeypatch):
+    marca = autofocus.marca_movimiento(types.SimpleNamespace())   # no TimestampLatch
+    # Frames queued before the move are stale even if retrieved much later
+    monkeypatch.setattr(autofocus.time, "time", lambda: marca["host"] + 60)
+    res = types.SimpleNamespace()
+    n = autofocus.STALE_FRAMES
+    assert [autofocus.frame_posterior(res, marca) for _ in range(n + 2)] == \
+        [False] * n + [True] * 2
+
+
+def test_frame_posterior_con_reloj():
+    cam = types.SimpleNamespace(
+        TimestampLatch=types.SimpleNamespace(Execute=lambda: None),
+        TimestampLatchValue=types.SimpleNamespace(Value=1000))
+    marca = autofocus.marca_movimiento(cam)
+    assert not autofocus.frame_posterior(types.SimpleNamespace(TimeStamp=999), marca)
+    assert autofocus.frame_posterior(types.SimpleNamespace(TimeStamp=1000), marca)
+
+
+def test_angulo_calibrado_sin_lente_usa_la_mas_reciente(tmp_path):
+    path = str(tmp_path / "autofocus.json")
+    estado = {"SN1": {"table": [
+        {"lens": "8mm", "distance_m": None, "temp_c": None, "angle": 40,
+         "focus": 1.0, "time": "2026-01-01T10:00:00"},
+        {"lens": "8mm", "distance_m": 10.0, "temp_c": None, "angle": 60,
+         "focus": 1.0, "time": "2026-01-01T10:05:00"},
+        {"lens": "16mm", "distance_m": None, "temp_c": None, "angle": 120,
+         "focus": 1.0, "time": "2026-02-01T10:00:00"},
+    ]}}
+    autofocus.guardar_estado(estado, path)
+    assert autofocus.angulo_calibrado(None, "SN1", path=path) == 120
+    assert autofocus.angulo_calibrado(20, "SN1", path=path) == 120
+    assert autofocus.angulo_calibrado(20, "SN1", lente="8mm", path=path) == 50
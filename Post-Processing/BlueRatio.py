@@ -1,15 +1,22 @@
 import numpy as np
-import tifffile
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import tkinter as tk
-from tkinter import filedialog
-
+from tkinter import filedialog, messagebox
+from vultur.campaign import cargar_campana
+from vultur.blueratio import blue_ratio_campana
+from vultur.registration import registrar_campana
+from vultur.calibration import para_archivo
+from vultur.frames import FrameDiferido
+from vultur.integral import IntegralTeselas
+from vultur.pyramid import VistaPiramide
+
+# Frame en memmap: la calibración y la normalización a [0, 1] se aplican al leer cada recorte
 def cargar_y_normalizar(path):
-    img = tifffile.imread(path).astype(np.float32)
-    if img.max() > 1.0:
-        img /= 4095.0
-    return img
+    corrector = para_archivo(path)
+    if corrector:
+        print(f"Calibrando {path} con {corrector}")
+    return FrameDiferido(path, corrector)
 
 def seleccionar_imagen(titulo):
     root = tk.Tk()
@@ -17,75 +24,131 @@ def seleccionar_imagen(titulo):
     return filedialog.askopenfilename(title=titulo, filetypes=[("TIFF files", "*.tif *.tiff")])
 
 # --- Parámetros ---
-tamano = 200
-half = tamano // 2
-
-# --- Selección de imágenes ---
-print("Selecciona la imagen CON filtro azul:")
-ruta_azul = seleccionar_imagen("Imagen con filtro azul")
-print("Selecciona la imagen SIN filtro:")
-ruta_total = seleccionar_imagen("Imagen sin filtro")
-
-if not ruta_azul or not ruta_total:
-    print("No se seleccionaron ambas imágenes.")
-    exit()
-
-img_azul = cargar_y_normalizar(ruta_azul)
-img_total = cargar_y_normalizar(ruta_total)
-
-h, w = img_total.shape
-
-# --- Crear figura interactiva con 2 subplots ---
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
-im1 = ax1.imshow(img_total, cmap="gray")
-im2 = ax2.imshow(img_azul, cmap="gray")
-
-rect1 = patches.Rectangle((0, 0), tamano, tamano, edgecolor='red', facecolor='none', linewidth=1.5)
-rect2 = patches.Rectangle((0, 0), tamano, tamano, edgecolor='cyan', facecolor='none', linewidth=1.5)
-ax1.add_patch(rect1)
-ax2.add_patch(rect2)
-
-info_text = fig.text(0.5, 0.95, "", ha="center", fontsize=12, backgroundcolor="black", color="white")
-
-# Coordenadas iniciales
-xy_total = [w // 2, h // 2]
-xy_azul = [w // 2, h // 2]
-
-def actualizar_ventanas():
-    xt, yt = xy_total
-    xa, ya = xy_azul
-
-    xt = int(np.clip(xt, half, w - half - 1))
-    yt = int(np.clip(yt, half, h - half - 1))
-    xa = int(np.clip(xa, half, w - half - 1))
-    ya = int(np.clip(ya, half, h - half - 1))
-
-    zona_total = img_total[yt - half:yt + half, xt - half:xt + half]
-    zona_azul = img_azul[ya - half:ya + half, xa - half:xa + half]
-
-    prom_total = np.mean(zona_total)
-    prom_azul = np.mean(zona_azul)
-    porcentaje = (prom_azul / prom_total) * 100 if prom_total > 0 else 0
-
-    rect1.set_xy((xt - half, yt - half))
-    rect2.set_xy((xa - half, ya - half))
-
-    info_text.set_text(
-        f"Total({xt},{yt})  Azul({xa},{ya})  →  % Azul: {porcentaje:.2f}%"
-    )
-    fig.canvas.draw_idle()
-
-def mover(event):
-    if event.inaxes == ax1:
-        xy_total[0], xy_total[1] = event.xdata, event.ydata
-    elif event.inaxes == ax2:
-        xy_azul[0], xy_azul[1] = event.xdata, event.ydata
-    actualizar_ventanas()
-
-# --- Conectar evento ---
-fig.canvas.mpl_connect("motion_notify_event", mover)
-
-ax1.set_title("Imagen SIN filtro")
-ax2.set_title("Imagen CON filtro azul")
-plt.tight_layout()
-plt.show()
+tamano = 200           # Lado inicial de las ventanas; +/- o rueda del mouse para cambiarlo
+
+# --- Modo batch ---
+BLOQUE = 200            # Lado del bloque (px) para los mapas de fracción azul
+UMBRAL_DN = 64.0        # Señal media mínima sin filtro para que un bloque cuente
+CAM_AZUL, CAM_TOTAL = "cam2", "cam1"   # Cámara con filtro azul y sin filtro
+REGISTRAR = True        # Alinear CAM2 a CAM1 por correlación de fase
+ROTACION = False        # Estimar también rotación y escala entre cámaras
+
+def inspeccionar_par(ruta_azul, ruta_total):
+    img_azul = cargar_y_normalizar(ruta_azul)
+    img_total = cargar_y_normalizar(ruta_total)
+
+    h, w = img_total.shape
+
+    # Imágenes integrales por teselas: solo se leen y guardan las que tocan las ventanas
+    int_total = IntegralTeselas(img_total, cuadrados=False)
+    int_azul = IntegralTeselas(img_azul, cuadrados=False)
+    lado = [min(tamano, h, w)]
+
+    # --- Crear figura interactiva con 2 subplots ---
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
+    # Pirámides de visualización: el zoom y el paneo solo dibujan el recorte visible
+    vistas = [VistaPiramide(ax1, img_total.piramide(), cmap="gray"),
+              VistaPiramide(ax2, img_azul.piramide(), cmap="gray")]
+
+    rect1 = patches.Rectangle((0, 0), tamano, tamano, edgecolor='red', facecolor='none', linewidth=1.5)
+    rect2 = patches.Rectangle((0, 0), tamano, tamano, edgecolor='cyan', facecolor='none', linewidth=1.5)
+    ax1.add_patch(rect1)
+    ax2.add_patch(rect2)
+
+    info_text = fig.text(0.5, 0.95, "", ha="center", fontsize=12, backgroundcolor="black", color="white")
+
+    # Coordenadas iniciales
+    xy_total = [w // 2, h // 2]
+    xy_azul = [w // 2, h // 2]
+
+    def actualizar_ventanas():
+        xt, yt = xy_total
+        xa, ya = xy_azul
+        half = lado[0] // 2
+
+        xt = int(np.clip(xt, half, w - lado[0] + half))
+        yt = int(np.clip(yt, half, h - lado[0] + half))
+        xa = int(np.clip(xa, half, w - lado[0] + half))
+        ya = int(np.clip(ya, half, h - lado[0] + half))
+
+        prom_total = int_total.ventana(xt, yt, lado[0])[0]
+        prom_azul = int_azul.ventana(xa, ya, lado[0])[0]
+        porcentaje = (prom_azul / prom_total) * 100 if prom_total > 0 else 0
+
+        for rect, (x, y) in ((rect1, (xt, yt)), (rect2, (xa, ya))):
+            rect.set_bounds(x - half, y - half, lado[0], lado[0])
+
+        info_text.set_text(
+            f"Total({xt},{yt})  Azul({xa},{ya})  {lado[0]}x{lado[0]}  →  % Azul: {porcentaje:.2f}%"
+        )
+        fig.canvas.draw_idle()
+
+    def cambiar_ventana(paso):
+        lado[0] = int(np.clip(lado[0] + paso, 2, min(h, w)))
+        actualizar_ventanas()
+
+    def tecla(event):
+        if event.key in ("+", "="):
+            cambiar_ventana(10)
+        elif event.key in ("-", "_"):
+            cambiar_ventana(-10)
+
+    def rueda(event):
+        cambiar_ventana((1 if event.button == "up" else -1) * max(2, lado[0] // 10))
+
+    def mover(event):
+        if event.inaxes == ax1:
+            xy_total[0], xy_total[1] = event.xdata, event.ydata
+        elif event.inaxes == ax2:
+            xy_azul[0], xy_azul[1] = event.xdata, event.ydata
+        actualizar_ventanas()
+
+    # --- Conectar eventos ---
+    fig.canvas.mpl_connect("motion_notify_event", mover)
+    fig.canvas.mpl_connect("key_press_event", tecla)
+    fig.canvas.mpl_connect("scroll_event", rueda)
+
+    ax1.set_title("Imagen SIN filtro")
+    ax2.set_title("Imagen CON filtro azul")
+    plt.tight_layout()
+    for vista in vistas:
+        vista.actualizar()    # tight_layout cambia el ancho de los ejes
+    plt.show()
+
+def procesar_campana():
+    root = tk.Tk()
+    root.withdraw()
+    carpeta = filedialog.askdirectory(title="Selecciona la carpeta de la campaña")
+    if not carpeta:
+        print("❌ No se seleccionó ninguna carpeta.")
+        return
+    campana = cargar_campana(carpeta)
+    registro = (registrar_campana(campana, cam_ref=CAM_TOTAL, cam_mov=CAM_AZUL, rotacion=ROTACION)
+                if REGISTRAR else None)
+    blue_ratio_campana(campana, bloque=BLOQUE, umbral_dn=UMBRAL_DN,
+                       cam_azul=CAM_AZUL, cam_total=CAM_TOTAL, registro=registro)
+
+def main():
+    root = tk.Tk()
+    root.withdraw()
+    batch = messagebox.askyesno("BlueRatio", "¿Procesar una campaña completa?\n"
+                                "(No = comparar un par de imágenes)")
+    root.destroy()
+    if batch:
+        procesar_campana()
+        return
+
+    # --- Selección de imágenes ---
+    print("Selecciona la imagen CON filtro azul:")
+    ruta_azul = seleccionar_imagen("Imagen con filtro azul")
+    print("Selecciona la imagen SIN filtro:")
+    ruta_total = seleccionar_imagen("Imagen sin filtro")
+
+    if not ruta_azul or not ruta_total:
+        print("No se seleccionaron ambas imágenes.")
+        return
+
+    inspeccionar_par(ruta_azul, ruta_total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import tkinter as tk
+from tkinter import filedialog
+from vultur.calibration import CALIB_DIR, construir_dark, construir_flat
+
+CAMARAS = ("cam1", "cam2")
+
+def main():
+    tk.Tk().withdraw()
+    darks = filedialog.askdirectory(title="Captura de DARKS (tapa puesta) — Cancelar para omitir")
+    flats = filedialog.askdirectory(title="Captura de FLATS — Cancelar para omitir")
+
+    if not darks and not flats:
+        print("❌ No se seleccionó ninguna captura.")
+        return
+
+    for cam in CAMARAS:
+        # El dark va primero: el flat se construye restándolo
+        if darks and os.path.isdir(os.path.join(darks, cam.upper())):
+            construir_dark(darks, cam)
+        if flats and os.path.isdir(os.path.join(flats, cam.upper())):
+            construir_flat(flats, cam)
+    print(f"✅ Biblioteca de calibración en {CALIB_DIR}")
+
+if __name__ == "__main__":
+    main()
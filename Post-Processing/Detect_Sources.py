@@ -0,0 +1,29 @@
+import tkinter as tk
+from tkinter import filedialog
+from vultur.campaign import cargar_campana
+from vultur.sources import detectar_campana
+from vultur.catalog import fusionar
+
+# --- Parámetros ---
+CAMARA = "cam1"
+K_SIGMA = 5.0           # Umbral sobre el fondo local, en sigmas
+MIN_DN = 20.0           # Exceso mínimo sobre el fondo (DN)
+MIN_AREA = 3            # Área mínima de una fuente (px)
+TOL_M = 5.0             # Distancia máxima en el suelo para unir detecciones (m)
+ALT_SUELO = 0.0         # Cota del terreno (m s.n.m.) para pasar la altura del log a AGL
+
+def main():
+    # Selección de carpeta
+    tk.Tk().withdraw()
+    carpeta = filedialog.askdirectory(title="Selecciona la carpeta de la campaña")
+
+    if not carpeta:
+        print("❌ No se seleccionó ninguna carpeta.")
+        return
+
+    campana = cargar_campana(carpeta)
+    catalogo = detectar_campana(campana, cam=CAMARA, k=K_SIGMA, min_dn=MIN_DN, min_area=MIN_AREA)
+    fusionar(catalogo, campana, cam=CAMARA, tol_m=TOL_M, alt_suelo=ALT_SUELO)
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,26 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from shapely.geometry import box
 import geopandas as gpd
-import contextily as ctx
 from pymavlink import mavutil
 import threading
 import math
 import time
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vultur.tiles import CacheTeselas, merc_a_tesela  # Post-Processing/vultur
 
 # === Parámetros de cámara ===
 FOV_H = 35.5  # Horizontal FOV en grados
 FOV_V = 20.4  # Vertical FOV en grados
 MIN_SIDE = 707.0  # ~sqrt(500000 m²)
 
+# === Mapa base desde la caché de teselas (sembrarla con Prefetch_Tiles.py) ===
+TILES = CacheTeselas()
+ZOOM = 17
+# Último mapa base armado: se rehace (en segundo plano) solo si cambian las teselas de la vista
+fondo = {"clave": None, "img": None, "extent": None, "pidiendo": None}
+
 # === Almacenar polígonos ===
 rects = []
 lock = threading.Lock()
@@ -73,6 +82,27 @@ def escuchar_mavlink(serial_port="COM5", baud=57600):
 # === Iniciar hilo de recepción ===
 threading.Thread(target=escuchar_mavlink, daemon=True).start()
 
+# === Mapa base en segundo plano ===
+def cargar_fondo(clave, x0, x1, y0, y1):
+    try:
+        img, extent = TILES.mosaico(x0, x1, y0, y1, ZOOM, fuente="osm")
+        with lock:
+            fondo.update(clave=clave, img=img, extent=extent)
+    except Exception as e:
+        print("Error cargando mapa base:", e)
+    with lock:
+        fondo["pidiendo"] = None
+
+def pedir_fondo(x0, x1, y0, y1):
+    tx0, ty0 = merc_a_tesela(x0, y1, ZOOM)
+    tx1, ty1 = merc_a_tesela(x1, y0, ZOOM)
+    clave = (ZOOM, int(tx0), int(ty0), int(tx1), int(ty1))
+    with lock:
+        if clave == fondo["clave"] or fondo["pidiendo"] is not None:
+            return
+        fondo["pidiendo"] = clave
+    threading.Thread(target=cargar_fondo, args=(clave, x0, x1, y0, y1), daemon=True).start()
+
 # === Mostrar y actualizar mapa ===
 fig, ax = plt.subplots(figsize=(10, 8))
 
@@ -86,8 +116,6 @@ def actualizar(frame):
 
     if gdf is not None:
         try:
-            ctx.add_basemap(ax, source=ctx.providers.OpenStreetMap.Mapnik, zoom=17)
-
             # Forzar área mínima visible
             x0, y0, x1, y1 = gdf.total_bounds
             width = x1 - x0
@@ -102,6 +130,11 @@ def actualizar(frame):
                 y0 -= extra
                 y1 += extra
 
+            pedir_fondo(x0, x1, y0, y1)
+            with lock:
+                img, extent = fondo["img"], fondo["extent"]
+            if img is not None:
+                ax.imshow(img, extent=extent, zorder=0, interpolation="bilinear")
             ax.set_xlim(x0, x1)
             ax.set_ylim(y0, y1)
 
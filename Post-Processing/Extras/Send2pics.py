@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-# enviar_2fotos.py  –  simultaneous capture, waits for ACK from PC   ASCII-only
+# enviar_2fotos.py  –  simultaneous capture, windowed downlink with SACK   ASCII-only
 
-import io, time, json, sys, re
+import io, time, json, sys
+from collections import deque
 from pathlib import Path
 from pypylon import pylon, genicam
 from PIL import Image
@@ -12,22 +13,49 @@ SERIAL_PORT  = "/dev/serial0"
 BAUD_RATE    = 57600
 PAYLOAD      = 253
 JPEG_Q       = 30
-ACK_TIMEOUT  = 20           # seconds to wait for "Photo camX ok"
+ACK_TIMEOUT  = 20           # seconds without progress before restarting
 MAX_RETRIES = 3  
 
+# ---- TRANSFER ----------------------------------------------------------
+# The PC answers with "sack <id> <base> <hex>": <id> = transfer id sent in
+# the handshake's jpg_quality field, <base> = first missing packet, bit i
+# of <hex> = packet base+i received (see vultur_rx2.py).
+# Transfer id (8 bits): camera (bit 7, 0 = cam1) | stage (bits 6-5, see
+# STAGE_CODE) | counter 1..31, so the image is labelled by the handshake.
+WINDOW       = 64           # packets in flight beyond the receiver's base (<= 128)
+RATE0        = 10.0         # initial pacing, packets/s
+RATE_MIN     = 2.0
+RATE_MAX     = BAUD_RATE / 10 / (PAYLOAD + 14)   # serial line limit (~21 pkt/s)
+RTO_MIN      = 0.5          # s before an unacknowledged packet is resent (> SACK period)
+
 PRM      = json.load(open("config.json"))["Camaras"]
 WIDTH    = 3840
 HEIGHT   = 2160
 EXPOSURE = int(PRM.get("ExposureTime", 500))
 GAIN     = float(PRM.get("Gain", 0))
 RESIZE_W = int(PRM.get("Resize", 640))
+
+# Progressive mode: every stage of both cameras is sent before the next one
+PROGRESSIVE = True
+THUMB_W, THUMB_Q = 160, 30  # stage 1: exposure check in ~1 s
+CROP_W, CROP_H, CROP_Q = 320, 180, 80   # stage 3: native-resolution centre crop (focus)
+STAGES = ("thumb", "full", "crop") if PROGRESSIVE else ("full",)
+STAGE_CODE = {"full": 1, "thumb": 2, "crop": 3}   # 0 = unlabelled (old senders)
 # ------------------------------------------------------------------------
 
 def log(msg): print(time.strftime("[%H:%M:%S]"), msg, flush=True)
 
+def jpeg(pil, q):
+    buf = io.BytesIO(); pil.save(buf,"JPEG",quality=q)
+    return buf.getvalue(), pil.width, pil.height
+
 def capture_both(cams):
     for cam in cams:
         cam.Open()
+        for node, v in (("OffsetX",0), ("OffsetY",0), ("BinningHorizontal",1), ("BinningVertical",1),
+                        ("DecimationHorizontal",1), ("DecimationVertical",1)):
+            try: getattr(cam, node).Value = v      # undo a focus tool's ROI / binning
+            except Exception: pass
         cam.Width.Value = WIDTH; cam.Height.Value = HEIGHT
         cam.PixelFormat.Value = "Mono12"
         cam.ExposureTime.Value = EXPOSURE; cam.Gain.Value = GAIN
@@ -44,65 +72,149 @@ def capture_both(cams):
     for idx, cam in enumerate(cams):
         res = cam.RetrieveResult(3000); arr = res.Array; res.Release()
         cam.StopGrabbing(); cam.Close()
-        pil = Image.fromarray((arr/16).astype("uint8"))
+        native = Image.fromarray((arr/16).astype("uint8"))
+        pil = native
         if RESIZE_W and RESIZE_W < pil.width:
             pil = pil.resize((RESIZE_W, int(pil.height*RESIZE_W/pil.width)))
-        buf = io.BytesIO(); pil.save(buf,"JPEG",quality=JPEG_Q)
-        out[f"cam{idx+1}"] = (buf.getvalue(), pil.width, pil.height)
-        buf.close()
-        log(f"cam{idx+1}: captured & {len(out[f'cam{idx+1}'][0])} B")
+        stages = {"full": jpeg(pil, JPEG_Q)}
+        if PROGRESSIVE:
+            stages["thumb"] = jpeg(pil.resize((THUMB_W, int(pil.height*THUMB_W/pil.width))), THUMB_Q)
+            x0, y0 = (native.width-CROP_W)//2, (native.height-CROP_H)//2
+            stages["crop"] = jpeg(native.crop((x0, y0, x0+CROP_W, y0+CROP_H)), CROP_Q)
+        out[f"cam{idx+1}"] = stages
+        log(f"cam{idx+1}: captured & " + ", ".join(f"{k} {len(v[0])} B" for k, v in stages.items()))
     return out
 
-def send_photo(mav, data, w, h, tag):
+class Downlink:
+    """One image over ENCAPSULATED_DATA: sliding window, selective
+    retransmission from the receiver's SACK bitmaps, pacing adapted to the
+    measured delivery rate and loss."""
+    learned_rate = RATE0                        # next transfer starts where the last ended
+    counter = 0
+    def __init__(self, mav, data, tag, w=0, h=0, stage="full"):
+        self.mav, self.data, self.tag, self.size = mav, data, tag, (w, h)
+        self.pkts  = (len(data)+PAYLOAD-1)//PAYLOAD
+        Downlink.counter = Downlink.counter % 31 + 1        # tells consecutive transfers apart
+        self.xid   = (tag == "cam2") << 7 | STAGE_CODE[stage] << 5 | Downlink.counter
+        self.acked = bytearray(self.pkts)
+        self.sent_at = [0.0]*self.pkts          # 0 = (re)send as soon as possible
+        self.base, self.rate, self.srtt = 0, Downlink.learned_rate, None
+        self.n_sent, self.n_lost, self.last_cut = 0, 0, 0.0   # n_lost: gap-detected + RTO resends
+        self.confirmed = False                  # a SACK with our xid proves the handshake arrived
+        self.n_acked, self.hist = 0, deque()    # (time, packets acked) for delivery rate
+
+    def _send(self, seq):
+        chunk = self.data[seq*PAYLOAD:(seq+1)*PAYLOAD].ljust(PAYLOAD,b'\0')
+        self.mav.mav.encapsulated_data_send(seq, chunk)
+        self.sent_at[seq] = time.time(); self.n_sent += 1
+
+    def handshake(self):
+        """START handshake; jpg_quality carries the transfer id."""
+        w, h = self.size
+        self.mav.mav.data_transmission_handshake_send(
+            mavutil.mavlink.MAVLINK_DATA_STREAM_IMG_JPEG,
+            len(self.data), w, h, self.pkts, PAYLOAD, self.xid)
+
+    def _rto(self):
+        return max(RTO_MIN, 3*self.srtt) if self.srtt else 2*RTO_MIN
+
+    def _next(self, now):
+        """First packet in the window never sent, marked lost or overdue."""
+        rto = self._rto()
+        for seq in range(self.base, min(self.pkts, self.base+WINDOW)):
+            if not self.acked[seq] and (not self.sent_at[seq] or now-self.sent_at[seq] > rto):
+                return seq
+        return None
+
+    def _sack(self, base, bits, now):
+        """Apply a SACK; returns True if it acknowledged something new."""
+        self.confirmed = True
+        new = [s for s in range(self.base, min(base, self.pkts)) if not self.acked[s]]
+        new += [base+i for i in range(128) if bits >> i & 1
+                and base+i < self.pkts and not self.acked[base+i]]
+        for seq in new: self.acked[seq] = 1
+        self.n_acked += len(new)
+        while self.base < self.pkts and self.acked[self.base]: self.base += 1
+        timed = [q for q in new if self.sent_at[q]]   # late originals of "lost" ones have 0
+        if not timed:
+            return bool(new)
+        # RTT from the newest packet acknowledged (includes the SACK period)
+        last = max(timed, key=lambda q: self.sent_at[q])
+        rtt = now - self.sent_at[last]
+        self.srtt = rtt if self.srtt is None else 0.8*self.srtt + 0.2*rtt
+        # Packets sent before one that arrived but still missing are lost
+        lost = [q for q in range(self.base, last) if not self.acked[q]
+                and 0 < self.sent_at[q] < self.sent_at[last]]
+        for q in lost: self.sent_at[q] = 0.0
+        self.n_lost += len(lost)
+
+        # Delivery rate over the last ~2 s. On loss, pace at what actually got
+        # through: random radio loss barely lowers it, a full radio buffer does.
+        self.hist.append((now, self.n_acked))
+        while now - self.hist[0][0] > 2.0: self.hist.popleft()
+        t_old, n_old = self.hist[0]
+        delivered = (self.n_acked - n_old)/(now - t_old) if now - t_old > 0.5 else None
+        if lost and now - self.last_cut > max(self.srtt, 0.5):
+            cut = 0.7*self.rate if delivered is None else min(self.rate, delivered)
+            self.rate = max(RATE_MIN, cut); self.last_cut = now
+        elif not lost:
+            self.rate = min(RATE_MAX, self.rate + 1.0)
+        return True
+
+    def run(self):
+        """Send until everything is acknowledged; False if the link stalls."""
+        t0 = last_progress = next_tx = t_hs = time.time()
+        self.handshake()
+        while self.base < self.pkts:
+            now = time.time()
+            if now - last_progress > ACK_TIMEOUT:
+                return False
+            if not self.confirmed and now - t_hs > self._rto():
+                self.handshake(); t_hs = now       # lost START: receiver drops every packet
+            seq = self._next(now) if now >= next_tx else None
+            if seq is not None:
+                if self.sent_at[seq]: self.n_lost += 1   # RTO resend
+                self._send(seq); next_tx = now + 1/self.rate
+            m = self.mav.recv_match(type="STATUSTEXT", blocking=False)
+            if m:
+                txt = m.text.strip().lower()
+                f = txt.split()
+                if len(f) != 4 or f[0] != "sack":
+                    continue
+                try:
+                    xid, base, bits = int(f[1],16), int(f[2]), int(f[3],16)
+                except ValueError:
+                    continue                        # garbled or foreign text
+                if xid == self.xid and self._sack(base, bits, now): last_progress = now
+            elif seq is None:
+                time.sleep(min(0.01, max(0.001, next_tx-now)))
+        self.elapsed = time.time() - t0
+        Downlink.learned_rate = self.rate
+        return True
+
+    def report(self):
+        gp = len(self.data)/max(self.elapsed, 1e-9)
+        return (f"{len(self.data)} B in {self.elapsed:.1f}s = {gp:.0f} B/s goodput "
+                f"({8*gp/BAUD_RATE:.0%} of link), {self.n_sent} pkts for {self.pkts} "
+                f"({self.n_lost} lost), final {self.rate:.1f} pkt/s")
+
+def send_photo(mav, data, w, h, tag, stage="full"):
     for attempt in range(1, MAX_RETRIES + 1):            # ← bucle reintento
         log(f"{tag}: attempt {attempt}/{MAX_RETRIES}")
-
-        pkts = (len(data)+PAYLOAD-1)//PAYLOAD
-        pause = max(0.02, 0.007*pkts)
-
-        # handshake START
-        mav.mav.data_transmission_handshake_send(
-            mavutil.mavlink.MAVLINK_DATA_STREAM_IMG_JPEG,
-            len(data), w, h, pkts, PAYLOAD, JPEG_Q)
-        time.sleep(0.25)
-
-        # data packets
-        for seq in range(pkts):
-            chunk = data[seq*PAYLOAD:(seq+1)*PAYLOAD].ljust(PAYLOAD,b'\0')
-            mav.mav.encapsulated_data_send(seq, chunk)
-            time.sleep(pause)
+        dl = Downlink(mav, data, tag, w, h, stage)
+        ok = dl.run()                                   # sends (and repeats) the START handshake
 
         # handshake END
         mav.mav.data_transmission_handshake_send(
             mavutil.mavlink.MAVLINK_DATA_STREAM_IMG_JPEG, 0,0,0,0,0,0)
 
-        deadline = time.time() + ACK_TIMEOUT
-        got_ack  = False
-
-        while time.time() < deadline:
-            m = mav.recv_match(type="STATUSTEXT", blocking=True, timeout=2)
-            if not m:
-                continue
-            txt = m.text.strip().lower()
-
-            if txt.startswith("retry:"):
-                miss=list(map(int,re.findall(r"\d+",txt)))
-                log(f"{tag}: resend {miss}")
-                for seq in miss:
-                    ch=data[seq*PAYLOAD:(seq+1)*PAYLOAD].ljust(PAYLOAD,b'\0')
-                    mav.mav.encapsulated_data_send(seq,ch)
-                    time.sleep(pause)
-
-            elif f"photo {tag} ok" in txt:
-                got_ack = True
-                break                                   # ← ACK recibido
-
-        if got_ack:
-            mav.mav.statustext_send(6, f"Photo {tag} sent".encode("ascii")[:50])
-            log(f"{tag}: ACK received, done")
+        if ok:
+            gp = len(data)/max(dl.elapsed, 1e-9)
+            mav.mav.statustext_send(6, f"Photo {tag} sent {gp:.0f} B/s".encode("ascii")[:50])
+            log(f"{tag}: done, {dl.report()}")
             return                                      # exit after success
 
-        log(f"{tag}: ACK timeout ({ACK_TIMEOUT}s) – retrying …")
+        log(f"{tag}: no progress for {ACK_TIMEOUT}s ({dl.base}/{dl.pkts} acked) – retrying …")
 
     # se agotaron los intentos
     log(f"{tag}: FAILED after {MAX_RETRIES} attempts")
@@ -118,9 +230,10 @@ def main():
     cams = [pylon.InstantCamera(factory.CreateDevice(devs[i])) for i in (0,1)]
     imgs = capture_both(cams)           # simultaneous shoot
 
-    for tag in ("cam1","cam2"):
-        data,w,h = imgs[tag]
-        send_photo(mav,data,w,h,tag); time.sleep(0.2)
+    for stage in STAGES:                # both thumbnails first, crops last
+        for tag in ("cam1","cam2"):
+            data,w,h = imgs[tag][stage]
+            send_photo(mav,data,w,h,tag,stage); time.sleep(0.2)   # handshake carries cam + stage
 
     log("Done")
 
@@ -5,17 +5,20 @@
 # ASCII-only  ·  Python ≥3.9
 
 # ─────────────────────────────────────  IMPORTS  ────────────────────────────
-import sys, io, math, threading, time, queue, re
+import sys, os, io, math, threading, time, queue, re
+from collections import deque
 import tkinter as tk
 from tkinter import ttk, scrolledtext
-from PIL import Image, ImageTk
+from PIL import Image, ImageTk, ImageDraw
 from pymavlink import mavutil
 from shapely.geometry import box
-import geopandas as gpd, contextily as ctx
 import matplotlib
 matplotlib.use("TkAgg")
 from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vultur.tiles import CacheTeselas           # Post-Processing/vultur
 
 # ─────────────────────────────────── CONFIG GLOBAL ──────────────────────────
 SERIAL_PORT = "COM5"   # ← ajusta
@@ -26,10 +29,17 @@ FOV_H_DEG, FOV_V_DEG = 35.5, 20.4
 MIN_SIDE_M  = 707.0
 EARTH_R     = 6378137.0
 PLACE_W, PLACE_H = 640, 360                   # placeholder gris
+MAX_RECTS   = 250                             # huellas visibles en el mapa
+VIEW_PAD    = 0.25                            # margen al re-encuadrar (fraccion)
+TILES       = CacheTeselas()                  # mapa base desde disco (ver Prefetch_Tiles.py)
+SACK_EVERY  = 8                               # paquetes recibidos entre SACKs
+SACK_PERIOD = 0.3                             # s maximo entre SACKs en una transferencia
+ETAPAS      = {"thumb": "miniatura", "full": "preview", "crop": "preview + recorte 1:1"}
+CODIGO_ETAPA = {1: "full", 2: "thumb", 3: "crop"}   # bits 6-5 del id de transferencia
 
 # ───────────────────────────── ESTADO COMPARTIDO ────────────────────────────
-rects, rect_lock = [], threading.Lock()
-img_q1, img_q2   = queue.Queue(), queue.Queue()
+rect_q           = queue.Queue()              # huellas ya proyectadas (EPSG:3857)
+img_q1, img_q2   = queue.Queue(), queue.Queue()   # (imagen, etapa)
 data_queue       = queue.Queue()
 photo_idx        = 0
 mav_conn         = None
@@ -48,6 +58,32 @@ def ground_rect(lat, lon, alt):
     lat2, lon2 = m2ll(lat, lon,  w/2,  h/2)
     return box(min(lon1,lon2), min(lat1,lat2), max(lon1,lon2), max(lat1,lat2))
 
+def ll2merc(lat, lon):
+    """WGS84 -> Web Mercator (EPSG:3857) en metros."""
+    return (EARTH_R * math.radians(lon),
+            EARTH_R * math.log(math.tan(math.pi/4 + math.radians(lat)/2)))
+
+def ground_rect_merc(lat, lon, alt):
+    """Huella proyectada una sola vez al llegar: (x0, y0, x1, y1) en EPSG:3857."""
+    lon0, lat0, lon1, lat1 = ground_rect(lat, lon, alt).bounds
+    return ll2merc(lat0, lon0) + ll2merc(lat1, lon1)
+
+def map_zoom(width_m, px):
+    """Zoom de teselas con ~1 pixel de tesela por pixel de pantalla (9..17)."""
+    z = math.log2(2*math.pi*EARTH_R * px / (256 * max(width_m, 1.0)))
+    return int(min(17, max(9, round(z))))
+
+def etiqueta_de(xid):
+    """(camara, etapa) del id de transferencia de Send2pics; None si no viene (emisor antiguo)."""
+    etapa = CODIGO_ETAPA.get(xid >> 5 & 3)
+    return (f"cam{(xid >> 7) + 1}", etapa) if etapa else None
+
+def sack_text(xid, chunks, exp):
+    """SACK para Send2pics: primer paquete faltante y bitmap de los 128 siguientes."""
+    base = next((i for i in range(exp) if i not in chunks), exp)
+    bits = sum(1 << i for i in range(128) if base + i in chunks)
+    return f"sack {xid:03x} {base} {bits:032x}"
+
 class RedirectStd:
     def __init__(self, widget): self.w, self.orig = widget, sys.__stdout__
     def write(self, msg):
@@ -72,10 +108,12 @@ def mav_thread():
     mav_conn = mav
 
     exp_pkts, chunks, receiving = 0, {}, False
+    xid, size, nuevos, t_sack = 0, 0, 0, 0.0
+    etiqueta = None                     # ("cam1", "thumb") del handshake en curso
+    progresivo = False                  # emisor que etiqueta: nunca se alterna cam1 / cam2
     while True:
-        msg = mav.recv_match(blocking=True, timeout=5)
-        if not msg: continue
-        t = msg.get_type()
+        msg = mav.recv_match(blocking=True, timeout=SACK_PERIOD if receiving else 5)
+        t = msg.get_type() if msg else None
 
         if t == "STATUSTEXT" and msg.severity <= 6:
             data_queue.put(msg.text.strip())
@@ -83,28 +121,51 @@ def mav_thread():
             if low.startswith("gps ok") and "|" in msg.text:
                 try:
                     lat, lon, alt = map(float, msg.text.split("|")[1].split(","))
-                    with rect_lock:
-                        rects.append(ground_rect(lat, lon, alt))
-                        rects[:] = rects[-250:]
+                    rect_q.put(ground_rect_merc(lat, lon, alt))
                 except: pass
 
-        elif t == "DATA_TRANSMISSION_HANDSHAKE" and msg.packets > 0:
+        elif (t == "DATA_TRANSMISSION_HANDSHAKE" and msg.packets > 0 and
+              (msg.jpg_quality, msg.packets, msg.size) != (xid, exp_pkts, size)):
+            # (un handshake repetido de la transferencia en curso no la reinicia)
             exp_pkts, chunks, receiving = msg.packets, {}, True
-            print(f"[PHOTO] start – {exp_pkts} packets")
+            # jpg_quality lleva el id de la transferencia que Send2pics espera en los SACK
+            xid, size, nuevos, t_sack = msg.jpg_quality, msg.size, 0, time.time()
+            etiqueta = etiqueta_de(xid)
+            progresivo |= etiqueta is not None
+            print(f"[PHOTO] start – {exp_pkts} packets" + (" – %s %s" % etiqueta if etiqueta else ""))
 
         elif t == "ENCAPSULATED_DATA" and receiving:
-            chunks[msg.seqnr] = bytes(msg.data)
+            if msg.seqnr < exp_pkts and msg.seqnr not in chunks:
+                chunks[msg.seqnr] = bytes(msg.data); nuevos += 1
             if len(chunks) == exp_pkts:
                 receiving = False
-                buf = io.BytesIO(b"".join(chunks[i] for i in range(exp_pkts)))
+                mav.mav.statustext_send(6, sack_text(xid, chunks, exp_pkts).encode())
+                t_sack = time.time()
+                buf = io.BytesIO(b"".join(chunks[i] for i in range(exp_pkts))[:size])
                 try:
-                    pil = Image.open(buf)
-                    (img_q1 if photo_idx == 0 else img_q2).put(pil)
-                    photo_idx ^= 1
-                    print("[PHOTO] decoded")
+                    pil = Image.open(buf); pil.load()
+                    if etiqueta:                # camara y etapa del handshake
+                        tag, etapa = etiqueta
+                    elif progresivo:            # sin etiqueta de un emisor que etiqueta: no adivinar
+                        raise ValueError("transferencia sin camara/etapa")
+                    else:                       # emisor antiguo: alterna cam1 / cam2
+                        tag, etapa = ("cam1" if photo_idx == 0 else "cam2"), "full"
+                        photo_idx ^= 1
+                    (img_q1 if tag == "cam1" else img_q2).put((pil, etapa))
+                    print(f"[PHOTO] {tag} {etapa} decoded")
                 except Exception as e:
                     print("[ERR] decode:", e)
 
+        elif t == "ENCAPSULATED_DATA" and exp_pkts and time.time() - t_sack > SACK_PERIOD:
+            # Reenvio tras completar: el SACK final se perdio
+            mav.mav.statustext_send(6, sack_text(xid, chunks, exp_pkts).encode())
+            t_sack = time.time()
+
+        # SACK periodico: cada SACK_EVERY paquetes nuevos o SACK_PERIOD s
+        if receiving and (nuevos >= SACK_EVERY or time.time() - t_sack > SACK_PERIOD):
+            mav.mav.statustext_send(6, sack_text(xid, chunks, exp_pkts).encode())
+            nuevos, t_sack = 0, time.time()
+
 # ───────────────────────────── GUI PRINCIPAL ────────────────────────────────
 class VulturGUI:
     def __init__(self, root):
@@ -162,6 +223,18 @@ class VulturGUI:
         self.fig = Figure(figsize=(5,4)); self.ax = self.fig.add_subplot(111)
         self.canvas = FigureCanvasTkAgg(self.fig, master=mp)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        # Artistas persistentes: las huellas se agregan, el fondo se reemplaza
+        self.footprints, self.patches = deque(), deque()
+        self.view, self.pending, self.fetching, self.stale = None, None, False, False
+        self.base_img, self.base_q = None, queue.Queue()
+        self.ax.set_autoscale_on(False)
+        self.ax.set_title("Coverage")
+        lon0, lat0, lon1, lat1 = REGION_WGS
+        (x0, y0), (x1, y1) = ll2merc(lat0, lon0), ll2merc(lat1, lon1)
+        self.region = Rectangle((x0, y0), x1-x0, y1-y0, edgecolor="orange",
+                                facecolor="none", linewidth=1.5, zorder=2)
+        self.ax.add_patch(self.region)
+        self.set_view((x0, x1, y0, y1), zoom=9)
 
         # ========= IMÁGENES =========
         im = ttk.LabelFrame(root, text="Images")
@@ -170,10 +243,12 @@ class VulturGUI:
         im.columnconfigure(0, weight=1)
         ph = ImageTk.PhotoImage(Image.new("RGB",(PLACE_W,PLACE_H),"#444"))
         self.photo1 = self.photo2 = ph
-        ttk.Label(im, text="CAM 1").grid(row=0, column=0, pady=(2,0))
+        self.title1, self.title2 = tk.StringVar(value="CAM 1"), tk.StringVar(value="CAM 2")
+        self.previews = {}              # ultima imagen completa por camara (base del recorte)
+        ttk.Label(im, textvariable=self.title1).grid(row=0, column=0, pady=(2,0))
         self.lbl1 = ttk.Label(im, image=ph, relief="sunken")
         self.lbl1.grid(row=1, column=0, sticky="nsew", padx=2, pady=(0,6))
-        ttk.Label(im, text="CAM 2").grid(row=2, column=0, pady=(2,0))
+        ttk.Label(im, textvariable=self.title2).grid(row=2, column=0, pady=(2,0))
         self.lbl2 = ttk.Label(im, image=ph, relief="sunken")
         self.lbl2.grid(row=3, column=0, sticky="nsew", padx=2, pady=(0,2))
 
@@ -213,16 +288,30 @@ class VulturGUI:
     # ----- Imágenes -----
     def pull_cam1(self):
         try:
-            while True: self._show("cam1", img_q1.get_nowait())
+            while True: self._show("cam1", *img_q1.get_nowait())
         except queue.Empty: pass
         self.root.after(200, self.pull_cam1)
     def pull_cam2(self):
         try:
-            while True: self._show("cam2", img_q2.get_nowait())
+            while True: self._show("cam2", *img_q2.get_nowait())
         except queue.Empty: pass
         self.root.after(200, self.pull_cam2)
 
-    def _show(self, tag, pil):
+    def _show(self, tag, pil, etapa="full"):
+        # thumb: miniatura ampliada para juzgar exposicion; full: preview;
+        # crop: recorte nativo 1:1 como inserto sobre el preview (foco)
+        if etapa == "thumb":
+            pil = pil.resize((PLACE_W, round(pil.height*PLACE_W/pil.width)), Image.BILINEAR)
+        if etapa == "crop" and tag in self.previews:
+            base = self.previews[tag].copy()
+            x, y = base.width - pil.width - 4, base.height - pil.height - 4
+            base.paste(pil, (x, y))
+            ImageDraw.Draw(base).rectangle((x-2, y-2, x+pil.width+1, y+pil.height+1),
+                                           outline=255, width=2)
+            pil = base
+        elif etapa != "crop":
+            self.previews[tag] = pil
+        (self.title1 if tag == "cam1" else self.title2).set(f"CAM {tag[-1]}  ·  {ETAPAS.get(etapa, etapa)}")
         tkimg = ImageTk.PhotoImage(pil)
         if tag == "cam1":
             self.photo1 = tkimg; self.lbl1.configure(image=tkimg)
@@ -251,32 +340,78 @@ class VulturGUI:
 
     # ----- Map -----
     def update_map(self):
-        self.ax.clear()
-        with rect_lock:
-            drew = bool(rects)
-            if drew:
-                gdf = gpd.GeoDataFrame(geometry=rects, crs="EPSG:4326").to_crs(epsg=3857)
-                gdf.plot(ax=self.ax, edgecolor="lime", facecolor="none", linewidth=2)
-                x0,y0,x1,y1 = gdf.total_bounds
-                pad_x = max(0, MIN_SIDE_M-(x1-x0))/2
-                pad_y = max(0, MIN_SIDE_M-(y1-y0))/2
-                self.ax.set_xlim(x0-pad_x, x1+pad_x); self.ax.set_ylim(y0-pad_y, y1+pad_y)
-                try: ctx.add_basemap(self.ax, source=ctx.providers.OpenStreetMap.Mapnik, zoom=17)
-                except Exception as e: print("[WARN] basemap:", e)
-            else:
-                lon0, lat0, lon1, lat1 = REGION_WGS
-                poly = gpd.GeoSeries([box(lon0, lat0, lon1, lat1)],
-                                     crs="EPSG:4326").to_crs(epsg=3857)
-                poly.boundary.plot(ax=self.ax, edgecolor="orange", linewidth=1.5)
-                bounds = poly.total_bounds
-                self.ax.set_xlim(bounds[0], bounds[2]); self.ax.set_ylim(bounds[1], bounds[3])
-                try: ctx.add_basemap(self.ax, source=ctx.providers.OpenStreetMap.Mapnik, zoom=9)
-                except Exception as e: print("[WARN] basemap:", e)
+        # Huellas nuevas: un Rectangle por huella, las más viejas se retiran
+        nuevos = 0
+        while True:
+            try: x0, y0, x1, y1 = rect_q.get_nowait()
+            except queue.Empty: break
+            p = Rectangle((x0, y0), x1-x0, y1-y0, edgecolor="lime",
+                          facecolor="none", linewidth=2, zorder=3)
+            self.ax.add_patch(p)
+            self.footprints.append((x0, y0, x1, y1)); self.patches.append(p); nuevos += 1
+            if len(self.patches) > MAX_RECTS:
+                self.footprints.popleft(); self.patches.popleft().remove()
+            if self.region is not None:
+                self.region.remove(); self.region = None
+        if nuevos:
+            self._fit_view()
+
+        # Fondo descargado en segundo plano
+        try:
+            img, ext, view = self.base_q.get_nowait()
+            self.fetching = False
+            if img is not None:
+                if self.base_img is None:
+                    self.base_img = self.ax.imshow(img, extent=ext, zorder=0,
+                                                   interpolation="bilinear")
+                else:
+                    self.base_img.set_data(img); self.base_img.set_extent(ext)
+                self._apply_limits(); self.stale = True
+            if self.pending and self.pending[0] != view:
+                self.set_view(*self.pending)
+            self.pending = None
+        except queue.Empty: pass
 
-        self.ax.set_title("Coverage")
-        self.canvas.draw_idle()
+        if self.stale: self.canvas.draw_idle(); self.stale = False
         self.root.after(2000, self.update_map)
 
+    def _fit_view(self):
+        """Re-encuadra solo si las huellas salen de la vista o ésta quedó muy grande."""
+        x0 = min(r[0] for r in self.footprints); x1 = max(r[2] for r in self.footprints)
+        y0 = min(r[1] for r in self.footprints); y1 = max(r[3] for r in self.footprints)
+        pad_x = max(0, MIN_SIDE_M-(x1-x0))/2; pad_y = max(0, MIN_SIDE_M-(y1-y0))/2
+        x0, x1, y0, y1 = x0-pad_x, x1+pad_x, y0-pad_y, y1+pad_y
+        self.stale = True
+        if self.view:
+            vx0, vx1, vy0, vy1 = self.view
+            inside = vx0 <= x0 and x1 <= vx1 and vy0 <= y0 and y1 <= vy1
+            if inside and (vx1-vx0) < 4*(x1-x0) + 2*MIN_SIDE_M: return
+        mx, my = VIEW_PAD*(x1-x0), VIEW_PAD*(y1-y0)
+        self.set_view((x0-mx, x1+mx, y0-my, y1+my))
+
+    def set_view(self, view, zoom=None):
+        """Fija los limites y pide el fondo de esa vista (una descarga a la vez)."""
+        self.view = view; self._apply_limits(); self.stale = True
+        if zoom is None:
+            px = max(400, self.canvas.get_tk_widget().winfo_width())
+            zoom = map_zoom(view[1]-view[0], px)
+        if self.fetching:
+            self.pending = (view, zoom); return
+        self.fetching = True
+        threading.Thread(target=self._fetch_basemap, args=(view, zoom), daemon=True).start()
+
+    def _apply_limits(self):
+        x0, x1, y0, y1 = self.view
+        self.ax.set_xlim(x0, x1); self.ax.set_ylim(y0, y1)
+
+    def _fetch_basemap(self, view, zoom):
+        x0, x1, y0, y1 = view
+        try:
+            img, ext = TILES.mosaico(x0, x1, y0, y1, zoom, fuente="osm")
+            self.base_q.put((img, ext, view))
+        except Exception as e:
+            print("[WARN] basemap:", e); self.base_q.put((None, None, view))
+
 # ──────────────────────────────── MAIN ─────────────────────────────────────
 def main():
     root = tk.Tk()
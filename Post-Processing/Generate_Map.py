@@ -1,57 +1,145 @@
-import pandas as pd
 import folium
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+from vultur.campaign import cargar_campana
+from vultur.frames import leer_para_pantalla
+from vultur.tiles import CacheTeselas
 import base64
+import hashlib
+import json
 import os
-import tifffile
+import time
 import numpy as np
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import tkinter as tk
 from tkinter import filedialog
 
-# Selección de carpeta
-tk.Tk().withdraw()
-carpeta = filedialog.askdirectory(title="Selecciona la carpeta de la campaña")
-
-if not carpeta:
-    print("❌ No se seleccionó ninguna carpeta.")
-    exit()
-
-print(f"📁 Carpeta seleccionada: {carpeta}")
-
-# Cargar CSV
-csv_path = os.path.join(carpeta, "log_Campaña.csv")
-df = pd.read_csv(csv_path, encoding='latin1')
-df['Lat'] = pd.to_numeric(df['Lat'], errors='coerce')
-df['Lon'] = pd.to_numeric(df['Lon'], errors='coerce')
-
-mask = (df['Lat'] < -70) & (df['Lon'] > -40)
-df.loc[mask, ['Lat', 'Lon']] = df.loc[mask, ['Lon', 'Lat']].values
-
-df_validas = df[(df['Lat'] < 0) & (df['Lat'] > -90) & (df['Lon'] < 0) & (df['Lon'] > -75)]
-
-cam1_dir = os.path.join(carpeta, "CAM1")
-cam2_dir = os.path.join(carpeta, "CAM2")
-preview1_dir = os.path.join(carpeta, "CAM1_preview")
-preview2_dir = os.path.join(carpeta, "CAM2_preview")
-
-os.makedirs(preview1_dir, exist_ok=True)
-os.makedirs(preview2_dir, exist_ok=True)
+PREVIEW_MAX = 800                       # Lado máximo del preview (px)
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+MAX_EN_VUELO = 4 * WORKERS              # Tareas enviadas al pool a la vez
+MODO_MAPA = "capa"                      # "capa": una capa GeoJSON + trayectoria (escala a 50k+ fotos)
+                                        # "marcadores": un folium.Marker por foto
+AGRUPAR = True                          # Capa: agrupar puntos (MarkerCluster); False: círculos en canvas
+MANIFIESTO = "manifest.json"            # Caché de entradas/salidas en la carpeta de la campaña
+IMAGENES_EXTERNAS = True                # Marcadores: True enlaza los JPG (carga diferida),
+                                        # False los incrusta en base64 (la capa siempre enlaza)
+TESELAS_LOCALES = True                  # Capa de teselas Esri desde la caché en disco (Prefetch_Tiles.py)
 
 def generar_jpg_si_no_existe(tiff_path, jpg_path):
     if os.path.exists(jpg_path):
-        return
+        return False
     if not os.path.exists(tiff_path):
-        return
+        return False
     try:
-        print(f"🔄 Generando preview: {jpg_path}")
-        img_array = tifffile.imread(tiff_path)
-        img_8bit = (img_array / 16).clip(0, 255).astype(np.uint8)
-        img_pil = Image.fromarray(img_8bit)
-        img_pil.thumbnail((800, 800))
+        img, _ = leer_para_pantalla(tiff_path, PREVIEW_MAX)
+        img_pil = Image.fromarray((img >> 4).clip(0, 255).astype(np.uint8))
+        img_pil.thumbnail((PREVIEW_MAX, PREVIEW_MAX))
         img_pil.save(jpg_path, format="JPEG", quality=70)
+        return True
     except Exception as e:
         print(f"⚠️ Error al convertir {tiff_path} → {e}")
+        return False
+
+# --- Manifiesto de la campaña ---
+def cargar_manifiesto(carpeta):
+    path = os.path.join(carpeta, MANIFIESTO)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Manifiesto inválido, se reconstruye: {e}")
+    return {"version": 1, "frames": {}, "csv": {}, "mapa": {}}
+
+def guardar_manifiesto(carpeta, manifiesto):
+    """Escribe el manifiesto de forma atómica (un corte no lo deja a medias)."""
+    path = os.path.join(carpeta, MANIFIESTO)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifiesto, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def estado_archivo(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def hash_archivo(path, bloque=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+def sin_cambios(previo, path):
+    """True si tamaño y mtime coinciden con lo registrado (no hace falta leerlo)."""
+    return bool(previo) and {k: previo.get(k) for k in ("size", "mtime_ns")} == estado_archivo(path)
+
+def procesar_frame(tiff_path, jpg_path, previo):
+    """
+    Trabajo de un proceso: hash del TIFF y preview si el contenido cambió.
+
+    Si el hash coincide con el registrado (p. ej. el archivo solo se volvió
+    a copiar) y el JPG existe, no se regenera. Devuelve (entrada, generado).
+    """
+    entrada = estado_archivo(tiff_path)
+    entrada["sha1"] = hash_archivo(tiff_path)
+    generado = False
+    if not (previo and previo.get("sha1") == entrada["sha1"] and os.path.exists(jpg_path)):
+        if os.path.exists(jpg_path):
+            os.remove(jpg_path)
+        generado = generar_jpg_si_no_existe(tiff_path, jpg_path)
+    return entrada, generado
+
+def generar_previews(tareas, carpeta, manifiesto, workers=WORKERS, max_en_vuelo=MAX_EN_VUELO):
+    """
+    Genera los previews (tiff, jpg) nuevos o cambiados en un pool de procesos.
+
+    Un frame se salta si su TIFF tiene el mismo tamaño y mtime que en el
+    manifiesto y su preview existe. Mantiene como máximo `max_en_vuelo`
+    tareas enviadas para acotar la memoria, muestra el avance y el ritmo
+    (imágenes/s) y va guardando el manifiesto. Devuelve cuántos previews
+    se generaron.
+    """
+    frames = manifiesto["frames"]
+    rel = lambda p: os.path.relpath(p, carpeta).replace(os.sep, "/")
+    tareas = [(t, j) for t, j in tareas
+              if os.path.exists(t) and not (sin_cambios(frames.get(rel(t)), t) and os.path.exists(j))]
+    total = len(tareas)
+    if not total:
+        print("✅ Todos los previews están al día.")
+        return 0
+    print(f"🔄 Procesando {total} frames nuevos o cambiados con {workers} procesos...")
+    t0 = ultimo = time.time()
+    hechos = generados = 0
+    pendientes = iter(tareas)
+    en_vuelo = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for tiff_path, jpg_path in pendientes:
+                fut = pool.submit(procesar_frame, tiff_path, jpg_path, frames.get(rel(tiff_path)))
+                en_vuelo[fut] = (tiff_path, jpg_path)
+                if len(en_vuelo) >= max_en_vuelo:
+                    break
+            if not en_vuelo:
+                break
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for fut in listos:
+                tiff_path, jpg_path = en_vuelo.pop(fut)
+                entrada, generado = fut.result()
+                entrada["outputs"] = {"preview": rel(jpg_path)}
+                frames[rel(tiff_path)] = entrada
+                hechos += 1
+                generados += generado
+            if time.time() - ultimo >= 2 or hechos == total:
+                ultimo = time.time()
+                ritmo = hechos / max(ultimo - t0, 1e-9)
+                print(f"   {hechos}/{total} ({100*hechos/total:.0f}%) · {ritmo:.1f} img/s")
+                guardar_manifiesto(carpeta, manifiesto)
+    print(f"✅ {generados} previews generados en {time.time() - t0:.1f} s")
+    return generados
 
 def codificar_jpg(path, max_ancho=640):
     if not os.path.exists(path):
@@ -66,42 +154,200 @@ def codificar_jpg(path, max_ancho=640):
     except Exception as e:
         return f"<i>Error al procesar imagen:<br>{e}</i>"
 
-# Convertir imágenes
-for _, row in df.iterrows():
-    tiff1 = os.path.join(cam1_dir, row["Img_cam1"])
-    tiff2 = os.path.join(cam2_dir, row["Img_cam2"])
-    jpg1 = os.path.join(preview1_dir, row["Img_cam1"].replace(".tiff", ".jpg"))
-    jpg2 = os.path.join(preview2_dir, row["Img_cam2"].replace(".tiff", ".jpg"))
-    generar_jpg_si_no_existe(tiff1, jpg1)
-    generar_jpg_si_no_existe(tiff2, jpg2)
-
-# Crear mapa solo si hay coordenadas válidas
-if not df_validas.empty:
-    m = folium.Map(
-        location=[df_validas['Lat'].iloc[0], df_validas['Lon'].iloc[0]],
-        zoom_start=18,
-        max_zoom=22,
-        tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-        attr='Esri — World Imagery'
-    )
-
-    for _, row in df_validas.iterrows():
-        jpg1 = os.path.join(preview1_dir, row["Img_cam1"].replace(".tiff", ".jpg"))
-        jpg2 = os.path.join(preview2_dir, row["Img_cam2"].replace(".tiff", ".jpg"))
-
-        popup_html = (
-            f"<b>CAM1:</b><br>{codificar_jpg(jpg1)}<br><br>"
-            f"<b>CAM2:</b><br>{codificar_jpg(jpg2)}"
-        )
+def enlazar_jpg(path, carpeta, ancho=640):
+    """
+    <img> que apunta al preview con ruta relativa al HTML.
+
+    La ruta va en `data-src`, así el navegador no descarga la imagen hasta
+    que se abre el popup (ver CargaDiferida).
+    """
+    if not os.path.exists(path):
+        return f"<i>Archivo no encontrado:<br>{path}</i>"
+    rel = os.path.relpath(path, carpeta).replace(os.sep, "/")
+    return f'<img data-src="{rel}" width="{ancho}" alt="{os.path.basename(path)}">'
+
+class CargaDiferida(MacroElement):
+    """Carga las imágenes `data-src` de un popup recién al abrirlo."""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this._parent.get_name() }}.on('popupopen', function (e) {
+            e.popup.getElement().querySelectorAll('img[data-src]').forEach(function (img) {
+                img.onload = function () { e.popup.update(); };
+                img.src = img.dataset.src;
+                img.removeAttribute('data-src');
+            });
+        });
+        {% endmacro %}
+    """)
 
-        folium.Marker(
-            location=[row['Lat'], row['Lon']],
-            popup=folium.Popup(popup_html, max_width=700),
-            tooltip=row["Img_cam1"]
-        ).add_to(m)
+    def __init__(self):
+        super().__init__()
+        self._name = "CargaDiferida"
 
+class CapaFotos(JSCSSMixin, MacroElement):
+    """
+    Todas las fotos como una sola capa GeoJSON de círculos dibujados en canvas.
+
+    Con `agrupar` los círculos van en un MarkerCluster con carga por partes.
+    El popup de cada punto se arma recién al abrirlo a partir de las
+    propiedades (rutas relativas de los previews), así el HTML solo lleva
+    coordenadas y nombres.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            var canvas = L.canvas({padding: 0.5});
+            var capa = L.geoJSON({{ this.datos }}, {
+                pointToLayer: function (f, latlng) {
+                    return L.circleMarker(latlng, {renderer: canvas, radius: 5, weight: 1,
+                                                   color: "#ffcc00", fillOpacity: 0.8});
+                },
+                onEachFeature: function (f, layer) {
+                    var p = f.properties;
+                    layer.bindTooltip(p.nombre);
+                    layer.bindPopup(function () {
+                        return "<b>CAM1:</b><br><img src='" + p.img1 + "' width='640'><br><br>" +
+                               "<b>CAM2:</b><br><img src='" + p.img2 + "' width='640'>";
+                    }, {maxWidth: 700});
+                }
+            });
+            {%- if this.agrupar %}
+            return L.markerClusterGroup({chunkedLoading: true}).addLayer(capa)
+                    .addTo({{ this._parent.get_name() }});
+            {%- else %}
+            return capa.addTo({{ this._parent.get_name() }});
+            {%- endif %}
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, geojson, agrupar=True):
+        super().__init__()
+        self._name = "CapaFotos"
+        self.agrupar = agrupar
+        self.datos = json.dumps(geojson, separators=(",", ":")).replace("</", "<\\/")
+
+def geojson_fotos(df, carpeta, preview1_dir, preview2_dir):
+    """FeatureCollection con un punto por foto y las rutas relativas de sus previews."""
+    def rel(d, nombre):
+        return os.path.relpath(os.path.join(d, nombre.replace(".tiff", ".jpg")),
+                               carpeta).replace(os.sep, "/")
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [round(lon, 7), round(lat, 7)]},
+             "properties": {"nombre": img1, "img1": rel(preview1_dir, img1),
+                            "img2": rel(preview2_dir, img2)}}
+            for lat, lon, img1, img2 in zip(df["lat"], df["lon"], df["cam1_img"], df["cam2_img"])
+        ],
+    }
+
+def main():
+    # Selección de carpeta
+    tk.Tk().withdraw()
+    carpeta = filedialog.askdirectory(title="Selecciona la carpeta de la campaña")
+
+    if not carpeta:
+        print("❌ No se seleccionó ninguna carpeta.")
+        return
+
+    print(f"📁 Carpeta seleccionada: {carpeta}")
+
+    # Cargar log (esquema v1 o v2, columnas normalizadas)
+    campana = cargar_campana(carpeta)
+    df = campana.df
+    df_validas = campana.validas()
+    csv_path = campana.csv_path
+
+    preview1_dir = os.path.join(carpeta, "CAM1_preview")
+    preview2_dir = os.path.join(carpeta, "CAM2_preview")
+
+    os.makedirs(preview1_dir, exist_ok=True)
+    os.makedirs(preview2_dir, exist_ok=True)
+
+    # Convertir imágenes
+    tareas = []
+    for cam, preview_dir in (("cam1", preview1_dir), ("cam2", preview2_dir)):
+        tareas += [(tiff_path, os.path.join(preview_dir, nombre.replace(".tiff", ".jpg")))
+                   for tiff_path, nombre in zip(df[f"{cam}_path"], df[f"{cam}_img"]) if nombre]
+    manifiesto = cargar_manifiesto(carpeta)
+    generados = generar_previews(tareas, carpeta, manifiesto)
+
+    # El mapa solo se rehace si cambió el CSV, la configuración o (con JPG
+    # incrustados) algún preview
+    if not sin_cambios(manifiesto["csv"], csv_path):
+        manifiesto["csv"] = dict(estado_archivo(csv_path), sha1=hash_archivo(csv_path))
     output_path = os.path.join(carpeta, "mapa_interactivo.html")
-    m.save(output_path)
-    print(f"✅ Mapa generado: {output_path}")
-else:
-    print("⚠️ No se encontraron coordenadas válidas. Solo se generaron los JPG.")
+    cache = CacheTeselas()
+    capa_local = TESELAS_LOCALES and os.path.isdir(os.path.join(cache.carpeta, "esri"))
+    firma = hashlib.sha1(json.dumps(
+        [manifiesto["csv"]["sha1"], MODO_MAPA, AGRUPAR, IMAGENES_EXTERNAS, capa_local]).encode()).hexdigest()
+    incrusta = MODO_MAPA != "capa" and not IMAGENES_EXTERNAS
+    if (manifiesto["mapa"].get("firma") == firma and os.path.exists(output_path)
+            and not (incrusta and generados)):
+        guardar_manifiesto(carpeta, manifiesto)
+        print(f"✅ Mapa al día, no se regenera: {output_path}")
+        return
+
+    # Crear mapa solo si hay coordenadas válidas
+    if not df_validas.empty:
+        m = folium.Map(
+            location=[df_validas['lat'].iloc[0], df_validas['lon'].iloc[0]],
+            zoom_start=18,
+            max_zoom=22,
+            prefer_canvas=True,
+            tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+            attr='Esri — World Imagery'
+        )
+        # Teselas de la caché encima de las en línea: sin conexión se ven las
+        # precargadas; las que faltan quedan ocultas y se ve la capa de abajo.
+        # Sobre z17 (máximo de la precarga) la capa se oculta y queda la en línea
+        if capa_local:
+            folium.TileLayer(tiles=cache.url_local("esri"), attr='Esri — World Imagery (caché)',
+                             max_zoom=17, control=False).add_to(m)
+
+        if MODO_MAPA == "capa":
+            # Trayectoria como una sola polilínea y fotos como una sola capa
+            folium.PolyLine(df_validas[['lat', 'lon']].round(7).values.tolist(),
+                            color="cyan", weight=2, opacity=0.8).add_to(m)
+            CapaFotos(geojson_fotos(df_validas, carpeta, preview1_dir, preview2_dir),
+                      agrupar=AGRUPAR).add_to(m)
+            m.fit_bounds([[df_validas['lat'].min(), df_validas['lon'].min()],
+                          [df_validas['lat'].max(), df_validas['lon'].max()]])
+        else:
+            if IMAGENES_EXTERNAS:
+                CargaDiferida().add_to(m)
+                imagen = lambda path: enlazar_jpg(path, carpeta)
+            else:
+                imagen = codificar_jpg
+
+            for _, row in df_validas.iterrows():
+                jpg1 = os.path.join(preview1_dir, row["cam1_img"].replace(".tiff", ".jpg"))
+                jpg2 = os.path.join(preview2_dir, row["cam2_img"].replace(".tiff", ".jpg"))
+
+                popup_html = (
+                    f"<b>CAM1:</b><br>{imagen(jpg1)}<br><br>"
+                    f"<b>CAM2:</b><br>{imagen(jpg2)}"
+                )
+
+                folium.Marker(
+                    location=[row['lat'], row['lon']],
+                    popup=folium.Popup(popup_html, max_width=700),
+                    tooltip=row["cam1_img"]
+                ).add_to(m)
+
+        m.save(output_path)
+        manifiesto["mapa"] = {"firma": firma, "output": os.path.basename(output_path)}
+        print(f"✅ Mapa generado: {output_path}")
+        if MODO_MAPA == "capa" or IMAGENES_EXTERNAS:
+            print("   (el HTML enlaza CAM1_preview/ y CAM2_preview/: copiarlos junto al mapa)")
+    else:
+        print("⚠️ No se encontraron coordenadas válidas. Solo se generaron los JPG.")
+    guardar_manifiesto(carpeta, manifiesto)
+
+if __name__ == "__main__":
+    main()
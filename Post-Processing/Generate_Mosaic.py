@@ -0,0 +1,39 @@
+import os
+import numpy as np
+from PIL import Image
+import tkinter as tk
+from tkinter import filedialog
+from vultur.campaign import cargar_campana
+from vultur.mosaic import construir_mosaico
+
+# --- Parámetros ---
+RESOLUCION_M = 0.5      # Tamaño de píxel del mosaico en el suelo (m)
+MEZCLA = "nadir"        # "mean", "max" o "nadir"
+CAMARA = "cam1"
+ALT_SUELO = 0.0         # Cota del terreno (m s.n.m.) para pasar la altura del log a AGL
+VISTA_MAX = 2000        # Lado máximo de la vista rápida PNG (px)
+
+def main():
+    # Selección de carpeta
+    tk.Tk().withdraw()
+    carpeta = filedialog.askdirectory(title="Selecciona la carpeta de la campaña")
+
+    if not carpeta:
+        print("❌ No se seleccionó ninguna carpeta.")
+        return
+
+    campana = cargar_campana(carpeta)
+    salida = os.path.join(carpeta, f"mosaico_{CAMARA}_{MEZCLA}")
+    raster = construir_mosaico(campana, salida, res_m=RESOLUCION_M, mezcla=MEZCLA,
+                               cam=CAMARA, alt_suelo=ALT_SUELO)
+
+    # Vista rápida en escala logarítmica, leyendo el raster con paso
+    paso = max(1, max(raster.shape) // VISTA_MAX)
+    vista = np.log1p(np.nan_to_num(raster[::paso, ::paso], nan=0.0))
+    if vista.max() > 0:
+        vista = vista / vista.max()
+    Image.fromarray((vista * 255).astype(np.uint8)).save(os.path.join(salida, "vista.png"))
+    print(f"🖼️ Vista rápida: {os.path.join(salida, 'vista.png')}")
+
+if __name__ == "__main__":
+    main()
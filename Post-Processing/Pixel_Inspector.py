@@ -1,11 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import tifffile
+import matplotlib.patches as patches
 import tkinter as tk
 from tkinter import filedialog
+from vultur.calibration import para_archivo
+from vultur.frames import FrameDiferido
+from vultur.integral import IntegralTeselas
+from vultur.pyramid import VistaPiramide
 
 # --- Configuración ---
-tamano_ventana = 5  # Tamaño del área cuadrada para promediar (ej. 5x5)
+tamano_ventana = 5  # Tamaño del área cuadrada para promediar (ej. 5x5); +/- o rueda del mouse para cambiarlo
 
 # --- Selector de archivo ---
 root = tk.Tk()
@@ -19,31 +23,56 @@ if not ruta_imagen:
     print("No se seleccionó ninguna imagen.")
     exit()
 
-# --- Cargar imagen y normalizar a [0, 1] si es 12-bit ---
-img = tifffile.imread(ruta_imagen).astype(np.float32)
-if img.max() > 1.0:
-    img /= 4095.0
+# --- Abrir imagen: memmap; se calibra y normaliza a [0, 1] solo lo que se lee ---
+corrector = para_archivo(ruta_imagen)
+if corrector:
+    print(f"Calibrando con {corrector}")
+img = FrameDiferido(ruta_imagen, corrector)
 
 alto, ancho = img.shape
 
+# Imágenes integrales por teselas: solo se leen y guardan las que tocan las ventanas
+integral = IntegralTeselas(img)
+cursor = [ancho // 2, alto // 2]
+
 # --- Función para mostrar el promedio ---
-def mostrar_valor_promedio(event):
-    if event.inaxes:
-        x = int(event.xdata)
-        y = int(event.ydata)
+def mostrar_valor_promedio(event=None):
+    if event is not None:
+        if not event.inaxes:
+            return
+        cursor[0], cursor[1] = int(event.xdata), int(event.ydata)
+    x, y = cursor
+    promedio, desviacion, n, (x1, y1, x2, y2) = integral.ventana(x, y, tamano_ventana)
+    marco.set_bounds(x1 - 0.5, y1 - 0.5, x2 - x1, y2 - y1)
+    ax.set_title(f"({x},{y})  {tamano_ventana}x{tamano_ventana}: {promedio:.4f} ± {desviacion:.4f}")
+    print(f"Cursor en ({x},{y}) → Promedio {tamano_ventana}x{tamano_ventana}: {promedio:.4f} "
+          f"(σ {desviacion:.4f}, {n} px)")
+    fig.canvas.draw_idle()
+
+def cambiar_ventana(paso):
+    global tamano_ventana
+    tamano_ventana = int(np.clip(tamano_ventana + paso, 1, min(alto, ancho)))
+    mostrar_valor_promedio()
 
-        # Calcular ventana centrada
-        mitad = tamano_ventana // 2
-        x1, x2 = max(0, x - mitad), min(ancho, x + mitad + 1)
-        y1, y2 = max(0, y - mitad), min(alto, y + mitad + 1)
+def tecla(event):
+    if event.key in ("+", "="):
+        cambiar_ventana(2)
+    elif event.key in ("-", "_"):
+        cambiar_ventana(-2)
 
-        ventana = img[y1:y2, x1:x2]
-        promedio = np.mean(ventana)
-        print(f"Cursor en ({x},{y}) → Promedio {tamano_ventana}x{tamano_ventana}: {promedio:.4f}")
+def rueda(event):
+    # Pasos proporcionales al tamaño para ir rápido de 5 px a cientos
+    cambiar_ventana((2 if event.button == "up" else -2) * max(1, tamano_ventana // 10))
 
 # --- Mostrar imagen ---
 fig, ax = plt.subplots()
-ax.imshow(img, cmap='gray')
+# Pirámide: solo se dibuja el recorte visible al nivel que corresponde al zoom
+vista = VistaPiramide(ax, img.piramide(), cmap='gray')
+marco = patches.Rectangle((0, 0), tamano_ventana, tamano_ventana, edgecolor='red',
+                          facecolor='none', linewidth=1)
+ax.add_patch(marco)
 ax.set_title(f"{ruta_imagen} ({tamano_ventana}x{tamano_ventana})")
 fig.canvas.mpl_connect('motion_notify_event', mostrar_valor_promedio)
+fig.canvas.mpl_connect('key_press_event', tecla)
+fig.canvas.mpl_connect('scroll_event', rueda)
 plt.show()
@@ -0,0 +1,46 @@
+import math
+import tkinter as tk
+from tkinter import filedialog
+from vultur.campaign import cargar_campana
+from vultur.footprint import EARTH_R
+from vultur.tiles import CacheTeselas
+
+# --- Parámetros (ajustar antes de salir a terreno) ---
+BBOX = (-71.70, -33.10, -71.50, -32.95)   # lon0, lat0, lon1, lat1 si no se elige campaña
+MARGEN_M = 2000                           # Margen alrededor de una campaña previa
+ZOOM_MIN, ZOOM_MAX = 9, 17
+FUENTES = ("osm", "esri")                 # Receptores (osm) y Generate_Map (esri)
+
+def bbox_campana(carpeta):
+    df = cargar_campana(carpeta).validas(cams=())
+    dlat = math.degrees(MARGEN_M / EARTH_R)
+    dlon = math.degrees(MARGEN_M / (EARTH_R * math.cos(math.radians(df["lat"].mean()))))
+    return (df["lon"].min() - dlon, df["lat"].min() - dlat,
+            df["lon"].max() + dlon, df["lat"].max() + dlat)
+
+def main():
+    tk.Tk().withdraw()
+    carpeta = filedialog.askdirectory(title="Campaña previa en el sitio — Cancelar para usar BBOX")
+    bbox = bbox_campana(carpeta) if carpeta else BBOX
+    print(f"📦 Precargando lon {bbox[0]:.4f}…{bbox[2]:.4f}, lat {bbox[1]:.4f}…{bbox[3]:.4f}")
+
+    cache = CacheTeselas()
+    zooms = range(ZOOM_MIN, ZOOM_MAX + 1)
+    # Todas las fuentes comparten la caché: si no caben juntas, las últimas desalojan a las primeras
+    estimado = sum(cache.estimar(bbox, zooms, fuente)[1] for fuente in FUENTES)
+    if estimado > 0.9 * cache.max_bytes:
+        print(f"❌ La precarga ocupa ~{estimado / 2**20:.0f} MB y la caché admite "
+              f"{0.9 * cache.max_bytes / 2**20:.0f} MB: achica BBOX/MARGEN_M o ZOOM_MAX")
+        return
+    print(f"📏 ~{estimado / 2**20:.0f} MB estimados")
+
+    for fuente in FUENTES:
+        nuevas, previas, fallidas = cache.precargar(bbox, zooms, fuente)
+        print(f"✅ {fuente}: {nuevas} nuevas, {previas} ya estaban, {fallidas} fallidas")
+    for fuente in FUENTES:
+        total = cache.estimar(bbox, zooms, fuente)[0]
+        print(f"💾 {fuente}: {cache.presentes(bbox, zooms, fuente)}/{total} teselas en caché")
+    print(f"💾 {cache.uso_mb():.0f} MB en {cache.carpeta}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vultur.campaign import COLUMNAS_FLOAT, cargar_campana
+
+
+def test_columnas_float_con_valores_enteros(tmp_path):
+    (tmp_path / "Campaign_log.csv").write_text(
+        "RTC_time,GPS_time,cam1_img,cam2_img,Latitude,Longitude,Altitude,"
+        "Yaw_deg,Pitch_deg,Roll_deg,GroundSpeed,Climb\n"
+        "2026-01-01 00:00:00,NONE,a.tiff,b.tiff,-33,-71,100,90,0,1,5,0\n"
+        "2026-01-01 00:00:01,NONE,c.tiff,d.tiff,-33,-71,101,91,1,0,6,1\n")
+    for usar_cache in (True, True, False):     # CSV, caché, CSV sin caché
+        df = cargar_campana(str(tmp_path), usar_cache=usar_cache).df
+        for c in COLUMNAS_FLOAT:
+            assert df[c].dtype == "float64", c
+
+
+def test_imagen_faltante_sin_ruta(tmp_path):
+    (tmp_path / "Campaign_log.csv").write_text(
+        "RTC_time,GPS_time,cam1_img,cam2_img,Latitude,Longitude,Altitude,"
+        "Yaw_deg,Pitch_deg,Roll_deg,GroundSpeed,Climb\n"
+        "2026-01-01 00:00:00,NONE,a.tiff,b.tiff,-33,-71,100,90,0,1,5,0\n"
+        "2026-01-01 00:00:01,NONE,c.tiff,NONE,-33,-71,101,91,1,0,6,1\n")
+    campana = cargar_campana(str(tmp_path))
+    assert campana.df["cam2_path"].isna().tolist() == [False, True]
+    assert len(campana.validas()) == 1
+    assert len(campana.validas(cams=("cam1",))) == 2
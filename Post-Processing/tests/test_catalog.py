@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vultur.catalog import agrupar
+
+
+def _observar(lamparas, n_frames, error_m, rng):
+    xy, frames = [], []
+    for f in range(n_frames):
+        for lx, ly in lamparas:
+            xy.append((lx, ly) + rng.uniform(-error_m, error_m, 2))
+            frames.append(f)
+    return np.array(xy), np.array(frames)
+
+
+def _comprobar(etiquetas, frames, n_lamparas, n_frames):
+    assert etiquetas.max() + 1 == n_lamparas
+    for g in range(n_lamparas):
+        # Cada fuente: una detección por frame, de la misma lámpara
+        assert sorted(frames[etiquetas == g]) == list(range(n_frames))
+        assert len(set(np.arange(len(frames))[etiquetas == g] % n_lamparas)) == 1
+
+
+def test_luminarias_encadenadas_no_se_unen():
+    rng = np.random.default_rng(0)
+    xy, frames = _observar([(7.0 * i, 0.0) for i in range(5)], 12, 1.5, rng)
+    _comprobar(agrupar(xy, frames, tol_m=5.0), frames, 5, 12)
+
+
+def test_dos_luminarias_cercanas():
+    rng = np.random.default_rng(1)
+    xy, frames = _observar([(0.0, 0.0), (4.0, 0.0)], 10, 0.5, rng)
+    _comprobar(agrupar(xy, frames, tol_m=5.0), frames, 2, 10)
+
+
+def test_fuente_aislada_sin_repetidos():
+    xy = np.array([[0.0, 0.0], [1.0, 0.0], [100.0, 0.0]])
+    assert agrupar(xy, np.array([0, 1, 1])).tolist() == [0, 0, 1]
@@ -0,0 +1,4 @@
+"""
+Librería de post-procesamiento de VULTUR, compartida por los scripts de
+`Post-Processing/`.
+"""
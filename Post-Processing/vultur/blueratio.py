@@ -0,0 +1,219 @@
+"""
+Fracción azul por bloques para campañas completas.
+
+Para cada par de frames (cámara con filtro azul / cámara sin filtro) se
+suman los DN por bloques de `bloque` x `bloque` píxeles y la fracción azul
+de cada bloque es suma_azul / suma_total. Las sumas se hacen con `reshape`
+sobre franjas del frame mapeado en memoria, así cada proceso tiene en RAM
+solo una franja por cámara y nunca el frame completo en float.
+
+Un bloque es válido si la señal media sin filtro llega a `umbral_dn` y
+ninguna de las dos cámaras tiene píxeles saturados en él. Con un
+`Registro` (`vultur.registration`) el frame azul se remuestrea a la grilla
+del frame sin filtro antes de sumar, y los bloques que quedan en parte
+fuera del frame azul no cuentan. Si hay maestros en la biblioteca de
+`vultur.calibration` para la exposición y ganancia de la campaña, los
+frames se corrigen (dark, flat y píxeles malos) antes de sumar.
+
+Por frame se escribe un raster float32 de fracciones (NaN en bloques no
+válidos) en `<salida>/<cam total>_img`.tif, y para la campaña un CSV con
+estadísticas por frame y un JSON con el resumen y el histograma global.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+import tifffile
+
+from vultur import calibration, registration
+from vultur.frames import leer_nivel
+
+SATURACION = 4095
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+HIST_BORDES = np.linspace(0.0, 1.5, 151)   # Fracciones > 1 indican desalineación o ruido
+VERIFICAR_CADA = 50     # Cada cuántos pares se mide el residuo del registro
+
+def bloques(img, bloque, filas=512, corrector=None):
+    """
+    Suma y máximo por bloques de una imagen (uint16, memmap o float con NaN).
+
+    Recorre la imagen por franjas de ~`filas` filas para acotar la memoria.
+    Con un `calibration.Corrector`, cada franja cruda se corrige por separado
+    (saturados en NaN), así el frame corregido nunca está completo en RAM.
+    Devuelve (sumas, máximos) de forma (alto // bloque, ancho // bloque), con
+    sumas uint64 para enteros y float64 (NaN si el bloque tiene NaN) para
+    float; el borde que no completa un bloque se descarta.
+    """
+    nh, nw = img.shape[0] // bloque, img.shape[1] // bloque
+    flotante = corrector is not None or np.issubdtype(img.dtype, np.floating)
+    tipo = np.float64 if flotante else np.uint64
+    sumas = np.empty((nh, nw), tipo)
+    maximos = np.empty((nh, nw), np.float32 if corrector is not None else img.dtype)
+    paso = max(1, filas // bloque)
+    if corrector is not None:
+        buffer = np.empty((paso * bloque, nw * bloque), np.float32)   # una franja corregida
+    for i in range(0, nh, paso):
+        k = min(paso, nh - i)
+        region = (slice(i*bloque, (i+k)*bloque), slice(0, nw*bloque))
+        franja = img[region]
+        if corrector is not None:
+            franja = corrector.aplicar(franja, saturados_nan=True, region=region,
+                                       forma=img.shape, out=buffer[:k*bloque])
+        franja = np.asarray(franja).reshape(k, bloque, nw, bloque)
+        sumas[i:i+k] = franja.sum(axis=(1, 3), dtype=tipo)
+        maximos[i:i+k] = franja.max(axis=(1, 3))
+    return sumas, maximos
+
+def fraccion_azul(path_azul, path_total, bloque=200, umbral_dn=64.0, transformacion=None,
+                  correctores=(None, None)):
+    """
+    Raster float32 de fracción azul por bloque (NaN en bloques no válidos).
+
+    `transformacion` son los parámetros de `vultur.registration` que llevan
+    la cámara sin filtro a la azul; None compara los frames tal cual.
+    `correctores` son los `calibration.Corrector` (azul, total) o None; los
+    píxeles saturados de un frame corregido quedan en NaN e invalidan su bloque.
+    """
+    corr_azul, corr_total = correctores
+    total = leer_nivel(path_total)
+    if transformacion is None:
+        suma_a, max_a = bloques(leer_nivel(path_azul), bloque, corrector=corr_azul)
+    else:
+        azul = registration.alinear(path_azul, transformacion, total.shape, corr_azul)
+        suma_a, max_a = bloques(azul, bloque)
+    suma_t, max_t = bloques(total, bloque, corrector=corr_total)
+    if suma_a.shape != suma_t.shape:
+        raise ValueError(f"Tamaños distintos: {suma_a.shape} vs {suma_t.shape}")
+    with np.errstate(invalid="ignore"):
+        validos = (suma_t >= umbral_dn * bloque * bloque) & ~np.isnan(suma_a)
+        # Corregido, un saturado ya es NaN en la suma; el máximo tras el flat
+        # puede pasar de SATURACION en esquinas viñeteadas sin estar saturado
+        for maximos, corrector in ((max_a, corr_azul), (max_t, corr_total)):
+            if corrector is None:
+                validos &= maximos < SATURACION
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraccion = np.where(validos, suma_a / suma_t, np.nan).astype(np.float32)
+    return fraccion, suma_a, suma_t, validos
+
+def procesar_par(path_azul, path_total, destino, bloque=200, umbral_dn=64.0,
+                 transformacion=None, verificar=False, correctores=(None, None)):
+    """
+    Trabajo de un proceso: calcula y escribe el raster de un par.
+
+    Devuelve las estadísticas del frame, su histograma de fracciones y las
+    sumas azul/total; con `verificar`, las estadísticas incluyen el residuo
+    del registro en px nativos.
+    """
+    fraccion, suma_a, suma_t, validos = fraccion_azul(path_azul, path_total, bloque,
+                                                      umbral_dn, transformacion, correctores)
+    tifffile.imwrite(destino, fraccion, metadata={"bloque": bloque, "umbral_dn": umbral_dn})
+
+    v = fraccion[validos]
+    stats = {"bloques": int(fraccion.size), "bloques_validos": int(v.size),
+             "senal_total_dn": float(suma_t.sum()) / (suma_t.size * bloque * bloque)}
+    if v.size:
+        # Fracción global = cociente de sumas (pondera por señal); el resto por bloque
+        stats["fraccion"] = float(suma_a[validos].sum()) / float(suma_t[validos].sum())
+        stats["mediana"] = float(np.median(v))
+        stats["p10"], stats["p90"] = (float(p) for p in np.percentile(v, [10, 90]))
+    else:
+        stats["fraccion"] = stats["mediana"] = stats["p10"] = stats["p90"] = np.nan
+    if verificar and transformacion is not None:
+        stats["residuo_px"] = registration.residuo(path_total, path_azul, transformacion)
+    hist = np.histogram(np.clip(v, HIST_BORDES[0], HIST_BORDES[-1]), HIST_BORDES)[0]
+    azul_total = (float(suma_a[validos].sum()), float(suma_t[validos].sum()))
+    return stats, hist, azul_total
+
+def blue_ratio_campana(campana, salida=None, bloque=200, umbral_dn=64.0,
+                       cam_azul="cam2", cam_total="cam1", registro=None, calibrar=True,
+                       workers=WORKERS, max_en_vuelo=None):
+    """
+    Fracción azul de todos los pares de una `Campana`.
+
+    Escribe los rasters en `salida` (por defecto `<campaña>/blue_ratio`),
+    `blue_ratio.csv` con una fila por par y `blue_ratio.json` con el resumen.
+    Con un `Registro` (referencia `cam_total`, móvil `cam_azul`) los pares se
+    alinean; cada `VERIFICAR_CADA` pares se mide el residuo y, si supera
+    `registration.TOL_RESIDUO_PX`, el registro se re-estima desde ese frame.
+    Con `calibrar` se usan los maestros de calibración si existen.
+    Devuelve el DataFrame de estadísticas por frame.
+    """
+    salida = salida or os.path.join(campana.carpeta, "blue_ratio")
+    max_en_vuelo = max_en_vuelo or 2 * workers
+    os.makedirs(salida, exist_ok=True)
+
+    df = campana.df
+    pares = df[[a is not None and t is not None and os.path.exists(a) and os.path.exists(t)
+                for a, t in zip(df[f"{cam_azul}_path"], df[f"{cam_total}_path"])]]
+    if pares.empty:
+        raise ValueError("No hay pares de frames con ambos archivos")
+
+    correctores = ((calibration.para_campana(campana, cam_azul),
+                    calibration.para_campana(campana, cam_total)) if calibrar else (None, None))
+    print(f"🎚️ Calibración: {correctores[0] or 'no'} / {correctores[1] or 'no'}")
+
+    filas, hist = {}, np.zeros(len(HIST_BORDES) - 1, np.int64)
+    suma_azul = suma_total = 0.0
+    total, hechos, t0, ultimo = len(pares), 0, time.time(), time.time()
+    print(f"🔵 Fracción azul de {total} pares en bloques de {bloque} px con {workers} procesos...")
+
+    pendientes = iter(pares.iterrows())
+    en_vuelo, enviados = {}, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for idx, fila in pendientes:
+                nombre = os.path.splitext(fila[f"{cam_total}_img"])[0] + ".tif"
+                t = registro.transformacion(idx) if registro else None
+                enviados += 1
+                fut = pool.submit(procesar_par, fila[f"{cam_azul}_path"], fila[f"{cam_total}_path"],
+                                  os.path.join(salida, nombre), bloque, umbral_dn,
+                                  t, enviados % VERIFICAR_CADA == 1, correctores)
+                en_vuelo[fut] = (idx, nombre)
+                if len(en_vuelo) >= max_en_vuelo:
+                    break
+            if not en_vuelo:
+                break
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for fut in listos:
+                idx, nombre = en_vuelo.pop(fut)
+                try:
+                    stats, h, (a, t) = fut.result()
+                except Exception as e:
+                    print(f"⚠️ Par omitido ({nombre}): {e}")
+                    continue
+                filas[idx] = {"raster": nombre, **stats}
+                if stats.get("residuo_px", 0) > registration.TOL_RESIDUO_PX:
+                    print(f"⚠️ Residuo de registro {stats['residuo_px']:.1f} px en el frame {idx}")
+                    registro.refinar(campana, idx)
+                hist += h
+                suma_azul += a
+                suma_total += t
+                hechos += 1
+            if time.time() - ultimo >= 2 or not en_vuelo:
+                ultimo = time.time()
+                print(f"   {hechos}/{total} pares · {hechos / max(ultimo - t0, 1e-9):.1f} pares/s")
+
+    columnas = ["cam1_img", "cam2_img", "lat", "lon", "alt", "gps_time"]
+    res = pares[columnas].join(pd.DataFrame.from_dict(filas, orient="index"), how="inner")
+    res.to_csv(os.path.join(salida, "blue_ratio.csv"), index_label="frame")
+
+    resumen = {
+        "campana": os.path.basename(campana.carpeta),
+        "cam_azul": cam_azul, "cam_total": cam_total,
+        "bloque": bloque, "umbral_dn": umbral_dn, "registrado": registro is not None,
+        "calibrado": [c is not None for c in correctores],
+        "pares": int(len(res)), "pares_omitidos": int(total - len(res)),
+        "bloques_validos": int(res["bloques_validos"].sum()) if len(res) else 0,
+        "fraccion": suma_azul / suma_total if suma_total else None,
+        "mediana_frames": float(res["fraccion"].median()) if len(res) else None,
+        "histograma": {"bordes": HIST_BORDES.round(4).tolist(), "cuentas": hist.tolist()},
+    }
+    with open(os.path.join(salida, "blue_ratio.json"), "w") as f:
+        json.dump(resumen, f, indent=2)
+    print(f"✅ Fracción azul de la campaña: {resumen['fraccion']} "
+          f"({len(res)} pares, {time.time() - t0:.1f} s) → {salida}")
+    return res
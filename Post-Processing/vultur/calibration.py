@@ -0,0 +1,315 @@
+"""
+Calibración radiométrica: dark, flat y píxeles calientes.
+
+Las capturas de calibración son carpetas con el mismo formato que una
+campaña (`CAM1/`, `CAM2/`, `Parameters.json`): darks con la tapa puesta a
+la exposición y ganancia de vuelo, y flats de una superficie uniforme.
+Con ellas se construyen, por cámara:
+
+- un dark maestro por (exposición, ganancia): mediana píxel a píxel;
+- un flat maestro normalizado a mediana 1, de los flats menos su dark;
+- una máscara de píxeles calientes (dark muy sobre el resto) y muertos
+  (flat muy bajo).
+
+Las medianas se apilan por franjas de filas leídas de los TIFF mapeados en
+memoria, así la memoria queda acotada por `MAX_MB` y no por el número de
+frames. Los maestros se guardan como TIFF float32 en `CALIB_DIR` con un
+índice `calibracion.json`; si las capturas no cambiaron se reutilizan.
+
+`Corrector` aplica (img - dark) / flat en float32 y reemplaza los píxeles
+de la máscara por el promedio de sus vecinos válidos. Guarda solo rutas,
+así se puede pasar a los procesos de un pool; los maestros se cargan una
+vez por proceso. Para frames reducidos (overviews) usa los maestros
+promediados por bloques al mismo tamaño.
+"""
+
+import json
+import os
+
+import numpy as np
+import tifffile
+
+from vultur.frames import leer_nivel
+
+CALIB_DIR = os.path.join(os.path.expanduser("~"), "VULTUR_calibracion")
+INDICE = "calibracion.json"
+MAX_MB = 256            # Memoria para apilar una franja de todos los frames
+K_CALIENTE = 8.0        # Sigmas (MAD) sobre la mediana del dark para marcar un píxel
+FLAT_MIN = 0.2          # Respuesta relativa mínima; por debajo el píxel se considera muerto
+SATURACION = 4095
+
+# --- Apilado ---
+def mediana_por_franjas(paths, restar=None, normas=None, max_mb=MAX_MB):
+    """
+    Mediana píxel a píxel (float32) de los frames en `paths`.
+
+    Opcionalmente a cada frame se le resta `restar` (arreglo del tamaño del
+    frame) y se divide por su valor en `normas`.
+    """
+    imgs = [leer_nivel(p) for p in paths]
+    alto, ancho = imgs[0].shape
+    filas = max(1, int(max_mb * 2**20 // (4 * len(imgs) * ancho)))
+    master = np.empty((alto, ancho), np.float32)
+    for y in range(0, alto, filas):
+        pila = np.stack([np.asarray(im[y:y+filas], np.float32) for im in imgs])
+        if restar is not None:
+            pila -= restar[y:y+filas]
+        if normas is not None:
+            pila /= np.asarray(normas, np.float32)[:, None, None]
+        master[y:y+filas] = np.median(pila, axis=0)
+    return master
+
+def _mad(a):
+    med = np.median(a)
+    return med, 1.4826 * np.median(np.abs(a - med))
+
+# --- Biblioteca ---
+def cargar_indice(calib_dir=CALIB_DIR):
+    path = os.path.join(calib_dir, INDICE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"dark": [], "flat": []}
+
+def guardar_indice(indice, calib_dir=CALIB_DIR):
+    path = os.path.join(calib_dir, INDICE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(indice, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _captura(carpeta, cam):
+    """(frames, exposición en us, ganancia, firma) de una captura de calibración."""
+    with open(os.path.join(carpeta, "Parameters.json")) as f:
+        meta = json.load(f)
+    sub = os.path.join(carpeta, cam.upper())
+    paths = sorted(os.path.join(sub, n) for n in os.listdir(sub)
+                   if n.lower().endswith((".tif", ".tiff")))
+    if not paths:
+        raise FileNotFoundError(f"No hay frames en {sub}")
+    firma = [[os.path.basename(p), os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in paths]
+    return paths, float(meta["ExposureTime_us"]), float(meta["Gain"]), firma
+
+def construir_dark(carpeta, cam="cam1", calib_dir=CALIB_DIR):
+    """Dark maestro y máscara de píxeles calientes de una captura; devuelve la entrada del índice."""
+    paths, exp_us, gain, firma = _captura(carpeta, cam)
+    indice = cargar_indice(calib_dir)
+    for e in indice["dark"]:
+        if e["cam"] == cam and e["firma"] == firma:
+            return e
+
+    os.makedirs(calib_dir, exist_ok=True)
+    print(f"🌑 Dark maestro {cam.upper()} {exp_us:.0f} us, {gain} dB con {len(paths)} frames...")
+    dark = mediana_por_franjas(paths)
+    med, sig = _mad(dark[::4, ::4])
+    caliente = dark > med + K_CALIENTE * max(sig, 1.0)
+
+    base = f"dark_{cam}_{exp_us:.0f}us_{gain:g}dB"
+    tifffile.imwrite(os.path.join(calib_dir, base + ".tif"), dark)
+    tifffile.imwrite(os.path.join(calib_dir, base + "_hot.tif"), caliente.astype(np.uint8))
+    entrada = {"cam": cam, "exp_us": exp_us, "gain": gain, "archivo": base + ".tif",
+               "hot": base + "_hot.tif", "n": len(paths), "calientes": int(caliente.sum()),
+               "fuente": os.path.abspath(carpeta), "firma": firma}
+    indice["dark"] = [e for e in indice["dark"]
+                      if not (e["cam"] == cam and e["exp_us"] == exp_us and e["gain"] == gain)]
+    indice["dark"].append(entrada)
+    guardar_indice(indice, calib_dir)
+    print(f"   {entrada['calientes']} píxeles calientes")
+    return entrada
+
+def construir_flat(carpeta, cam="cam1", calib_dir=CALIB_DIR):
+    """Flat maestro (mediana 1) de una captura, restando el dark correspondiente."""
+    paths, exp_us, gain, firma = _captura(carpeta, cam)
+    indice = cargar_indice(calib_dir)
+    for e in indice["flat"]:
+        if e["cam"] == cam and e["firma"] == firma:
+            return e
+
+    os.makedirs(calib_dir, exist_ok=True)
+    print(f"⬜ Flat maestro {cam.upper()} con {len(paths)} frames...")
+    corrector = Corrector.buscar(cam, exp_us, gain, calib_dir, flat=False)
+    dark = corrector.dark((0, 0)) if corrector else None
+    # Cada flat se normaliza por su mediana (muestreada) antes de apilar
+    normas = []
+    for p in paths:
+        muestra = np.asarray(leer_nivel(p)[::8, ::8], np.float32)
+        if dark is not None:
+            muestra -= dark[::8, ::8][:muestra.shape[0], :muestra.shape[1]]
+        normas.append(max(float(np.median(muestra)), 1.0))
+    flat = mediana_por_franjas(paths, restar=dark, normas=normas)
+    flat /= np.median(flat)
+    muerto = flat < FLAT_MIN
+    flat[muerto] = 1.0
+
+    base = f"flat_{cam}"
+    tifffile.imwrite(os.path.join(calib_dir, base + ".tif"), flat)
+    tifffile.imwrite(os.path.join(calib_dir, base + "_dead.tif"), muerto.astype(np.uint8))
+    entrada = {"cam": cam, "archivo": base + ".tif", "dead": base + "_dead.tif",
+               "n": len(paths), "muertos": int(muerto.sum()), "con_dark": dark is not None,
+               "fuente": os.path.abspath(carpeta), "firma": firma}
+    indice["flat"] = [e for e in indice["flat"] if e["cam"] != cam] + [entrada]
+    guardar_indice(indice, calib_dir)
+    print(f"   {entrada['muertos']} píxeles muertos")
+    return entrada
+
+# --- Aplicación ---
+_cache = {}
+
+def _cargar(path):
+    if path not in _cache:
+        _cache[path] = tifffile.imread(path)
+    return _cache[path]
+
+def _reducir(a, forma):
+    """Promedio por bloques de un maestro float al tamaño de un overview."""
+    f = a.shape[0] // forma[0]
+    if f <= 1:
+        return a
+    h, w = forma
+    return a[:h*f, :w*f].reshape(h, f, w, f).mean(axis=(1, 3), dtype=np.float32)
+
+class Corrector:
+    """
+    Corrección de una cámara a una exposición y ganancia.
+
+    `darks` es una lista de (exposición us, ruta): con una sola se usa tal
+    cual; con dos, el dark se interpola (o extrapola) lineal en la
+    exposición, que separa bias y corriente oscura.
+    """
+    def __init__(self, cam, exp_us, darks, flat=None, mascaras=(), calib_dir=CALIB_DIR):
+        self.cam, self.exp_us = cam, exp_us
+        self.darks, self.flat_path = darks, flat
+        self.mascaras, self.calib_dir = list(mascaras), calib_dir
+
+    def __repr__(self):
+        return (f"<Corrector {self.cam} {self.exp_us:.0f} us, {len(self.darks)} dark(s), "
+                f"flat={'sí' if self.flat_path else 'no'}>")
+
+    @classmethod
+    def buscar(cls, cam, exp_us, gain, calib_dir=CALIB_DIR, flat=True):
+        """Corrector con los maestros de la biblioteca para esos parámetros, o None."""
+        indice = cargar_indice(calib_dir)
+        darks = [e for e in indice["dark"] if e["cam"] == cam and abs(e["gain"] - gain) < 0.05]
+        if not darks:
+            return None
+        darks.sort(key=lambda e: abs(e["exp_us"] - exp_us))
+        if abs(darks[0]["exp_us"] - exp_us) > 0.01 * exp_us and len(darks) > 1:
+            usados = darks[:2]
+        else:
+            usados = darks[:1]
+            if abs(darks[0]["exp_us"] - exp_us) > 0.01 * exp_us:
+                print(f"⚠️ Dark de {darks[0]['exp_us']:.0f} us para {exp_us:.0f} us ({cam})")
+        mascaras = [usados[0]["hot"]]
+        f = None
+        if flat:
+            f = next((e for e in indice["flat"] if e["cam"] == cam), None)
+            if f:
+                mascaras.append(f["dead"])
+        return cls(cam, exp_us, [(e["exp_us"], e["archivo"]) for e in usados],
+                   f["archivo"] if f else None, mascaras, calib_dir)
+
+    def _ruta(self, nombre):
+        return os.path.join(self.calib_dir, nombre)
+
+    def dark(self, forma):
+        """Dark para esta exposición, al tamaño `forma` ((0, 0) = nativo)."""
+        clave = ("dark", tuple(self.darks), self.exp_us, forma)
+        if clave not in _cache:
+            (e1, p1), *resto = self.darks
+            d = _cargar(self._ruta(p1))
+            if resto:
+                e2, p2 = resto[0]
+                d = d + (_cargar(self._ruta(p2)) - d) * np.float32((self.exp_us - e1) / (e2 - e1))
+            _cache[clave] = d if forma == (0, 0) else _reducir(d, forma)
+        return _cache[clave]
+
+    def _flat(self, forma):
+        if self.flat_path is None:
+            return None
+        clave = ("flat", self.flat_path, forma)
+        if clave not in _cache:
+            _cache[clave] = _reducir(_cargar(self._ruta(self.flat_path)), forma)
+        return _cache[clave]
+
+    def _malos(self):
+        """Índices (y, x) de píxeles calientes o muertos, a resolución nativa."""
+        clave = ("malos", tuple(self.mascaras))
+        if clave not in _cache:
+            m = np.zeros_like(_cargar(self._ruta(self.mascaras[0])), bool)
+            for p in self.mascaras:
+                m |= _cargar(self._ruta(p)).astype(bool)
+            _cache[clave] = (np.nonzero(m), m)
+        return _cache[clave]
+
+    def aplicar(self, img, saturados_nan=False, region=None, forma=None, out=None):
+        """
+        Frame corregido en float32: (img - dark) / flat, con los píxeles malos
+        reemplazados. Con `saturados_nan`, los píxeles saturados en el crudo
+        quedan en NaN para que no entren en sumas.
+
+        Si `img` es solo un recorte, `region` (tupla de cortes) lo ubica en
+        un nivel de forma `forma`; dark, flat y máscaras se recortan igual.
+        `out` es un buffer float32 de la forma de `img` donde se escribe el
+        resultado (puede ser el mismo `img` si ya es float32, para corregir
+        en el lugar); sin él se crea uno nuevo.
+        """
+        crudo = np.asarray(img)
+        saturados = crudo >= SATURACION if saturados_nan else None
+        if out is None:
+            out = crudo.astype(np.float32)
+        elif out is not crudo:
+            out[...] = crudo
+        forma = tuple(forma or out.shape)
+        region = region or (slice(None), slice(None))
+        nativo = self.dark((0, 0)).shape == forma
+        out -= self.dark((0, 0) if nativo else forma)[region]
+        flat = self._flat(forma)
+        if flat is not None:
+            out /= flat[region]
+        if nativo:
+            self._reparar(out, region)
+        if saturados_nan:
+            out[saturados] = np.nan
+        return out
+
+    def _reparar(self, out, region):
+        """Píxeles malos = promedio de sus 4 vecinos que no son malos (dentro del recorte)."""
+        (yy, xx), malo = self._malos()
+        if malo.shape != out.shape:
+            malo = malo[region]
+            yy, xx = np.nonzero(malo)
+        if not len(yy):
+            return
+        h, w = out.shape
+        suma = np.zeros(len(yy), np.float32)
+        n = np.zeros(len(yy), np.float32)
+        for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            y, x = np.clip(yy + dy, 0, h - 1), np.clip(xx + dx, 0, w - 1)
+            ok = ~malo[y, x]
+            suma += np.where(ok, out[y, x], 0)
+            n += ok
+        out[yy, xx] = np.where(n > 0, suma / np.maximum(n, 1), out[yy, xx])
+
+def para_campana(campana, cam="cam1", calib_dir=CALIB_DIR):
+    """Corrector para una cámara de una `Campana`, o None si no hay dark que sirva."""
+    meta = campana.meta
+    if "ExposureTime_us" not in meta or "Gain" not in meta:
+        return None
+    return Corrector.buscar(cam, float(meta["ExposureTime_us"]), float(meta["Gain"]), calib_dir)
+
+def para_archivo(path, calib_dir=CALIB_DIR):
+    """Corrector para un frame suelto, deducido de `<campaña>/CAMx/frame.tiff`; o None."""
+    sub = os.path.dirname(os.path.abspath(path))
+    params = os.path.join(os.path.dirname(sub), "Parameters.json")
+    if not os.path.exists(params):
+        return None
+    with open(params) as f:
+        meta = json.load(f)
+    if "ExposureTime_us" not in meta or "Gain" not in meta:
+        return None
+    return Corrector.buscar(os.path.basename(sub).lower(), float(meta["ExposureTime_us"]),
+                            float(meta["Gain"]), calib_dir)
+
+def leer(path, corrector=None, saturados_nan=False):
+    """Frame completo: crudo (uint16, memmap si se puede) o corregido en float32."""
+    img = leer_nivel(path)
+    return corrector.aplicar(img, saturados_nan) if corrector else img
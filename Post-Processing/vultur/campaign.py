@@ -0,0 +1,155 @@
+"""
+Carga de campañas VULTUR.
+
+Una campaña es la carpeta que escribe `capturar_imagenes_gps.py`:
+`CAM1/`, `CAM2/`, el log CSV y `Parameters.json`. Hay dos esquemas de log:
+
+- v1: `log_Campaña.csv` (latin1) con `Lat`, `Lon`, `Img_cam1`, `Img_cam2`;
+  en algunos logs lat/lon vienen invertidas.
+- v2: `Campaign_log.csv` con `RTC_time`, `GPS_time`, `cam1_img`, `cam2_img`,
+  `Latitude`, `Longitude`, `Altitude`, `Yaw_deg`, `Pitch_deg`, `Roll_deg`,
+  `GroundSpeed`, `Climb`, y "NONE" cuando no hay dato.
+
+`cargar_campana` detecta el esquema (por `Log_schema` en `Parameters.json`,
+o por el nombre y las columnas del CSV) y entrega siempre las mismas
+columnas tipadas, con NaN/NaT en lugar de "NONE" y las rutas absolutas de
+los frames (None si el log no tiene nombre de imagen). El resultado se guarda en `Campaign_log.pkl` y se reutiliza
+mientras el CSV no cambie.
+"""
+
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+CACHE = "Campaign_log.pkl"
+CACHE_VERSION = 3   # Subir si cambia el formato de las columnas normalizadas
+
+# Esquema: (nombre del CSV, encoding, columnas originales -> normalizadas)
+ESQUEMAS = {
+    1: ("log_Campaña.csv", "latin1", {
+        "Lat": "lat", "Lon": "lon",
+        "Img_cam1": "cam1_img", "Img_cam2": "cam2_img",
+    }),
+    2: ("Campaign_log.csv", "utf-8", {
+        "RTC_time": "rtc_time", "GPS_time": "gps_time",
+        "cam1_img": "cam1_img", "cam2_img": "cam2_img",
+        "Latitude": "lat", "Longitude": "lon", "Altitude": "alt",
+        "Yaw_deg": "yaw", "Pitch_deg": "pitch", "Roll_deg": "roll",
+        "GroundSpeed": "ground_speed", "Climb": "climb",
+    }),
+}
+
+COLUMNAS_FLOAT = ["lat", "lon", "alt", "yaw", "pitch", "roll", "ground_speed", "climb"]
+COLUMNAS_TIEMPO = ["rtc_time", "gps_time"]
+COLUMNAS = COLUMNAS_TIEMPO + ["cam1_img", "cam2_img"] + COLUMNAS_FLOAT + ["cam1_path", "cam2_path"]
+
+class Campana:
+    """
+    Log de una campaña con columnas normalizadas.
+
+    Atributos: `carpeta`, `esquema` (1 o 2), `csv_path`, `meta` (contenido de
+    `Parameters.json`, {} si no existe) y `df` con las columnas `COLUMNAS`.
+    """
+    def __init__(self, carpeta, esquema, csv_path, meta, df):
+        self.carpeta, self.esquema, self.csv_path = carpeta, esquema, csv_path
+        self.meta, self.df = meta, df
+
+    def __len__(self):
+        return len(self.df)
+
+    def __repr__(self):
+        return f"<Campana {os.path.basename(self.carpeta)!r} v{self.esquema}, {len(self)} frames>"
+
+    def escala(self):
+        """Factor DN -> DN / s normalizado por ganancia, con la exposición y ganancia de `meta`."""
+        exp_s = float(self.meta.get("ExposureTime_us", 1e6)) * 1e-6
+        return 1.0 / (exp_s * 10 ** (float(self.meta.get("Gain", 0.0)) / 20))
+
+    def validas(self, cams=("cam1", "cam2")):
+        """
+        Filas con coordenadas utilizables (sin NaN, en rango y distintas de 0,0)
+        y con imagen en cada cámara de `cams`.
+        """
+        lat, lon = self.df["lat"], self.df["lon"]
+        ok = (lat.between(-90, 90) & lon.between(-180, 180) & ~((lat == 0) & (lon == 0)))
+        for cam in cams:
+            ok &= self.df[f"{cam}_path"].notna()
+        return self.df[ok]
+
+def _leer_meta(carpeta):
+    path = os.path.join(carpeta, "Parameters.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def detectar_esquema(carpeta, meta=None):
+    """Devuelve (esquema, ruta del CSV)."""
+    meta = _leer_meta(carpeta) if meta is None else meta
+    if "Log_schema" in meta:
+        v = int(meta["Log_schema"])
+        return v, os.path.join(carpeta, ESQUEMAS[v][0])
+    for v, (nombre, encoding, columnas) in sorted(ESQUEMAS.items(), reverse=True):
+        path = os.path.join(carpeta, nombre)
+        if os.path.exists(path):
+            with open(path, encoding=encoding) as f:
+                cabecera = f.readline().strip().split(",")
+            col_img = next(k for k, n in columnas.items() if n == "cam1_img")
+            if col_img in cabecera:
+                return v, path
+    raise FileNotFoundError(f"No hay log de campaña reconocible en {carpeta}")
+
+def _normalizar(df, esquema, carpeta):
+    _, _, columnas = ESQUEMAS[esquema]
+    df = df.rename(columns=columnas)
+    for c in COLUMNAS_FLOAT:
+        df[c] = (pd.to_numeric(df[c], errors="coerce").astype("float64") if c in df else
+                 np.nan)
+    for c in COLUMNAS_TIEMPO:
+        df[c] = (pd.to_datetime(df[c], errors="coerce", utc=True) if c in df else
+                 pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]"))
+
+    if esquema == 1:
+        # Logs v1 con lat/lon invertidas (lat < -70 no existe en Chile continental)
+        inv = (df["lat"] < -70) & (df["lon"] > -40)
+        df.loc[inv, ["lat", "lon"]] = df.loc[inv, ["lon", "lat"]].values
+
+    for cam in ("cam1", "cam2"):
+        nombres = df[f"{cam}_img"].fillna("").astype(str)
+        df[f"{cam}_img"] = nombres
+        df[f"{cam}_path"] = pd.Series([os.path.join(carpeta, cam.upper(), n) if n else None
+                                       for n in nombres], index=df.index, dtype=object)
+    return df[COLUMNAS].reset_index(drop=True)
+
+def cargar_campana(carpeta, usar_cache=True):
+    """Carga la campaña de `carpeta` (ver docstring del módulo)."""
+    carpeta = os.path.abspath(carpeta)
+    meta = _leer_meta(carpeta)
+    esquema, csv_path = detectar_esquema(carpeta, meta)
+    st = os.stat(csv_path)
+    firma = [CACHE_VERSION, esquema, st.st_size, st.st_mtime_ns, carpeta]
+
+    cache_path = os.path.join(carpeta, CACHE)
+    if usar_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                guardado = pickle.load(f)
+            if guardado["firma"] == firma:
+                return Campana(carpeta, esquema, csv_path, meta, guardado["df"])
+        except Exception as e:
+            print(f"⚠️ Caché de campaña inválida, se relee el CSV: {e}")
+
+    df = pd.read_csv(csv_path, encoding=ESQUEMAS[esquema][1], dtype=str,
+                     keep_default_na=False, na_values=["NONE", ""])
+    df = _normalizar(df, esquema, carpeta)
+    if usar_cache:
+        try:
+            with open(cache_path + ".tmp", "wb") as f:
+                pickle.dump({"firma": firma, "df": df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            print(f"⚠️ No se pudo escribir la caché de campaña: {e}")
+    return Campana(carpeta, esquema, csv_path, meta, df)
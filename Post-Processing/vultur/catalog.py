@@ -0,0 +1,175 @@
+"""
+Catálogo de fuentes únicas de una campaña.
+
+Con frames solapados la misma luminaria aparece en muchas imágenes. Cada
+detección del catálogo por frame (`vultur.sources`) se lleva al suelo con
+la homografía de la huella de su frame (`vultur.footprint`), en metros
+sobre un plano tangente local. Las detecciones a menos de `tol_m` se unen
+con un KD-tree (`scipy.spatial.cKDTree.query_pairs`, sin comparar todos
+contra todos) y componentes conexas del grafo de pares. Dos detecciones
+del mismo frame son fuentes distintas: una componente que las junta a
+través de terceras (luminarias vecinas encadenadas) se separa asignando
+cada detección al centroide más cercano, con una por frame y grupo.
+
+Cada grupo es una fuente física con su posición (promedio ponderado por
+flujo), dispersión, número de observaciones y fotometría agregada.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from vultur import footprint
+from vultur.frames import niveles
+from vultur.mosaic import a_metros, homografia
+
+def a_suelo(catalogo, campana, cam="cam1", alt_suelo=0.0):
+    """
+    Agrega a `catalogo` las columnas `lon`, `lat` de cada detección.
+
+    Las detecciones de frames sin posición, altura o archivo se descartan.
+    Devuelve (catálogo, lon0, lat0, xy en metros respecto de lon0/lat0).
+    """
+    df = campana.validas(cams=(cam,))
+    df = df[df["alt"].notna() & df.index.isin(catalogo["frame"].unique())]
+    catalogo = catalogo[catalogo["frame"].isin(df.index)].reset_index(drop=True)
+    if df.empty:
+        return catalogo.assign(lon=np.nan, lat=np.nan), np.nan, np.nan, np.empty((0, 2))
+
+    # Tamaño nativo del frame (todas las imágenes de una cámara son iguales)
+    alto, ancho = niveles(df[f"{cam}_path"].iloc[0])[0]
+
+    actitud = [df[c].fillna(0.0).to_numpy() for c in ("yaw", "pitch", "roll")]
+    esq = footprint.esquinas(df["lat"].to_numpy(), df["lon"].to_numpy(),
+                             df["alt"].to_numpy() - alt_suelo, *actitud)
+    lon0, lat0 = float(df["lon"].mean()), float(df["lat"].mean())
+    ex, ey = a_metros(esq[..., 0], esq[..., 1], lon0, lat0)
+
+    # Homografía píxel -> metros de cada frame (esquinas de la imagen en
+    # el orden de `footprint.esquinas`)
+    pixeles = [(0, 0), (ancho, 0), (ancho, alto), (0, alto)]
+    H = np.stack([homografia(pixeles, np.c_[x, y]) for x, y in zip(ex, ey)])
+    pos = pd.Series(np.arange(len(df)), index=df.index)[catalogo["frame"]].to_numpy()
+
+    # Centro del píxel: la coordenada continua es x + 0.5
+    uv1 = np.c_[catalogo["x"] + 0.5, catalogo["y"] + 0.5, np.ones(len(catalogo))]
+    p = np.einsum("nij,nj->ni", H[pos], uv1)
+    xy = p[:, :2] / p[:, 2:]
+    lat = lat0 + np.degrees(xy[:, 1] / footprint.EARTH_R)
+    lon = lon0 + np.degrees(xy[:, 0] / (footprint.EARTH_R * np.cos(np.radians(lat0))))
+    return catalogo.assign(lon=lon, lat=lat), lon0, lat0, xy
+
+def _separar(xy, frames, tol_m):
+    """
+    Grupos de una componente que tiene varias detecciones de un mismo frame.
+
+    Los frames se recorren en orden y cada detección se asigna al grupo de
+    centroide más cercano a < `tol_m` (de la más cercana a la más lejana),
+    con a lo más una detección por frame y grupo; las que sobran abren un
+    grupo nuevo. Devuelve etiquetas 0..k-1.
+    """
+    etiquetas = np.empty(len(xy), int)
+    sumas = np.empty((0, 3))            # (suma x, suma y, n) por grupo
+    orden = np.argsort(frames, kind="stable")
+    cortes = np.flatnonzero(np.diff(frames[orden])) + 1
+    for idx in np.split(orden, cortes):
+        libres = np.ones(len(idx), bool)
+        if len(sumas):
+            c = sumas[:, :2] / sumas[:, 2:]
+            d = np.hypot(xy[idx, 0, None] - c[:, 0], xy[idx, 1, None] - c[:, 1])
+            cand = np.argwhere(d < tol_m)
+            tomados = set()
+            for i, g in cand[np.argsort(d[cand[:, 0], cand[:, 1]], kind="stable")]:
+                if libres[i] and g not in tomados:
+                    libres[i] = False
+                    tomados.add(g)
+                    etiquetas[idx[i]] = g
+        nuevos = idx[libres]
+        etiquetas[nuevos] = len(sumas) + np.arange(len(nuevos))
+        sumas = np.vstack([sumas, np.zeros((len(nuevos), 3))])
+        np.add.at(sumas, etiquetas[idx], np.c_[xy[idx], np.ones(len(idx))])
+    return etiquetas
+
+def agrupar(xy, frames, tol_m=5.0):
+    """
+    Etiqueta de grupo por detección (0..k-1): componentes conexas de pares a
+    < `tol_m`; las componentes con dos detecciones de un mismo frame (cadenas
+    de fuentes vecinas) se separan con `_separar`.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    n = len(xy)
+    if n == 0:
+        return np.empty(0, int)
+    xy = np.asarray(xy, float)
+    pares = cKDTree(xy).query_pairs(tol_m, output_type="ndarray")
+    frames = np.asarray(frames)
+    pares = pares[frames[pares[:, 0]] != frames[pares[:, 1]]]
+    grafo = coo_matrix((np.ones(len(pares), bool), (pares[:, 0], pares[:, 1])), shape=(n, n))
+    comp = connected_components(grafo, directed=False)[1]
+
+    repetidos = pd.DataFrame({"c": comp, "f": frames}).duplicated(keep=False).to_numpy()
+    etiquetas, siguiente = comp.copy(), comp.max() + 1
+    for c, idx in pd.Series(np.arange(n)).groupby(comp).indices.items():
+        if not repetidos[idx].any():
+            continue
+        sub = _separar(xy[idx], frames[idx], tol_m)
+        etiquetas[idx] = np.where(sub == 0, c, siguiente + sub - 1)
+        siguiente += sub.max()
+    return np.unique(etiquetas, return_inverse=True)[1]
+
+def fusionar(catalogo, campana, cam="cam1", tol_m=5.0, alt_suelo=0.0, salida=None):
+    """
+    Una fila por fuente física a partir del catálogo por frame.
+
+    Columnas: `lon`, `lat` (ponderadas por flujo), `dispersion_m` (RMS de las
+    detecciones respecto de esa posición), `n_obs`, `n_frames`, `primer_frame`,
+    `ultimo_frame`, `flujo_norm` (mediana), `flujo_norm_std`, `pico`
+    (máximo), `area` (mediana), `snr` (máximo) y `saturada` (alguna vez).
+    Se escribe en `<campaña>/fuentes/fuentes_<cam>_unicas.csv` o en `salida`.
+    """
+    salida = salida or os.path.join(campana.carpeta, "fuentes", f"fuentes_{cam}_unicas.csv")
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    det, lon0, lat0, xy = a_suelo(catalogo, campana, cam, alt_suelo)
+    det["fuente"] = agrupar(xy, det["frame"].to_numpy(), tol_m)
+    det["x_m"], det["y_m"] = xy[:, 0], xy[:, 1]
+
+    # Pesos positivos para el promedio de posición
+    w = det["flujo_norm"].clip(lower=1e-9)
+    det["wx"], det["wy"] = w * det["x_m"], w * det["y_m"]
+    det["w"] = w
+    g = det.groupby("fuente")
+    res = g.agg(n_obs=("frame", "size"), n_frames=("frame", "nunique"),
+                primer_frame=("frame", "min"), ultimo_frame=("frame", "max"),
+                flujo_norm=("flujo_norm", "median"), flujo_norm_std=("flujo_norm", "std"),
+                pico=("pico", "max"), area=("area", "median"), snr=("snr", "max"),
+                saturada=("saturada", "any"), wx=("wx", "sum"), wy=("wy", "sum"), w=("w", "sum"))
+    res["x_m"], res["y_m"] = res["wx"] / res["w"], res["wy"] / res["w"]
+
+    # Dispersión: RMS de la distancia de cada detección a la posición del grupo
+    dx = det["x_m"].to_numpy() - res["x_m"].to_numpy()[det["fuente"]]
+    dy = det["y_m"].to_numpy() - res["y_m"].to_numpy()[det["fuente"]]
+    res["dispersion_m"] = np.sqrt(pd.Series(dx**2 + dy**2).groupby(det["fuente"]).mean())
+
+    res["lat"] = lat0 + np.degrees(res["y_m"] / footprint.EARTH_R)
+    res["lon"] = lon0 + np.degrees(res["x_m"] / (footprint.EARTH_R * np.cos(np.radians(lat0))))
+    res = res.drop(columns=["wx", "wy", "w", "x_m", "y_m"])
+    res = res[["lon", "lat", "dispersion_m", "n_obs", "n_frames", "primer_frame", "ultimo_frame",
+               "flujo_norm", "flujo_norm_std", "pico", "area", "snr", "saturada"]]
+    # Numerar las fuentes de la más brillante a la más débil, también en las detecciones
+    res = res.sort_values("flujo_norm", ascending=False)
+    nuevo = np.empty(len(res), int)
+    nuevo[res.index.to_numpy()] = np.arange(len(res))
+    det["fuente"] = nuevo[det["fuente"].to_numpy()]
+    res = res.reset_index(drop=True)
+    res.index.name = "fuente"
+
+    res.to_csv(salida)
+    det.drop(columns=["wx", "wy", "w"]).to_csv(os.path.splitext(salida)[0] + "_detecciones.csv",
+                                               index=False)
+    print(f"🔗 {len(det)} detecciones → {len(res)} fuentes únicas "
+          f"(tolerancia {tol_m} m) → {salida}")
+    return res
@@ -0,0 +1,111 @@
+"""
+Huella en el suelo de cada frame, considerando la actitud del vehículo.
+
+La cámara apunta al nadir con el lado largo (FOV horizontal) hacia la
+derecha del vehículo y el lado corto hacia adelante, como en `ground_rect`
+de los receptores. Cada esquina de la imagen es un rayo en el marco del
+cuerpo (x adelante, y derecha, z abajo) que se rota a NED con yaw, pitch y
+roll (ZYX) y se intersecta con el plano del suelo a la altura AGL. Todo se
+calcula con arreglos NumPy para todos los frames a la vez.
+"""
+
+import numpy as np
+
+EARTH_R = 6378137.0
+FOV_H_DEG, FOV_V_DEG = 35.5, 20.4
+
+def _rotacion(yaw, pitch, roll):
+    """Matrices cuerpo -> NED (n, 3, 3) para ángulos en radianes (ZYX)."""
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cr, sr = np.cos(roll), np.sin(roll)
+    R = np.empty(yaw.shape + (3, 3))
+    R[..., 0, 0] = cy * cp
+    R[..., 0, 1] = cy * sp * sr - sy * cr
+    R[..., 0, 2] = cy * sp * cr + sy * sr
+    R[..., 1, 0] = sy * cp
+    R[..., 1, 1] = sy * sp * sr + cy * cr
+    R[..., 1, 2] = sy * sp * cr - cy * sr
+    R[..., 2, 0] = -sp
+    R[..., 2, 1] = cp * sr
+    R[..., 2, 2] = cp * cr
+    return R
+
+def esquinas(lat, lon, alt_agl, yaw=0.0, pitch=0.0, roll=0.0,
+             fov_h=FOV_H_DEG, fov_v=FOV_V_DEG, alt_min=None, max_oblicuo=75.0):
+    """
+    Esquinas de la huella de cada frame.
+
+    Ángulos en grados, altura AGL en metros; todos los argumentos aceptan
+    escalares o arreglos (se hace broadcast). `alt_min` fuerza una altura
+    mínima (los receptores usan 50 m). Los rayos a más de `max_oblicuo`
+    grados del nadir (o sobre el horizonte) se recortan a ese ángulo para
+    que la huella no se vaya al infinito.
+
+    Devuelve un arreglo (n, 4, 2) de (lon, lat) en grados, en el orden
+    adelante-izquierda, adelante-derecha, atrás-derecha, atrás-izquierda.
+    """
+    lat, lon, alt, yaw, pitch, roll = np.broadcast_arrays(*(
+        np.atleast_1d(np.asarray(v, dtype=float)) for v in (lat, lon, alt_agl, yaw, pitch, roll)))
+    if alt_min is not None:
+        alt = np.maximum(alt, alt_min)
+
+    # Rayos de las esquinas en el marco del cuerpo
+    tx = np.tan(np.radians(fov_v) / 2)       # adelante
+    ty = np.tan(np.radians(fov_h) / 2)       # derecha
+    rayos = np.array([[tx, -ty, 1.0], [tx, ty, 1.0], [-tx, ty, 1.0], [-tx, -ty, 1.0]])
+
+    R = _rotacion(*(np.radians(a) for a in (yaw, pitch, roll)))
+    d = np.einsum("nij,kj->nki", R, rayos)    # (n, 4, 3) en NED
+
+    # Recortar la oblicuidad: d_z >= |d_horizontal| * cot(max_oblicuo)
+    horiz = np.hypot(d[..., 0], d[..., 1])
+    dz_min = horiz / np.tan(np.radians(max_oblicuo))
+    dz = np.maximum(d[..., 2], dz_min)
+    t = alt[:, None] / dz
+    norte, este = t * d[..., 0], t * d[..., 1]
+
+    dlat = np.degrees(norte / EARTH_R)
+    dlon = np.degrees(este / (EARTH_R * np.cos(np.radians(lat))[:, None]))
+    return np.stack([lon[:, None] + dlon, lat[:, None] + dlat], axis=-1)
+
+def area_m2(esq, lat):
+    """Área (m²) de cada cuadrilátero, en un plano tangente local."""
+    lat = np.asarray(lat, dtype=float).reshape(-1, 1)
+    x = np.radians(esq[..., 0]) * EARTH_R * np.cos(np.radians(lat))
+    y = np.radians(esq[..., 1]) * EARTH_R
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+
+def huellas(lat, lon, alt_agl, yaw=0.0, pitch=0.0, roll=0.0, crs="EPSG:4326", **kwargs):
+    """
+    GeoDataFrame con un polígono por frame (ver `esquinas` para los argumentos).
+
+    Incluye las columnas `lat`, `lon` (posición del vehículo) y `area_m2`.
+    """
+    import geopandas as gpd
+    import shapely
+
+    esq = esquinas(lat, lon, alt_agl, yaw, pitch, roll, **kwargs)
+    anillos = np.concatenate([esq, esq[:, :1]], axis=1)
+    lat_b = np.broadcast_to(np.atleast_1d(np.asarray(lat, dtype=float)), (len(esq),))
+    lon_b = np.broadcast_to(np.atleast_1d(np.asarray(lon, dtype=float)), (len(esq),))
+    return gpd.GeoDataFrame(
+        {"lat": lat_b, "lon": lon_b, "area_m2": area_m2(esq, lat_b)},
+        geometry=shapely.polygons(anillos), crs="EPSG:4326").to_crs(crs)
+
+def huellas_campana(campana, alt_suelo=0.0, **kwargs):
+    """
+    Huellas de los frames con coordenadas válidas de una `Campana`.
+
+    La altura del log es sobre el nivel del mar: `alt_suelo` (escalar o
+    arreglo por frame) la convierte a AGL. Frames sin altura se omiten y la
+    actitud faltante se toma como 0. El índice del resultado es el del log.
+    """
+    df = campana.validas(cams=())
+    df = df[df["alt"].notna()]
+    alt = df["alt"].to_numpy() - alt_suelo
+    actitud = [df[c].fillna(0.0).to_numpy() for c in ("yaw", "pitch", "roll")]
+    gdf = huellas(df["lat"].to_numpy(), df["lon"].to_numpy(), alt, *actitud, **kwargs)
+    gdf.index = df.index
+    gdf["cam1_img"] = df["cam1_img"].to_numpy()
+    return gdf
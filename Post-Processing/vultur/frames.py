@@ -0,0 +1,121 @@
+"""
+Lectura de frames TIFF de 12 bits.
+
+Los TIFF de captura pueden traer niveles reducidos (1/2, 1/4, ...) como
+SubIFDs. `leer_para_pantalla` usa el nivel más chico que alcanza para el
+tamaño pedido y, si el archivo no los tiene, reduce el nivel completo con
+promedio por bloques en enteros.
+
+`FrameDiferido` es la versión perezosa para los inspectores: mapea el TIFF
+en memoria como uint16 y convierte (calibración y normalización a [0, 1])
+solo los recortes que se piden, así abrir un frame no lo recorre entero.
+"""
+
+import numpy as np
+import tifffile
+
+from vultur.pyramid import MIN_LADO, Piramide
+
+def niveles(path):
+    """Formas (alto, ancho) de los niveles del TIFF, del completo al más chico."""
+    with tifffile.TiffFile(path) as tf:
+        return [lvl.shape for lvl in tf.series[0].levels]
+
+def promedio_bloques(img, f):
+    """Promedio por bloques f x f de una imagen entera, sin pasar a float."""
+    if f <= 1:
+        return np.asarray(img)
+    h, w = img.shape[0] // f, img.shape[1] // f
+    bloques = np.asarray(img[:h*f, :w*f], dtype=np.uint32).reshape(h, f, w, f)
+    return (bloques.sum(axis=(1, 3)) // (f * f)).astype(img.dtype)
+
+def leer_nivel(path, nivel=0):
+    """Lee un nivel del TIFF; el nivel 0 se mapea en memoria si no está comprimido."""
+    if nivel == 0:
+        try:
+            return tifffile.memmap(path, mode="r")
+        except ValueError:              # comprimido o no contiguo
+            return tifffile.imread(path)
+    with tifffile.TiffFile(path) as tf:
+        return tf.series[0].levels[nivel].asarray()
+
+def leer_para_pantalla(path, max_lado):
+    """
+    Imagen con el lado mayor lo más cerca posible de `max_lado` sin bajar de él.
+
+    Elige el overview más chico cuyo lado mayor es >= `max_lado` y, si
+    todavía sobra, lo reduce por bloques. Devuelve (imagen, factor), con
+    `factor` = píxeles nativos por píxel devuelto.
+    """
+    formas = niveles(path)
+    nivel = max(i for i, (h, w) in enumerate(formas) if i == 0 or max(h, w) >= max_lado)
+    img = leer_nivel(path, nivel)
+    f_nivel = formas[0][1] / formas[nivel][1]
+    f = max(1, max(img.shape[:2]) // max_lado)
+    return promedio_bloques(img, f), f_nivel * f
+
+class FrameDiferido:
+    """
+    Frame normalizado a [0, 1] en float32 que se lee y convierte por recortes.
+
+    `frame[y0:y1, x0:x1]` lee del memmap solo ese recorte, le aplica el
+    `corrector` (un `calibration.Corrector`, opcional) y lo escala: los
+    enteros se dividen por 4095 (12 bits). `nivel` elige un overview del
+    TIFF; `paso` > 1 diezma el nivel (vista de un píxel cada `paso`, para
+    archivos sin overviews). Tiene `shape` y `__array__`, así sirve donde
+    se espera un arreglo.
+    """
+    def __init__(self, path, corrector=None, nivel=0, paso=1):
+        self.path, self.corrector, self.nivel, self.paso = path, corrector, nivel, paso
+        self.crudo = leer_nivel(path, nivel)
+        h, w = self.crudo.shape[:2]
+        self.shape = (-(-h // paso), -(-w // paso))
+        self.dtype = np.dtype(np.float32)
+        self.divisor = 4095.0 if self.crudo.dtype.kind in "ui" else 1.0
+
+    def __repr__(self):
+        return f"<FrameDiferido {self.path} nivel {self.nivel} paso {self.paso} {self.shape}>"
+
+    def _region(self, clave):
+        """Cortes de `clave` (en este nivel diezmado) como cortes del nivel leído."""
+        if not isinstance(clave, tuple):
+            clave = (clave,)
+        clave = clave + (slice(None),) * (2 - len(clave))
+        region = []
+        for c, n in zip(clave, self.shape):
+            if not isinstance(c, slice):
+                raise TypeError("FrameDiferido solo se indexa con cortes")
+            i0, i1, p = c.indices(n)
+            region.append(slice(i0 * self.paso, i1 * self.paso, p * self.paso))
+        return tuple(region)
+
+    def __getitem__(self, clave):
+        region = self._region(clave)
+        crudo = np.asarray(self.crudo[region])
+        if self.corrector:
+            out = self.corrector.aplicar(crudo, region=region, forma=self.crudo.shape[:2])
+        else:
+            out = crudo.astype(np.float32)
+        if self.divisor != 1.0:
+            out /= np.float32(self.divisor)
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        a = self[:, :]
+        return a if dtype is None else a.astype(dtype, copy=False)
+
+    def piramide(self, min_lado=MIN_LADO):
+        """
+        `Piramide` con este frame de base: los overviews del TIFF si los
+        tiene y si no, diezmados por 2, 4, ... hasta bajar de `min_lado`.
+        """
+        formas = niveles(self.path)
+        if len(formas) > 1:
+            superiores = [FrameDiferido(self.path, self.corrector, nivel=k)
+                          for k in range(1, len(formas))]
+        else:
+            superiores, paso = [], 2
+            while max(self.shape) / (paso // 2) > min_lado:
+                superiores.append(FrameDiferido(self.path, self.corrector, paso=paso))
+                paso *= 2
+        return Piramide(self, [self] + superiores)
@@ -0,0 +1,179 @@
+"""
+Imagen integral (summed-area table) para estadísticas de ventanas.
+
+Se construye una vez por frame: con las tablas acumuladas de la imagen y de
+su cuadrado, la suma, la media y la varianza de cualquier rectángulo salen
+de cuatro lecturas, sin importar su tamaño. Las tablas son float64 (exactas
+para sumas de frames de 12 bits) con una fila y una columna de ceros al
+principio, así un rectángulo [y0, y1) x [x0, x1) es
+
+    S[y1, x1] - S[y0, x1] - S[y1, x0] + S[y0, x0]
+
+Todas las consultas aceptan escalares o arreglos de rectángulos, para
+responder de una vez una grilla completa de ventanas (`rejilla`).
+
+Para inspeccionar un frame completo, `IntegralTeselas` arma esas tablas
+solo para las teselas que tocan las ventanas consultadas y guarda pocas a
+la vez, así la memoria depende de lo que se mira y no del tamaño del frame.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+class Integral:
+    """
+    Tablas acumuladas de una imagen 2D (NaN se cuentan como 0 y fuera de `n`).
+
+    `img` puede ser un memmap o un `frames.FrameDiferido`: se lee por franjas
+    de `filas`, sin materializar el frame entero en float.
+    """
+    def __init__(self, img, cuadrados=True, filas=512):
+        h, w = img.shape[:2]
+        self.forma = (h, w)
+        self.s = np.zeros((h + 1, w + 1), np.float64)
+        self.s2 = np.zeros_like(self.s) if cuadrados else None
+        self.n = None
+        for r0 in range(0, h, filas):
+            a = np.asarray(img[r0:r0 + filas], dtype=np.float64)
+            validos = ~np.isnan(a)
+            if not validos.all():
+                a = np.where(validos, a, 0.0)
+                if self.n is None:
+                    # Las franjas anteriores no tenían NaN: cuenta = alto x ancho
+                    self.n = np.zeros_like(self.s)
+                    self.n[:r0 + 1] = np.arange(r0 + 1)[:, None] * np.arange(w + 1)
+            self._acumular(self.s, a, r0)
+            if self.s2 is not None:
+                self._acumular(self.s2, a * a, r0)
+            if self.n is not None:
+                self._acumular(self.n, validos.astype(np.float64), r0)
+        self.con_nan = self.n is not None
+
+    @staticmethod
+    def _acumular(t, a, r0):
+        """Suma la franja `a` (filas desde r0) a la tabla `t`, ya acumulada hasta r0."""
+        bloque = t[r0 + 1:r0 + 1 + len(a), 1:]
+        np.cumsum(a, axis=1, out=bloque)
+        np.cumsum(bloque, axis=0, out=bloque)
+        bloque += t[r0, 1:]
+
+    @staticmethod
+    def _rect(t, y0, y1, x0, x1):
+        return t[y1, x1] - t[y0, x1] - t[y1, x0] + t[y0, x0]
+
+    def recortar(self, y0, y1, x0, x1):
+        """Limita los rectángulos a la imagen (enteros, semiabiertos)."""
+        h, w = self.forma
+        return (np.clip(y0, 0, h).astype(int), np.clip(y1, 0, h).astype(int),
+                np.clip(x0, 0, w).astype(int), np.clip(x1, 0, w).astype(int))
+
+    def cuenta(self, y0, y1, x0, x1):
+        """Píxeles válidos de cada rectángulo."""
+        if self.n is not None:
+            return self._rect(self.n, y0, y1, x0, x1)
+        return (np.asarray(y1) - y0) * (np.asarray(x1) - x0) * 1.0
+
+    def suma(self, y0, y1, x0, x1):
+        return self._rect(self.s, y0, y1, x0, x1)
+
+    def media(self, y0, y1, x0, x1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.suma(y0, y1, x0, x1) / self.cuenta(y0, y1, x0, x1)
+
+    def varianza(self, y0, y1, x0, x1):
+        """Varianza poblacional de cada rectángulo (necesita `cuadrados=True`)."""
+        n = self.cuenta(y0, y1, x0, x1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = self.suma(y0, y1, x0, x1) / n
+            return np.maximum(self._rect(self.s2, y0, y1, x0, x1) / n - m * m, 0.0)
+
+    def ventana(self, x, y, lado):
+        """
+        Estadísticas de la ventana `lado` x `lado` centrada en (x, y), recortada
+        a la imagen. Devuelve (media, desviación, n, (x0, y0, x1, y1)).
+        """
+        mitad = lado // 2
+        y0, y1, x0, x1 = self.recortar(int(y) - mitad, int(y) - mitad + lado,
+                                       int(x) - mitad, int(x) - mitad + lado)
+        m = float(self.media(y0, y1, x0, x1))
+        d = float(np.sqrt(self.varianza(y0, y1, x0, x1))) if self.s2 is not None else np.nan
+        return m, d, int(self.cuenta(y0, y1, x0, x1)), (int(x0), int(y0), int(x1), int(y1))
+
+    def rejilla(self, lado, paso=None):
+        """
+        Media, varianza y cuenta de ventanas `lado` x `lado` cada `paso` píxeles
+        (por defecto sin solape). Las ventanas que no caben enteras se omiten.
+        """
+        paso = paso or lado
+        h, w = self.forma
+        y0 = np.arange(0, h - lado + 1, paso)[:, None]
+        x0 = np.arange(0, w - lado + 1, paso)[None, :]
+        y1, x1 = y0 + lado, x0 + lado
+        var = self.varianza(y0, y1, x0, x1) if self.s2 is not None else None
+        return self.media(y0, y1, x0, x1), var, self.cuenta(y0, y1, x0, x1)
+
+class IntegralTeselas:
+    """
+    Estadísticas de ventanas sobre `img` con imágenes integrales por teselas
+    de `lado` x `lado`, armadas al primer uso.
+
+    Se guardan a lo más `max_teselas` tablas (LRU); de las teselas que una
+    ventana cubre enteras basta con sus totales, que ocupan tres números.
+    Una ventana cuesta O(teselas que toca) y nunca se lee el frame entero.
+    """
+    def __init__(self, img, cuadrados=True, lado=256, max_teselas=64):
+        self.img, self.cuadrados = img, cuadrados
+        self.lado, self.max_teselas = lado, max_teselas
+        self.forma = tuple(img.shape[:2])
+        self._tablas = OrderedDict()    # (ty, tx) -> Integral
+        self._totales = {}              # (ty, tx) -> (suma, suma de cuadrados, cuenta)
+
+    def _tabla(self, ty, tx):
+        clave = (ty, tx)
+        if clave in self._tablas:
+            self._tablas.move_to_end(clave)
+            return self._tablas[clave]
+        t = self.lado
+        tabla = Integral(self.img[ty*t:(ty+1)*t, tx*t:(tx+1)*t], self.cuadrados)
+        self._tablas[clave] = tabla
+        if len(self._tablas) > self.max_teselas:
+            self._tablas.popitem(last=False)
+        return tabla
+
+    @staticmethod
+    def _sumas(tabla, y0, y1, x0, x1):
+        s2 = tabla._rect(tabla.s2, y0, y1, x0, x1) if tabla.s2 is not None else 0.0
+        return tabla.suma(y0, y1, x0, x1), s2, tabla.cuenta(y0, y1, x0, x1)
+
+    def sumas(self, y0, y1, x0, x1):
+        """(suma, suma de cuadrados, cuenta) del rectángulo [y0, y1) x [x0, x1)."""
+        t = self.lado
+        total = np.zeros(3)
+        if y1 <= y0 or x1 <= x0:
+            return total
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                a0, a1 = max(y0, ty*t) - ty*t, min(y1, (ty+1)*t) - ty*t
+                b0, b1 = max(x0, tx*t) - tx*t, min(x1, (tx+1)*t) - tx*t
+                th = min(t, self.forma[0] - ty*t)
+                tw = min(t, self.forma[1] - tx*t)
+                if (a0, a1, b0, b1) == (0, th, 0, tw):
+                    if (ty, tx) not in self._totales:
+                        self._totales[ty, tx] = self._sumas(self._tabla(ty, tx), 0, th, 0, tw)
+                    total += self._totales[ty, tx]
+                else:
+                    total += self._sumas(self._tabla(ty, tx), a0, a1, b0, b1)
+        return total
+
+    def ventana(self, x, y, lado):
+        """Como `Integral.ventana`: (media, desviación, n, (x0, y0, x1, y1))."""
+        mitad = lado // 2
+        h, w = self.forma
+        y0, y1 = (int(np.clip(v, 0, h)) for v in (int(y) - mitad, int(y) - mitad + lado))
+        x0, x1 = (int(np.clip(v, 0, w)) for v in (int(x) - mitad, int(x) - mitad + lado))
+        s, s2, n = self.sumas(y0, y1, x0, x1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = s / n
+            d = np.sqrt(max(s2 / n - m * m, 0.0)) if self.cuadrados else np.nan
+        return float(m), float(d), int(n), (x0, y0, x1, y1)
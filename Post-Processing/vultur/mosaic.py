@@ -0,0 +1,242 @@
+"""
+Ortomosaico de radiancia nocturna por teselas.
+
+Cada frame se proyecta sobre una grilla fija en el suelo (plano tangente
+local en metros, centrado en la campaña) con la homografía que lleva su
+huella (`vultur.footprint`) a los píxeles de la imagen. Los frames se
+proyectan en un pool de procesos, leyendo solo el overview necesario para
+la resolución de la grilla (`vultur.frames`), y el proceso principal los
+acumula por teselas. Una tesela vive en memoria solo mientras le quedan
+frames por recibir; al completarse se escribe en el raster de salida
+(memmap float32) y se libera, así la memoria queda acotada por las teselas
+activas a lo largo de la trayectoria y no por el tamaño del mosaico.
+
+Mezclas: "mean" (promedio), "max" y "nadir" (el píxel del frame cuyo nadir
+está más cerca). Los valores son DN / s normalizados por la ganancia,
+comparables entre campañas con distinta exposición. Si hay maestros de
+calibración (`vultur.calibration`) para la campaña se restan dark y flat
+al nivel del overview leído.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from vultur import calibration, footprint
+from vultur.frames import leer_para_pantalla
+
+MEZCLAS = ("mean", "max", "nadir")
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# --- Geometría ---
+def a_metros(lon, lat, lon0, lat0):
+    """(lon, lat) -> (x este, y norte) en metros en el plano tangente de (lon0, lat0)."""
+    x = np.radians(np.asarray(lon) - lon0) * footprint.EARTH_R * np.cos(np.radians(lat0))
+    y = np.radians(np.asarray(lat) - lat0) * footprint.EARTH_R
+    return x, y
+
+def homografia(src, dst):
+    """Homografía 3x3 que lleva 4 puntos `src` (x, y) a `dst` (u, v)."""
+    A, b = [], []
+    for (x, y), (u, v) in zip(src, dst):
+        A.append([x, y, 1, 0, 0, 0, -u * x, -u * y]); b.append(u)
+        A.append([0, 0, 0, x, y, 1, -v * x, -v * y]); b.append(v)
+    return np.append(np.linalg.solve(np.array(A, float), np.array(b, float)), 1.0).reshape(3, 3)
+
+# --- Trabajo de un proceso ---
+def proyectar_frame(path, esq_xy, nadir_xy, ventana, grilla, escala, con_distancia,
+                    corrector=None):
+    """
+    Proyecta un frame sobre su ventana de la grilla.
+
+    `esq_xy` son las 4 esquinas de la huella en metros (adelante-izquierda,
+    adelante-derecha, atrás-derecha, atrás-izquierda = esquinas de la imagen
+    en sentido horario desde arriba a la izquierda). `ventana` = (r0, r1, c0,
+    c1) y `grilla` = (x0, y1, res). Devuelve (valores, distancia al nadir o
+    None), con NaN fuera de la huella.
+    """
+    r0, r1, c0, c1 = ventana
+    x0, y1, res = grilla
+    lado_m = max(np.hypot(*(esq_xy[1] - esq_xy[0])), np.hypot(*(esq_xy[2] - esq_xy[1])))
+    img, _ = leer_para_pantalla(path, max(64, int(2 * lado_m / res)))
+    if corrector is not None:
+        img = corrector.aplicar(img)
+    alto, ancho = img.shape
+
+    # Centrar las coordenadas en la huella mejora el condicionamiento
+    centro = esq_xy.mean(axis=0)
+    H = homografia(esq_xy - centro, [(0, 0), (ancho, 0), (ancho, alto), (0, alto)])
+
+    cc, rr = np.meshgrid(np.arange(c0, c1), np.arange(r0, r1))
+    x = x0 + (cc + 0.5) * res - centro[0]
+    y = y1 - (rr + 0.5) * res - centro[1]
+    w = H[2, 0] * x + H[2, 1] * y + H[2, 2]
+    u = (H[0, 0] * x + H[0, 1] * y + H[0, 2]) / w
+    v = (H[1, 0] * x + H[1, 1] * y + H[1, 2]) / w
+    dentro = (u >= 0) & (u < ancho) & (v >= 0) & (v < alto)
+
+    valores = np.full(x.shape, np.nan, np.float32)
+    valores[dentro] = img[v[dentro].astype(np.intp), u[dentro].astype(np.intp)] * np.float32(escala)
+    distancia = None
+    if con_distancia:
+        distancia = np.hypot(x + centro[0] - nadir_xy[0], y + centro[1] - nadir_xy[1]).astype(np.float32)
+    return valores, distancia
+
+# --- Acumulación por teselas ---
+class _Tesela:
+    """Acumuladores de una tesela mientras le quedan frames por recibir."""
+    def __init__(self, forma, mezcla):
+        self.mezcla = mezcla
+        if mezcla == "mean":
+            self.suma = np.zeros(forma, np.float64)
+            self.n = np.zeros(forma, np.uint32)
+        else:
+            self.valor = np.full(forma, np.nan, np.float32)
+            if mezcla == "nadir":
+                self.dist = np.full(forma, np.inf, np.float32)
+
+    def agregar(self, sl, valores, distancia):
+        ok = ~np.isnan(valores)
+        if self.mezcla == "mean":
+            self.suma[sl][ok] += valores[ok]
+            self.n[sl][ok] += 1
+        elif self.mezcla == "max":
+            self.valor[sl] = np.fmax(self.valor[sl], valores)
+        else:
+            mejor = ok & (distancia < self.dist[sl])
+            self.valor[sl][mejor] = valores[mejor]
+            self.dist[sl][mejor] = distancia[mejor]
+
+    def resultado(self):
+        if self.mezcla == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(self.n > 0, self.suma / self.n, np.nan).astype(np.float32)
+        return self.valor
+
+def construir_mosaico(campana, salida, res_m=0.5, mezcla="mean", cam="cam1", tile=512,
+                      alt_suelo=0.0, calibrar=True, workers=WORKERS, max_en_vuelo=None):
+    """
+    Construye el ortomosaico de una `Campana` en la carpeta `salida`.
+
+    Escribe `mosaico.f32` (raster float32 fila-mayor, NaN sin dato, fila 0
+    al norte) y `mosaico.json` con la georreferencia (origen lon/lat del
+    plano tangente, esquina noroeste en metros, resolución y forma).
+    Devuelve el memmap del raster.
+    """
+    if mezcla not in MEZCLAS:
+        raise ValueError(f"mezcla debe ser una de {MEZCLAS}")
+    max_en_vuelo = max_en_vuelo or 2 * workers
+    os.makedirs(salida, exist_ok=True)
+
+    df = campana.validas(cams=(cam,))
+    df = df[df["alt"].notna()]
+    df = df[[os.path.exists(p) for p in df[f"{cam}_path"]]]
+    if df.empty:
+        raise ValueError("No hay frames con posición, altura y archivo")
+
+    # Huellas en metros y grilla que las contiene
+    actitud = [df[c].fillna(0.0).to_numpy() for c in ("yaw", "pitch", "roll")]
+    esq = footprint.esquinas(df["lat"].to_numpy(), df["lon"].to_numpy(),
+                             df["alt"].to_numpy() - alt_suelo, *actitud)
+    lon0, lat0 = float(df["lon"].mean()), float(df["lat"].mean())
+    ex, ey = a_metros(esq[..., 0], esq[..., 1], lon0, lat0)
+    esq_xy = np.stack([ex, ey], axis=-1)
+    nadir = np.stack(a_metros(df["lon"].to_numpy(), df["lat"].to_numpy(), lon0, lat0), axis=-1)
+    x0, x1, y0, y1 = ex.min(), ex.max(), ey.min(), ey.max()
+    alto, ancho = int(np.ceil((y1 - y0) / res_m)), int(np.ceil((x1 - x0) / res_m))
+
+    ventanas = np.stack([np.floor((y1 - ey.max(1)) / res_m), np.ceil((y1 - ey.min(1)) / res_m),
+                         np.floor((ex.min(1) - x0) / res_m), np.ceil((ex.max(1) - x0) / res_m)],
+                        axis=1).astype(int)
+    ventanas[:, [0, 2]] = np.maximum(ventanas[:, [0, 2]], 0)
+    ventanas[:, 1] = np.minimum(ventanas[:, 1], alto)
+    ventanas[:, 3] = np.minimum(ventanas[:, 3], ancho)
+
+    def teselas_de(v):
+        return [(tr, tc) for tr in range(v[0] // tile, (v[1] - 1) // tile + 1)
+                for tc in range(v[2] // tile, (v[3] - 1) // tile + 1)]
+
+    faltan = {}
+    for v in ventanas:
+        for t in teselas_de(v):
+            faltan[t] = faltan.get(t, 0) + 1
+
+    escala = campana.escala()
+    corrector = calibration.para_campana(campana, cam) if calibrar else None
+
+    raster = np.memmap(os.path.join(salida, "mosaico.f32"), dtype=np.float32, mode="w+",
+                       shape=(alto, ancho))
+    # Sin relleno previo: cada tesela se escribe entera (con NaN sin dato) al completarse
+    with open(os.path.join(salida, "mosaico.json"), "w") as f:
+        json.dump({"lon0": lon0, "lat0": lat0, "x0_m": float(x0), "y1_m": float(y1),
+                   "res_m": res_m, "shape": [alto, ancho], "dtype": "float32",
+                   "mezcla": mezcla, "cam": cam, "unidades": "DN/s (ganancia normalizada)",
+                   "frames": int(len(df))}, f, indent=2)
+
+    activas = {}
+    total, hechos, t0, ultimo = len(df), 0, time.time(), time.time()
+    print(f"🧩 Mosaico {alto}x{ancho} ({res_m} m/px, {len(faltan)} teselas) con {total} frames...")
+
+    def acumular(v, valores, distancia):
+        for tr, tc in teselas_de(v):
+            tr0, tc0 = tr * tile, tc * tile
+            tr1, tc1 = min(tr0 + tile, alto), min(tc0 + tile, ancho)
+            r0, r1 = max(v[0], tr0), min(v[1], tr1)
+            c0, c1 = max(v[2], tc0), min(v[3], tc1)
+            t = activas.get((tr, tc))
+            if t is None:
+                t = activas[(tr, tc)] = _Tesela((tr1 - tr0, tc1 - tc0), mezcla)
+            sub = np.s_[r0 - v[0]:r1 - v[0], c0 - v[2]:c1 - v[2]]
+            t.agregar(np.s_[r0 - tr0:r1 - tr0, c0 - tc0:c1 - tc0], valores[sub],
+                      None if distancia is None else distancia[sub])
+            faltan[(tr, tc)] -= 1
+            if not faltan[(tr, tc)]:
+                # Tesela completa: al raster y fuera de memoria
+                raster[tr0:tr1, tc0:tc1] = activas.pop((tr, tc)).resultado()
+
+    pendientes = iter(zip(df[f"{cam}_path"], esq_xy, nadir, ventanas))
+    en_vuelo = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for path, e, n, v in pendientes:
+                fut = pool.submit(proyectar_frame, path, e, n, tuple(v), (x0, y1, res_m),
+                                  escala, mezcla == "nadir", corrector)
+                en_vuelo[fut] = v
+                if len(en_vuelo) >= max_en_vuelo:
+                    break
+            if not en_vuelo:
+                break
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for fut in listos:
+                v = en_vuelo.pop(fut)
+                try:
+                    acumular(v, *fut.result())
+                except Exception as e:
+                    print(f"⚠️ Frame omitido: {e}")
+                    forma = (v[1] - v[0], v[3] - v[2])
+                    acumular(v, np.full(forma, np.nan, np.float32), np.full(forma, np.inf, np.float32))
+                hechos += 1
+            if time.time() - ultimo >= 2 or hechos == total:
+                ultimo = time.time()
+                raster.flush()
+                print(f"   {hechos}/{total} frames · {hechos / (ultimo - t0):.1f} img/s · "
+                      f"{len(activas)} teselas en memoria")
+    # Teselas de la grilla que ninguna huella toca: sin dato
+    for tr in range((alto + tile - 1) // tile):
+        for tc in range((ancho + tile - 1) // tile):
+            if (tr, tc) not in faltan:
+                raster[tr*tile:(tr+1)*tile, tc*tile:(tc+1)*tile] = np.nan
+    raster.flush()
+    print(f"✅ Mosaico listo en {time.time() - t0:.1f} s: {salida}")
+    return raster
+
+def abrir_mosaico(salida):
+    """Abre un mosaico ya construido: (memmap, georreferencia)."""
+    with open(os.path.join(salida, "mosaico.json")) as f:
+        geo = json.load(f)
+    raster = np.memmap(os.path.join(salida, "mosaico.f32"), dtype=np.float32, mode="r",
+                       shape=tuple(geo["shape"]))
+    return raster, geo
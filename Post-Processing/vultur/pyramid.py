@@ -0,0 +1,121 @@
+"""
+Pirámide de visualización para los inspectores.
+
+Un frame de 3840x2160 no cabe en pantalla: mostrarlo entero obliga a
+matplotlib a remuestrearlo en cada redibujo. `Piramide` guarda el frame y
+sus reducciones 2x2 (promedio) hasta que el lado mayor baja de `MIN_LADO`.
+`VistaPiramide` se engancha a un `Axes`: cada vez que cambian los límites
+elige el nivel más grueso que todavía tiene al menos un píxel por píxel de
+pantalla y muestra solo el recorte visible, con el `extent` en píxeles
+nativos. Así el zoom y el paneo dibujan a lo sumo un recorte del tamaño de
+la ventana, y las coordenadas del cursor siguen siendo nativas para medir.
+"""
+
+import numpy as np
+
+MIN_LADO = 512
+
+def reducir(img):
+    """Promedio 2x2 en float32 (se descarta la última fila/columna impar)."""
+    h, w = img.shape[0] // 2, img.shape[1] // 2
+    return np.asarray(img[:2*h, :2*w], np.float32).reshape(h, 2, w, 2).mean(axis=(1, 3))
+
+class Piramide:
+    """
+    Niveles de un frame: `niveles[0]` es el original y `niveles[k]` está
+    reducido 2**k veces. Los niveles pueden ser memmaps u objetos con
+    indexado por cortes y `shape` (se leen solo los recortes pedidos).
+    """
+    def __init__(self, img, niveles=None, min_lado=MIN_LADO):
+        self.niveles = [img] if niveles is None else list(niveles)
+        while niveles is None and max(self.niveles[-1].shape) > min_lado:
+            self.niveles.append(reducir(self.niveles[-1]))
+        self.forma = img.shape[:2]
+
+    def factor(self, k):
+        """Píxeles nativos por píxel del nivel k."""
+        return self.forma[1] / self.niveles[k].shape[1]
+
+    def nivel_para(self, nativos_por_pantalla):
+        """Nivel más reducido con factor <= `nativos_por_pantalla`."""
+        k = 0
+        for i in range(1, len(self.niveles)):
+            if self.factor(i) <= nativos_por_pantalla:
+                k = i
+        return k
+
+    def recorte(self, k, x0, x1, y0, y1):
+        """
+        Recorte del nivel k que cubre [x0, x1) x [y0, y1) nativos.
+        Devuelve (datos, extent nativo para `imshow`).
+        """
+        f = self.factor(k)
+        h, w = self.niveles[k].shape[:2]
+        c0, c1 = int(np.clip(np.floor(x0 / f), 0, w)), int(np.clip(np.ceil(x1 / f), 0, w))
+        r0, r1 = int(np.clip(np.floor(y0 / f), 0, h)), int(np.clip(np.ceil(y1 / f), 0, h))
+        datos = np.asarray(self.niveles[k][r0:max(r1, r0 + 1), c0:max(c1, c0 + 1)])
+        return datos, (c0 * f - 0.5, max(c1, c0 + 1) * f - 0.5,
+                       max(r1, r0 + 1) * f - 0.5, r0 * f - 0.5)
+
+class VistaPiramide:
+    """
+    Imagen de un `Axes` alimentada por una `Piramide`.
+
+    `imshow_kwargs` van a `ax.imshow` (cmap, vmin, vmax...). Sin `vmin`/`vmax`
+    se toman del nivel más grueso, para no recorrer el frame completo.
+    """
+    def __init__(self, ax, piramide, **imshow_kwargs):
+        self.ax, self.piramide = ax, piramide
+        if "vmin" not in imshow_kwargs or "vmax" not in imshow_kwargs:
+            grueso = np.asarray(piramide.niveles[-1], np.float32)
+            imshow_kwargs.setdefault("vmin", float(np.nanmin(grueso)))
+            imshow_kwargs.setdefault("vmax", float(np.nanmax(grueso)))
+        h, w = piramide.forma
+        k = len(piramide.niveles) - 1
+        datos, extent = piramide.recorte(k, 0, w, 0, h)
+        self.imagen = ax.imshow(datos, extent=extent, interpolation="nearest", **imshow_kwargs)
+        ax.set_xlim(-0.5, w - 0.5)
+        ax.set_ylim(h - 0.5, -0.5)
+        ax.set_autoscale_on(False)
+        self.clave = None
+        self._ocupado = False
+        ax.callbacks.connect("xlim_changed", self._limites)
+        ax.callbacks.connect("ylim_changed", self._limites)
+        ax.figure.canvas.mpl_connect("resize_event", lambda event: self.actualizar())
+        self.actualizar()
+
+    def _limites(self, ax):
+        if not self._ocupado:
+            self.actualizar()
+
+    @property
+    def nivel(self):
+        return self.clave[0] if self.clave else None
+
+    def actualizar(self):
+        """Elige nivel y recorte para los límites actuales y redibuja si cambiaron."""
+        h, w = self.piramide.forma
+        (x0, x1), (y1, y0) = self.ax.get_xlim(), self.ax.get_ylim()
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        self.ax.apply_aspect()     # con aspecto fijo la caja se ajusta recién al dibujar
+        ancho_px = max(1.0, self.ax.get_window_extent().width)
+        k = self.piramide.nivel_para((x1 - x0) / ancho_px)
+
+        # Margen de media ventana para que un paneo corto no pida otro recorte
+        mx, my = (x1 - x0) / 2, (y1 - y0) / 2
+        f = self.piramide.factor(k)
+        clave = (k, int((x0 - mx) // (f * 64)), int((x1 + mx) // (f * 64)),
+                 int((y0 - my) // (f * 64)), int((y1 + my) // (f * 64)))
+        if clave == self.clave:
+            return
+        self.clave = clave
+        datos, extent = self.piramide.recorte(k, max(0, x0 - mx), min(w, x1 + mx),
+                                              max(0, y0 - my), min(h, y1 + my))
+        self._ocupado = True
+        try:
+            self.imagen.set_data(datos)
+            self.imagen.set_extent(extent)     # sin autoscale no toca los límites
+        finally:
+            self._ocupado = False
+        self.ax.figure.canvas.draw_idle()
@@ -0,0 +1,314 @@
+"""
+Co-registro CAM1/CAM2 por correlación de fase.
+
+Las dos cámaras no están alineadas píxel a píxel. La transformación entre
+ellas es una similitud (traslación, rotación y escala alrededor del centro)
+que lleva un píxel de la cámara de referencia a la otra:
+
+    p_mov = escala * R(angulo) * (p_ref - c) + c + (dx, dy)
+
+Se estima con correlación de fase sobre overviews de ~1024 px (FFT de
+NumPy, pico con ajuste parabólico subpíxel). Con `rotacion=True` primero se
+recuperan ángulo y escala correlacionando los espectros de magnitud en
+coordenadas log-polares (requiere SciPy).
+
+Por campaña se guarda en `registro.json` una transformación robusta (la
+mediana de varios pares repartidos en el vuelo). Durante el procesamiento
+se verifica el residuo de vez en cuando y, si crece, se agrega un segmento
+nuevo estimado desde ese frame en adelante. `Remap` aplica la
+transformación con índices y pesos bilineales precalculados, una vez por
+forma de frame.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from vultur.frames import leer_nivel, leer_para_pantalla
+
+REGISTRO = "registro.json"
+LADO = 1024             # Lado mayor de los overviews usados para estimar
+MIN_PICO = 0.02         # Altura mínima del pico de correlación para aceptar un par
+TOL_RESIDUO_PX = 1.5    # Residuo (px nativos) sobre el que se re-estima
+
+# --- Correlación de fase ---
+def _preparar(img):
+    """Log, media cero y ventana de Hann (las luces puntuales dominan si no)."""
+    a = np.log1p(np.asarray(img, np.float32))
+    a -= a.mean()
+    return a * np.outer(np.hanning(a.shape[0]), np.hanning(a.shape[1])).astype(np.float32)
+
+def _pico_subpixel(c):
+    """Posición (fila, columna) subpíxel del máximo de una superficie periódica, y su altura."""
+    i, j = np.unravel_index(np.argmax(c), c.shape)
+    pos = []
+    for eje, k in ((0, i), (1, j)):
+        n = c.shape[eje]
+        idx = [(k - 1) % n, k, (k + 1) % n]
+        y0, y1, y2 = (c[m, j] if eje == 0 else c[i, m] for m in idx)
+        den = y0 - 2 * y1 + y2
+        d = 0.5 * (y0 - y2) / den if den < 0 else 0.0
+        p = k + float(np.clip(d, -0.5, 0.5))
+        pos.append(float(p - n if p > n / 2 else p))   # desplazamientos negativos
+    return pos[0], pos[1], float(c[i, j])
+
+def correlacion_fase(a, b, preparar=True):
+    """
+    Desplazamiento (dy, dx) tal que b(p) ≈ a(p - (dy, dx)), y la altura del pico.
+
+    La altura (0..1) mide la confianza: cerca de 0 no hay coincidencia.
+    """
+    if preparar:
+        a, b = _preparar(a), _preparar(b)
+    cruz = np.fft.rfft2(b) * np.conj(np.fft.rfft2(a))
+    cruz /= np.maximum(np.abs(cruz), 1e-12)
+    return _pico_subpixel(np.fft.irfft2(cruz, s=a.shape))
+
+def _log_polar(mag, n_ang, n_rad):
+    from scipy.ndimage import map_coordinates
+
+    h, w = mag.shape
+    r_max = min(h, w) / 2
+    ang = np.linspace(0, np.pi, n_ang, endpoint=False)
+    rad = np.exp(np.linspace(0, np.log(r_max), n_rad))
+    yy = h / 2 + rad[None, :] * np.sin(ang)[:, None]
+    xx = w / 2 + rad[None, :] * np.cos(ang)[:, None]
+    return map_coordinates(mag, [yy, xx], order=1), np.log(r_max) / (n_rad - 1)
+
+def _cuadrado(img):
+    """Recorte central cuadrado: en un espectro rectangular las frecuencias no rotan juntas."""
+    h, w = img.shape
+    n = min(h, w)
+    return img[(h - n) // 2:(h - n) // 2 + n, (w - n) // 2:(w - n) // 2 + n]
+
+def rotacion_escala(a, b):
+    """Ángulo (grados) y escala de b respecto de a, con espectros en log-polares."""
+    fa = np.fft.fftshift(np.abs(np.fft.fft2(_preparar(_cuadrado(a)))))
+    fb = np.fft.fftshift(np.abs(np.fft.fft2(_preparar(_cuadrado(b)))))
+    # Pasa-altos suave: el centro del espectro no aporta a la rotación
+    yy, xx = np.ogrid[-1:1:fa.shape[0] * 1j, -1:1:fa.shape[1] * 1j]
+    filtro = 1 - np.cos(np.pi * np.clip(np.hypot(yy, xx), 0, 1)) ** 2
+    n_ang, n_rad = 720, 2 * fa.shape[0]
+    la, paso = _log_polar(np.log1p(fa * filtro), n_ang, n_rad)
+    lb, _ = _log_polar(np.log1p(fb * filtro), n_ang, n_rad)
+    d_ang, d_rad, _ = correlacion_fase(la, lb, preparar=False)
+    # El espectro de magnitud es simétrico: el ángulo se conoce módulo 180°
+    return d_ang * 180.0 / n_ang, float(np.exp(-d_rad * paso))
+
+# --- Transformación ---
+IDENTIDAD = {"dx": 0.0, "dy": 0.0, "angulo": 0.0, "escala": 1.0}
+
+def _coordenadas(t, forma, forma_mov, yy, xx):
+    """Coordenadas (y, x) en la cámara móvil de los píxeles (yy, xx) de la de referencia."""
+    cy, cx = (forma[0] - 1) / 2, (forma[1] - 1) / 2
+    cym, cxm = (forma_mov[0] - 1) / 2, (forma_mov[1] - 1) / 2
+    a = np.radians(t["angulo"])
+    ca, sa = t["escala"] * np.cos(a), t["escala"] * np.sin(a)
+    x, y = xx - cx, yy - cy
+    return (sa * x + ca * y + cym + t["dy"]), (ca * x - sa * y + cxm + t["dx"])
+
+def _es_traslacion(t):
+    return abs(t["angulo"]) < 1e-3 and abs(t["escala"] - 1) < 1e-5
+
+class Remap:
+    """
+    Remuestreo bilineal precalculado de la cámara móvil a la grilla de referencia.
+
+    `aplicar(img)` devuelve float32 con NaN donde el píxel cae fuera del
+    frame móvil. Una traslación pura se resuelve con cortes y sin mapas.
+    """
+    def __init__(self, t, forma, forma_mov=None):
+        self.t, self.forma = dict(t), tuple(forma)
+        self.forma_mov = tuple(forma_mov or forma)
+        self.idx = None
+        if _es_traslacion(t):
+            return
+        h, w = self.forma
+        hm, wm = self.forma_mov
+        yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+        y, x = _coordenadas(self.t, self.forma, self.forma_mov, yy, xx)
+        y0, x0 = np.floor(y), np.floor(x)
+        self.valido = (y0 >= 0) & (x0 >= 0) & (y0 < hm - 1) & (x0 < wm - 1)
+        self.idx = np.where(self.valido, y0 * wm + x0, 0).astype(np.int32)
+        self.fy, self.fx = (y - y0).astype(np.float32), (x - x0).astype(np.float32)
+
+    def aplicar(self, img):
+        a = np.asarray(img)
+        if self.idx is None:
+            return self._trasladar(a)
+        wm = self.forma_mov[1]
+        plano = a.reshape(-1)
+        arriba = plano[self.idx] * (1 - self.fx) + plano[self.idx + 1] * self.fx
+        abajo = plano[self.idx + wm] * (1 - self.fx) + plano[self.idx + wm + 1] * self.fx
+        out = (arriba * (1 - self.fy) + abajo * self.fy).astype(np.float32)
+        out[~self.valido] = np.nan
+        return out
+
+    def _trasladar(self, a):
+        # Centros distintos (frames de distinto tamaño) también son una traslación
+        dy = self.t["dy"] + (self.forma_mov[0] - self.forma[0]) / 2
+        dx = self.t["dx"] + (self.forma_mov[1] - self.forma[1]) / 2
+        iy, ix = int(np.floor(dy)), int(np.floor(dx))
+        fy, fx = np.float32(dy - iy), np.float32(dx - ix)
+        h, w = self.forma
+        hm, wm = a.shape
+        y0, y1 = max(0, -iy), min(h, hm - 1 - iy)
+        x0, x1 = max(0, -ix), min(w, wm - 1 - ix)
+        out = np.full((h, w), np.nan, np.float32)
+        if y1 <= y0 or x1 <= x0:
+            return out
+        s = lambda oy, ox: a[y0+iy+oy:y1+iy+oy, x0+ix+ox:x1+ix+ox].astype(np.float32)
+        out[y0:y1, x0:x1] = ((s(0, 0) * (1 - fx) + s(0, 1) * fx) * (1 - fy) +
+                             (s(1, 0) * (1 - fx) + s(1, 1) * fx) * fy)
+        return out
+
+_remaps = {}
+
+def remap(t, forma, forma_mov=None):
+    """`Remap` cacheado por proceso para una transformación y forma de frame."""
+    clave = (tuple(sorted(t.items())), tuple(forma), tuple(forma_mov or forma))
+    if clave not in _remaps:
+        _remaps.clear()     # Uno por proceso alcanza: la transformación cambia poco
+        _remaps[clave] = Remap(t, forma, forma_mov)
+    return _remaps[clave]
+
+# --- Estimación por par ---
+def _reducidos(path_ref, path_mov, lado=LADO):
+    ref, f = leer_para_pantalla(path_ref, lado)
+    mov, f_mov = leer_para_pantalla(path_mov, lado)
+    if f != f_mov:
+        raise ValueError("Las cámaras tienen niveles de overview distintos")
+    return ref, mov, f
+
+def estimar_par(path_ref, path_mov, rotacion=False, lado=LADO):
+    """
+    Transformación de un par (px nativos) con la altura del pico en "pico".
+    """
+    ref, mov, f = _reducidos(path_ref, path_mov, lado)
+    t = dict(IDENTIDAD)
+    if rotacion:
+        t["angulo"], t["escala"] = rotacion_escala(ref, mov)
+        # Deshacer rotación y escala antes de medir la traslación
+        mov = Remap(t, ref.shape, mov.shape).aplicar(mov)
+        mov = np.nan_to_num(mov, nan=float(np.nanmedian(mov)))
+    dy, dx, pico = correlacion_fase(ref, mov)
+    t["dx"], t["dy"] = dx * f, dy * f
+    t["pico"] = pico
+    return t
+
+def residuo(path_ref, path_mov, t, lado=LADO):
+    """Desplazamiento que queda (px nativos) después de aplicar `t` al par."""
+    ref, mov, f = _reducidos(path_ref, path_mov, lado)
+    t_red = {**IDENTIDAD, **{k: t[k] for k in IDENTIDAD}}
+    t_red["dx"], t_red["dy"] = t["dx"] / f, t["dy"] / f
+    alineado = Remap(t_red, ref.shape, mov.shape).aplicar(mov)
+    alineado = np.nan_to_num(alineado, nan=float(np.nanmedian(alineado)))
+    dy, dx, _ = correlacion_fase(ref, alineado)
+    return float(np.hypot(dx, dy) * f)
+
+# --- Registro de campaña ---
+def _combinar(estimaciones):
+    """Mediana por parámetro de las estimaciones con pico suficiente."""
+    buenas = [e for e in estimaciones if e["pico"] >= MIN_PICO]
+    if not buenas:
+        return None
+    t = {k: float(np.median([e[k] for e in buenas])) for k in IDENTIDAD}
+    t["pares"] = len(buenas)
+    return t
+
+class Registro:
+    """
+    Transformaciones de una campaña por segmentos de frames.
+
+    `segmentos` es una lista ordenada de dicts con "desde" (índice del log)
+    y los parámetros de la transformación.
+    """
+    def __init__(self, carpeta, cam_ref, cam_mov, rotacion, segmentos):
+        self.carpeta, self.cam_ref, self.cam_mov = carpeta, cam_ref, cam_mov
+        self.rotacion, self.segmentos = rotacion, segmentos
+
+    def transformacion(self, idx):
+        """Parámetros vigentes para el frame `idx` del log."""
+        t = self.segmentos[0]
+        for s in self.segmentos:
+            if s["desde"] <= idx:
+                t = s
+        return {k: t[k] for k in IDENTIDAD}
+
+    def refinar(self, campana, idx, muestras=5):
+        """Re-estima con los `muestras` pares desde el frame `idx`. True si agregó un segmento."""
+        pares = _pares(campana, self.cam_ref, self.cam_mov)
+        pares = pares[pares.index >= idx][:muestras]
+        t = _combinar([estimar_par(r, m, self.rotacion)
+                       for r, m in pares.itertuples(index=False)])
+        if t is None:
+            return False
+        self.segmentos = [s for s in self.segmentos if s["desde"] < idx]
+        self.segmentos.append({"desde": int(idx), **t})
+        self.guardar()
+        print(f"🔧 Registro re-estimado desde el frame {idx}: "
+              f"dx={t['dx']:.1f} dy={t['dy']:.1f} ang={t['angulo']:.2f}° esc={t['escala']:.4f}")
+        return True
+
+    def guardar(self):
+        datos = {"cam_ref": self.cam_ref, "cam_mov": self.cam_mov,
+                 "rotacion": self.rotacion, "segmentos": self.segmentos}
+        path = os.path.join(self.carpeta, REGISTRO)
+        with open(path + ".tmp", "w") as f:
+            json.dump(datos, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+def _pares(campana, cam_ref, cam_mov):
+    df = campana.df
+    ok = [r is not None and m is not None and os.path.exists(r) and os.path.exists(m)
+          for r, m in zip(df[f"{cam_ref}_path"], df[f"{cam_mov}_path"])]
+    return df.loc[ok, [f"{cam_ref}_path", f"{cam_mov}_path"]]
+
+def _muestrear(pares, n):
+    if len(pares) <= n:
+        return list(pares.itertuples(index=False))
+    pos = np.linspace(0, len(pares) - 1, n).round().astype(int)
+    return list(pares.iloc[pos].itertuples(index=False))
+
+def registrar_campana(campana, cam_ref="cam1", cam_mov="cam2", muestras=12,
+                      rotacion=False, usar_cache=True):
+    """
+    Registro de una `Campana`, leído de `registro.json` o estimado y guardado.
+
+    La estimación usa `muestras` pares repartidos a lo largo del vuelo y
+    toma la mediana de los que tienen un pico de correlación claro. Si
+    ninguno lo tiene, se usa la identidad.
+    """
+    path = os.path.join(campana.carpeta, REGISTRO)
+    if usar_cache and os.path.exists(path):
+        with open(path) as f:
+            datos = json.load(f)
+        if (datos["cam_ref"], datos["cam_mov"]) == (cam_ref, cam_mov) and \
+                datos["rotacion"] == rotacion:
+            return Registro(campana.carpeta, cam_ref, cam_mov, rotacion, datos["segmentos"])
+
+    pares = _pares(campana, cam_ref, cam_mov)
+    estimaciones = [estimar_par(r, m, rotacion) for r, m in _muestrear(pares, muestras)]
+    t = _combinar(estimaciones)
+    if t is None:
+        print("⚠️ Ningún par con correlación suficiente; se usa la identidad.")
+        t = {**IDENTIDAD, "pares": 0}
+    else:
+        print(f"📐 Registro {cam_mov}→{cam_ref} ({t['pares']} pares): dx={t['dx']:.1f} "
+              f"dy={t['dy']:.1f} ang={t['angulo']:.2f}° esc={t['escala']:.4f}")
+    registro = Registro(campana.carpeta, cam_ref, cam_mov, rotacion,
+                        [{"desde": int(pares.index.min()) if len(pares) else 0, **t}])
+    registro.guardar()
+    return registro
+
+def alinear(path_mov, t, forma, corrector=None):
+    """
+    Frame de la cámara móvil remuestreado a la grilla de referencia (float32,
+    NaN fuera). Con un `calibration.Corrector` se corrige antes de remuestrear,
+    con los píxeles saturados en NaN.
+    """
+    img = leer_nivel(path_mov)
+    if corrector is not None:
+        img = corrector.aplicar(img, saturados_nan=True)
+    return remap(t, forma, img.shape).aplicar(img)
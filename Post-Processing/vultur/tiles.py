@@ -0,0 +1,289 @@
+"""
+Caché en disco de teselas de mapa base, para trabajar sin conexión.
+
+Las teselas se guardan como `<carpeta>/<fuente>/<z>/<x>/<y>.<ext>` (el
+esquema XYZ de OpenStreetMap, así Leaflet puede leerlas directo con una
+URL `file://`, ver `url_local`). Cada lectura actualiza la fecha de
+modificación del archivo, que hace de marca LRU: cuando la caché supera
+`max_mb` se borran las teselas menos usadas hasta bajar al 90 %.
+
+`mosaico` arma el mapa base de una vista en EPSG:3857 leyendo de la caché
+y descargando solo lo que falta (como `contextily.bounds2img`). Sin red,
+las teselas que faltan quedan en gris y el resto se dibuja igual.
+`precargar` siembra un bbox y un rango de zooms antes de salir a terreno.
+"""
+
+import io
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from vultur.footprint import EARTH_R
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), "VULTUR_teselas")
+MAX_MB = 2048
+MAX_PRECARGA = 50000        # teselas por precarga (OSM no permite descargas masivas)
+MAX_MOSAICO = 256           # teselas por mosaico; si no alcanza se baja el zoom
+LADO = 256
+ORIGEN = math.pi * EARTH_R  # medio ancho del mundo en EPSG:3857
+ESPERA_SIN_RED = 60         # s sin reintentar descargas tras un error de red
+
+# Fuente: (URL, extensión, bytes típicos por tesela para estimar una precarga)
+FUENTES = {
+    "osm": ("https://tile.openstreetmap.org/{z}/{x}/{y}.png", "png", 20_000),
+    "esri": ("https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/"
+             "{z}/{y}/{x}", "jpg", 35_000),
+}
+
+# --- Coordenadas ---
+def a_tesela(lon, lat, z):
+    """Tesela (x, y) fraccionaria que contiene lon/lat (grados) al zoom z."""
+    n = 2 ** z
+    lat = math.radians(max(-85.0511, min(85.0511, lat)))
+    return (lon + 180.0) / 360.0 * n, (1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n
+
+def merc_a_tesela(x, y, z):
+    """Tesela (x, y) fraccionaria de un punto en EPSG:3857."""
+    n = 2 ** z
+    return (x + ORIGEN) / (2 * ORIGEN) * n, (ORIGEN - y) / (2 * ORIGEN) * n
+
+def limites_tesela(tx, ty, z):
+    """(x0, x1, y0, y1) en EPSG:3857 de la tesela (tx, ty, z)."""
+    lado = 2 * ORIGEN / 2 ** z
+    return (-ORIGEN + tx * lado, -ORIGEN + (tx + 1) * lado,
+            ORIGEN - (ty + 1) * lado, ORIGEN - ty * lado)
+
+def teselas_bbox(bbox, z):
+    """Rangos de teselas que cubren `bbox` = (lon0, lat0, lon1, lat1) al zoom z."""
+    lon0, lat0, lon1, lat1 = bbox
+    x0, y0 = a_tesela(lon0, lat1, z)
+    x1, y1 = a_tesela(lon1, lat0, z)
+    n = 2 ** z - 1
+    return (range(max(0, int(x0)), min(n, int(x1)) + 1),
+            range(max(0, int(y0)), min(n, int(y1)) + 1))
+
+# --- Caché ---
+class CacheTeselas:
+    """
+    Teselas de `FUENTES` en disco con desalojo LRU. Con `offline` nunca se
+    descarga; sin eso, tras un error de red no se reintenta por
+    `ESPERA_SIN_RED` segundos, así una vista sin conexión no espera timeouts.
+    """
+    def __init__(self, carpeta=CACHE_DIR, max_mb=MAX_MB, offline=False, timeout=10):
+        self.carpeta, self.max_bytes = carpeta, int(max_mb * 2**20)
+        self.offline, self.timeout = offline, timeout
+        self._total = None              # bytes en disco; se mide al primer guardado
+        self._sin_red_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CacheTeselas {self.carpeta} max {self.max_bytes / 2**20:.0f} MB>"
+
+    def ruta(self, fuente, z, x, y):
+        return os.path.join(self.carpeta, fuente, str(z), str(x), f"{y}.{FUENTES[fuente][1]}")
+
+    def tesela(self, fuente, z, x, y):
+        """Bytes de la tesela, de la caché o descargada; None si no hay."""
+        ruta = self.ruta(fuente, z, x, y)
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            try:
+                os.utime(ruta)          # marca LRU
+            except OSError:
+                pass
+            return datos
+        except FileNotFoundError:
+            pass
+        if self.offline or time.time() < self._sin_red_hasta:
+            return None
+        url = FUENTES[fuente][0].format(z=z, x=x, y=y)
+        try:
+            req = urllib.request.Request(url, headers={"User-Agent": "VULTUR/1.0"})
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                datos = r.read()
+        except urllib.error.HTTPError:
+            return None                 # tesela inexistente en el servidor
+        except OSError:
+            self._sin_red_hasta = time.time() + ESPERA_SIN_RED
+            return None
+        self._guardar(ruta, datos)
+        return datos
+
+    def _guardar(self, ruta, datos):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, ruta)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(s for _, s, _ in self._archivos())
+            else:
+                self._total += len(datos)
+            if self._total > self.max_bytes:
+                self._desalojar()
+
+    def _archivos(self):
+        """(mtime, bytes, ruta) de cada tesela en disco."""
+        out = []
+        for base, _, nombres in os.walk(self.carpeta):
+            for n in nombres:
+                if n.endswith(".tmp"):
+                    continue
+                p = os.path.join(base, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def _desalojar(self):
+        """Borra las teselas menos usadas hasta quedar en el 90 % de `max_bytes`."""
+        archivos = sorted(self._archivos())
+        self._total = sum(s for _, s, _ in archivos)
+        borradas = 0
+        for _, s, p in archivos:
+            if self._total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            self._total -= s
+            borradas += 1
+        print(f"🧹 Caché de teselas: {borradas} teselas desalojadas "
+              f"({self._total / 2**20:.0f} MB en disco)")
+
+    def uso_mb(self):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(s for _, s, _ in self._archivos())
+            return self._total / 2**20
+
+    # --- Mapas ---
+    def mosaico(self, x0, x1, y0, y1, zoom, fuente="osm"):
+        """
+        Mapa base de la vista [x0, x1] x [y0, y1] (EPSG:3857) al zoom `zoom`.
+
+        Devuelve (imagen RGB uint8, extent (x0, x1, y0, y1) de las teselas
+        completas) para `imshow(img, extent=extent)`. Si la vista pide más de
+        `MAX_MOSAICO` teselas se baja el zoom.
+        """
+        from PIL import Image
+
+        while True:
+            tx0, ty0 = merc_a_tesela(x0, y1, zoom)
+            tx1, ty1 = merc_a_tesela(x1, y0, zoom)
+            n = 2 ** zoom - 1
+            xs = range(max(0, int(tx0)), min(n, int(tx1)) + 1)
+            ys = range(max(0, int(ty0)), min(n, int(ty1)) + 1)
+            if len(xs) * len(ys) <= MAX_MOSAICO or zoom == 0:
+                break
+            zoom -= 1
+
+        img = np.full((len(ys) * LADO, len(xs) * LADO, 3), 200, np.uint8)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futuros = {pool.submit(self.tesela, fuente, zoom, tx, ty): (i, j)
+                       for i, ty in enumerate(ys) for j, tx in enumerate(xs)}
+            for fut in as_completed(futuros):
+                i, j = futuros[fut]
+                datos = fut.result()
+                if datos is None:
+                    continue
+                try:
+                    t = np.asarray(Image.open(io.BytesIO(datos)).convert("RGB"))
+                except Exception:
+                    continue
+                img[i*LADO:(i+1)*LADO, j*LADO:(j+1)*LADO] = t[:LADO, :LADO]
+        ex0, _, _, ey1 = limites_tesela(xs[0], ys[0], zoom)
+        _, ex1, ey0, _ = limites_tesela(xs[-1], ys[-1], zoom)
+        return img, (ex0, ex1, ey0, ey1)
+
+    def _tareas(self, bbox, zooms):
+        tareas = []
+        for z in zooms:
+            xs, ys = teselas_bbox(bbox, z)
+            tareas += [(z, x, y) for x in xs for y in ys]
+        return tareas
+
+    def estimar(self, bbox, zooms, fuente="osm"):
+        """
+        (teselas, bytes) que ocupa en disco la precarga de `bbox` en `zooms`:
+        las que ya están con su tamaño real y las que faltan con el tamaño
+        medio de las presentes (o el típico de la fuente si no hay ninguna).
+        """
+        tareas = self._tareas(bbox, zooms)
+        presentes, bytes_presentes = 0, 0
+        for t in tareas:
+            try:
+                bytes_presentes += os.path.getsize(self.ruta(fuente, *t))
+                presentes += 1
+            except OSError:
+                pass
+        media = bytes_presentes / presentes if presentes else FUENTES[fuente][2]
+        return len(tareas), bytes_presentes + (len(tareas) - presentes) * media
+
+    def presentes(self, bbox, zooms, fuente="osm"):
+        """Cuántas teselas de `bbox` en `zooms` hay en la caché."""
+        return sum(os.path.exists(self.ruta(fuente, *t)) for t in self._tareas(bbox, zooms))
+
+    def precargar(self, bbox, zooms, fuente="osm", workers=4, max_teselas=MAX_PRECARGA):
+        """
+        Descarga a la caché las teselas de `bbox` = (lon0, lat0, lon1, lat1)
+        para cada zoom de `zooms`. Devuelve (nuevas, ya en caché, fallidas).
+
+        Si la precarga no cabe en el 90 % de `max_mb` (el desalojo borraría
+        teselas descargadas en la misma corrida) se rechaza antes de empezar.
+        Las que ya estaban se marcan como usadas, para que no se desalojen antes
+        que teselas ajenas.
+        """
+        tareas = self._tareas(bbox, zooms)
+        if len(tareas) > max_teselas:
+            raise ValueError(f"{len(tareas)} teselas superan el máximo de {max_teselas}: "
+                             "achica el bbox o el zoom máximo")
+        _, estimado = self.estimar(bbox, zooms, fuente)
+        if estimado > 0.9 * self.max_bytes:
+            raise ValueError(f"La precarga ocupa ~{estimado / 2**20:.0f} MB y la caché admite "
+                             f"{0.9 * self.max_bytes / 2**20:.0f} MB: achica el bbox o el zoom "
+                             "máximo, o sube max_mb")
+        faltan = []
+        for t in tareas:
+            try:
+                os.utime(self.ruta(fuente, *t))     # marca LRU
+            except OSError:
+                faltan.append(t)
+        total, nuevas, fallidas = len(faltan), 0, 0
+        print(f"🗺️ {fuente}: {len(tareas)} teselas en zoom {min(zooms)}–{max(zooms)}, "
+              f"{len(tareas) - total} ya en caché, descargando {total}...")
+        t0 = ultimo = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for fut in as_completed([pool.submit(self.tesela, fuente, *t) for t in faltan]):
+                if fut.result() is None:
+                    fallidas += 1
+                else:
+                    nuevas += 1
+                if time.time() - ultimo >= 2:
+                    ultimo = time.time()
+                    print(f"   {nuevas + fallidas}/{total} · "
+                          f"{(nuevas + fallidas) / max(ultimo - t0, 1e-9):.1f} teselas/s")
+        if fallidas:
+            print(f"⚠️ {fallidas} teselas no se pudieron descargar")
+        quedan = self.presentes(bbox, zooms, fuente)
+        if quedan < len(tareas) - fallidas:
+            print(f"⚠️ Solo {quedan} de {len(tareas) - fallidas} teselas siguen en la caché "
+                  "(desalojadas por falta de espacio)")
+        return nuevas, len(tareas) - total, fallidas
+
+    def url_local(self, fuente):
+        """Plantilla `file://` de la caché para una capa de Leaflet/folium."""
+        from pathlib import Path
+        base = Path(os.path.abspath(os.path.join(self.carpeta, fuente))).as_uri()
+        return base + "/{z}/{x}/{y}." + FUENTES[fuente][1]